@@ -1,67 +1,25 @@
 import torch
-import torch.nn.functional as F
 from torch_geometric.loader import DataLoader
 from imports.PainGraphDataset import PainGraphDataset
+from imports.trainer import Trainer, forward_multitask
+from imports.checkpoints import CheckpointManager
+from imports.precision import PRECISIONS, describe
+from imports.edge_precompute import PrecomputeEdgeNorm
 from net.multitask_braingnn import MultiTaskBrainGNN
-from sklearn.metrics import classification_report, accuracy_score
+from sklearn.metrics import classification_report
 import argparse
 import os
 
 def train_model(model, train_loader, val_loader, optimizer, device, args):
-    model.train()
-    best_val_acc = 0
-    patience_counter = 0
+    trainer = Trainer(model, optimizer, device=device, forward=forward_multitask, precision=args.precision)
+    checkpoints = CheckpointManager(args.checkpoint_dir, weights_path=args.model_path, metadata=vars(args))
+    return trainer.fit(train_loader, val_loader, epochs=args.epochs, eval_every=args.eval_every,
+                       monitor='val_acc', patience=args.patience, checkpoint=checkpoints, resume=args.resume)
 
-    for epoch in range(args.epochs):
-        total_loss = 0
-        correct_predictions = 0
-        total_samples = 0
-        model.train()
-        for data in train_loader:
-            data = data.to(device)
-            optimizer.zero_grad()
-            out, _ = model(data) # Unpack the tuple here
-            loss = F.nll_loss(out, data.y)
-            loss.backward()
-            optimizer.step()
-            
-            total_loss += loss.item() * data.num_graphs
-            pred = out.argmax(dim=1)
-            correct_predictions += pred.eq(data.y).sum().item()
-            total_samples += data.num_graphs
-
-        train_loss = total_loss / total_samples
-        train_acc = correct_predictions / total_samples
-        val_acc, _ = evaluate_model(model, val_loader, device)
-        
-        print(f'Epoch {epoch+1}/{args.epochs}, Loss: {train_loss:.4f}, Train Acc: {train_acc:.4f}, Val Acc: {val_acc:.4f}')
-
-        if val_acc > best_val_acc:
-            best_val_acc = val_acc
-            patience_counter = 0
-            torch.save(model.state_dict(), args.model_path)
-            print(f"✅ New best model saved to {args.model_path} with Val Acc: {val_acc:.4f}")
-        else:
-            patience_counter += 1
-            if patience_counter >= args.patience:
-                print(f"Early stopping triggered after {args.patience} epochs with no improvement.")
-                break
-
-def evaluate_model(model, loader, device):
-    model.eval()
-    all_preds = []
-    all_labels = []
-    with torch.no_grad():
-        for data in loader:
-            data = data.to(device)
-            out, _ = model(data) # Unpack the tuple here
-            preds = out.argmax(dim=1)
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(data.y.cpu().numpy())
-            
-    accuracy = accuracy_score(all_labels, all_preds)
-    report = classification_report(all_labels, all_preds, zero_division=0)
-    return accuracy, report
+def evaluate_model(model, loader, device, precision='fp32'):
+    metrics = Trainer(model, None, device=device, forward=forward_multitask, precision=precision).evaluate(loader)
+    report = classification_report(metrics['labels'], metrics['preds'], zero_division=0)
+    return metrics['acc'], report
 
 def main():
     parser = argparse.ArgumentParser(description="Train MultiTask BrainGNN Model")
@@ -70,13 +28,18 @@ def main():
     parser.add_argument('--batch_size', type=int, default=32, help='Batch size for training')
     parser.add_argument('--lr', type=float, default=0.001, help='Learning rate')
     parser.add_argument('--weight_decay', type=float, default=0.0005, help='Weight decay (L2 penalty)')
-    parser.add_argument('--patience', type=int, default=20, help='Patience for early stopping')
+    parser.add_argument('--patience', type=int, default=20, help='Patience for early stopping (in evaluations)')
+    parser.add_argument('--eval_every', type=int, default=1, help='Validate every N epochs')
     parser.add_argument('--data_path', type=str, default='./data/pain_data/all_graphs/', help='Path to the graph data directory')
     parser.add_argument('--model_path', type=str, default='./model/best_pain_model_113.pth', help='Path to save the best model')
+    parser.add_argument('--checkpoint_dir', type=str, default='./model/checkpoints/multitask', help='Top-k / last checkpoints for resume')
+    parser.add_argument('--resume', action='store_true', help='Resume from the last checkpoint in checkpoint_dir')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS, help='fp32, or bf16 autocast for training and evaluation')
+    parser.add_argument('--precompute_edges', action='store_true', help='Add self loops and the layer-1 edge softmax once per graph at load time')
 
     args = parser.parse_args()
     device = torch.device(args.device)
-    print(f"Using device: {device}")
+    print(f"Using device: {device}, precision: {describe(device, args.precision)}")
 
     # Ensure model directory exists
     os.makedirs(os.path.dirname(args.model_path), exist_ok=True)
@@ -89,18 +52,15 @@ def main():
 
     print(f"🔍 Loading all data from: {args.data_path} for manual filtering...")
     # Load the entire dataset without pre-filtering
-    full_dataset = PainGraphDataset(root_dir=args.data_path)
+    full_dataset = PainGraphDataset(root_dir=args.data_path,
+                                    transform=PrecomputeEdgeNorm() if args.precompute_edges else None)
     
-    # Manually filter the dataset
+    # Manually filter the dataset by shape (unreadable / non-finite samples are handled by the QC table)
     filtered_data_list = []
     for i in range(len(full_dataset)):
-        try:
-            data = full_dataset[i]
-            if data.x.shape == (N_ROI, IN_DIM):
-                filtered_data_list.append(data)
-        except Exception as e:
-            # print(f"Skipping sample {i} due to error: {e}")
-            continue # Skip corrupted or problematic files
+        data = full_dataset[i]
+        if data.x.shape == (N_ROI, IN_DIM):
+            filtered_data_list.append(data)
 
     if not filtered_data_list:
         print(f"❌ CRITICAL ERROR: No data found with shape ({N_ROI}, {IN_DIM}) after manual filtering.")
@@ -142,7 +102,7 @@ def main():
     print("\n--- Final Test Set Evaluation ---")
     print(f"Loading best model from {args.model_path} for final evaluation.")
     model.load_state_dict(torch.load(args.model_path, map_location=device))
-    test_accuracy, test_report = evaluate_model(model, test_loader, device)
+    test_accuracy, test_report = evaluate_model(model, test_loader, device, args.precision)
     
     print(f"\nTest Accuracy: {test_accuracy:.4f}")
     print("Classification Report:")
@@ -25,19 +25,18 @@ import warnings
 warnings.filterwarnings('ignore')
 
 from imports.PainGraphDataset import PainGraphDataset
+from imports.hpo import DEFAULT_STORAGE, TrialCheckpoint, load_shared_graphs, make_pruner, run_parallel_study
 from net.multitask_braingnn import MultiTaskBrainGNN
+from net.stacked_ensemble import ensemble_forward, group_members
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class AdvancedPainGraphDataset(PainGraphDataset):
-    """高级数据集类，支持完整的数据预处理和增强"""
+class GraphPreprocessor:
+    """图预处理：异常值处理、特征标准化、特征选择和边权重归一化 (不依赖文件，可直接作用于共享数据)"""
     
-    def __init__(self, root_dir, use_all_samples=True, advanced_preprocessing=True, 
-                 feature_selection=None, scaler_type='robust'):
-        super().__init__(root_dir)
-        self.use_all_samples = use_all_samples
+    def __init__(self, advanced_preprocessing=True, feature_selection=None, scaler_type='robust'):
         self.advanced_preprocessing = advanced_preprocessing
         self.feature_selection = feature_selection
         self.scaler_type = scaler_type
@@ -45,9 +44,9 @@ class AdvancedPainGraphDataset(PainGraphDataset):
         self.feature_selector = None
         
         if advanced_preprocessing:
-            self._setup_preprocessing()
+            self._setup()
     
-    def _setup_preprocessing(self):
+    def _setup(self):
         """设置预处理组件"""
         if self.scaler_type == 'robust':
             self.scaler = RobustScaler()
@@ -56,7 +55,7 @@ class AdvancedPainGraphDataset(PainGraphDataset):
         
         print(f"✅ 设置预处理：{self.scaler_type} scaler")
     
-    def _apply_advanced_preprocessing(self, data):
+    def apply(self, data):
         """应用高级预处理"""
         try:
             # 1. 异常值处理
@@ -99,7 +98,7 @@ class AdvancedPainGraphDataset(PainGraphDataset):
             logger.warning(f"预处理失败: {e}")
             return data
     
-    def fit_preprocessing(self, sample_data):
+    def fit(self, sample_data):
         """拟合预处理参数"""
         if not self.advanced_preprocessing:
             return
@@ -129,25 +128,46 @@ class AdvancedPainGraphDataset(PainGraphDataset):
             selector.fit(all_features, labels)
             self.feature_selector = selector
             print(f"✅ 拟合特征选择器，选择 {self.feature_selection} 个特征")
+
+class AdvancedPainGraphDataset(PainGraphDataset):
+    """高级数据集类，支持完整的数据预处理和增强"""
+    
+    def __init__(self, root_dir, use_all_samples=True, advanced_preprocessing=True, 
+                 feature_selection=None, scaler_type='robust'):
+        super().__init__(root_dir)
+        self.use_all_samples = use_all_samples
+        self.advanced_preprocessing = advanced_preprocessing
+        self.preprocessor = GraphPreprocessor(advanced_preprocessing, feature_selection, scaler_type)
+    
+    def fit_preprocessing(self, sample_data):
+        """拟合预处理参数"""
+        self.preprocessor.fit(sample_data)
     
     def get(self, idx):
         data = super().get(idx)
         
         if self.advanced_preprocessing:
-            data = self._apply_advanced_preprocessing(data)
+            data = self.preprocessor.apply(data)
         
         return data
 
 class EnsembleBrainGNN(nn.Module):
-    """集成BrainGNN模型"""
+    """集成BrainGNN模型
+
+    相同架构 (hidden_dim和dropout相同) 的成员在一次前向中批量计算 (net.stacked_ensemble)，
+    不同架构的成员按组依次计算。
+    注意: 默认configs (None) 的5种配置互不相同，所以默认不会发生任何批量计算，
+    每个成员单独前向；要批量计算请传入相同配置，例如 configs=[{'hidden_dim': 128, 'dropout': 0.4}]
+    (与 simplified_advanced_training.py --same_architecture 相同)
+    """
     
-    def __init__(self, in_dim, n_roi=116, n_models=5):
+    def __init__(self, in_dim, n_roi=116, n_models=5, configs=None):
         super().__init__()
         self.n_models = n_models
         self.models = nn.ModuleList()
         
         # 创建多个不同配置的模型
-        configs = [
+        configs = configs or [
             {'hidden_dim': 64, 'dropout': 0.3},
             {'hidden_dim': 128, 'dropout': 0.4},
             {'hidden_dim': 96, 'dropout': 0.35},
@@ -169,15 +189,10 @@ class EnsembleBrainGNN(nn.Module):
         
         # 集成权重
         self.ensemble_weights = nn.Parameter(torch.ones(n_models) / n_models)
+        self.groups = group_members(self.models)
         
     def forward(self, data):
-        outputs = []
-        task_types = []
-        
-        for model in self.models:
-            out, task_type = model(data)
-            outputs.append(out)
-            task_types.append(task_type)
+        outputs, task_types = zip(*ensemble_forward(self.models, data, self.groups))
         
         # 加权平均
         weights = F.softmax(self.ensemble_weights, dim=0)
@@ -185,6 +200,19 @@ class EnsembleBrainGNN(nn.Module):
         
         return ensemble_output, task_types[0]
 
+def prepare_graph(data):
+    """过滤有效数据: 只保留 (116, 1) 节点特征"""
+    if data.x.shape != (116, 1):
+        return None
+    data.y = data.y.long()
+    return data
+
+def load_training_graphs(root_dir='./data/pain_data/all_graphs/'):
+    """加载全部有效样本到共享内存 (未预处理)，所有试验共用，预处理在每个试验中拟合"""
+    print("📊 加载全部有效样本...")
+    dataset = AdvancedPainGraphDataset(root_dir, use_all_samples=True, advanced_preprocessing=False)
+    return load_shared_graphs(dataset, prepare=prepare_graph)
+
 class AdvancedTrainer:
     """高级训练器"""
     
@@ -193,8 +221,11 @@ class AdvancedTrainer:
         self.best_models = []
         self.training_history = defaultdict(list)
         
-    def train_with_advanced_techniques(self, trial=None, use_ensemble=True):
-        """使用所有高级技术进行训练"""
+    def train_with_advanced_techniques(self, trial=None, use_ensemble=True, graphs=None):
+        """使用所有高级技术进行训练
+
+        graphs: load_training_graphs()的共享数据集；为None时在此加载
+        """
         
         # 超参数配置
         if trial:
@@ -227,38 +258,24 @@ class AdvancedTrainer:
         
         print(f"🚀 开始高级训练，参数配置: {params}")
         
-        # 1. 加载和预处理全部数据
-        print("📊 加载全部4659个有效样本...")
-        dataset = AdvancedPainGraphDataset(
-            './data/pain_data/all_graphs/',
-            use_all_samples=True,
+        # 1. 加载全部数据 (超参数搜索时由调用方传入，只加载一次)
+        if graphs is None:
+            graphs = load_training_graphs()
+        preprocessor = GraphPreprocessor(
             advanced_preprocessing=True,
             feature_selection=params['feature_selection'],
             scaler_type=params['scaler_type']
         )
         
-        # 过滤有效数据
-        filtered_data = []
-        for i in range(len(dataset)):
-            try:
-                data = dataset[i]
-                if data.x.shape == (116, 1):
-                    data.y = data.y.long()
-                    filtered_data.append(data)
-            except:
-                continue
-        
-        print(f"✅ 成功加载 {len(filtered_data)} 个有效样本")
+        print(f"✅ 成功加载 {len(graphs)} 个有效样本")
         
-        # 2. 拟合预处理参数
-        sample_size = min(1000, len(filtered_data))
-        sample_data = filtered_data[:sample_size]
-        dataset.fit_preprocessing(sample_data)
+        # 2. 拟合预处理参数 (样本先经过未拟合的预处理：异常值处理和边权重归一化)
+        sample_size = min(1000, len(graphs))
+        sample_data = [preprocessor.apply(graphs[i]) for i in range(sample_size)]
+        preprocessor.fit(sample_data)
         
-        # 3. 重新应用预处理
-        processed_data = []
-        for data in filtered_data:
-            processed_data.append(dataset.get(filtered_data.index(data)))
+        # 3. 应用预处理 (共享张量不被修改，预处理结果为新张量)
+        processed_data = [preprocessor.apply(data) for data in graphs]
         
         # 4. 计算类别权重
         labels = [data.y.item() for data in processed_data]
@@ -318,7 +335,15 @@ class AdvancedTrainer:
         patience_counter = 0
         max_epochs = 100
         
-        for epoch in range(max_epochs):
+        # 超参数搜索时从该配置上次的rung检查点热启动
+        start_epoch = 0
+        if trial:
+            checkpoint = TrialCheckpoint(trial, max_epochs)
+            start_epoch, state = checkpoint.restore(model, optimizer, scheduler)
+            best_val_f1 = state.get('best_val_f1', best_val_f1)
+            patience_counter = state.get('patience_counter', patience_counter)
+        
+        for epoch in range(start_epoch, max_epochs):
             # 训练阶段
             model.train()
             total_loss = 0
@@ -412,9 +437,18 @@ class AdvancedTrainer:
                     print(f"✅ 保存最佳模型: {model_name}, Val F1: {val_f1:.4f}")
             else:
                 patience_counter += 1
-                if patience_counter >= 20:
-                    print("🛑 早停触发")
-                    break
+            
+            # 多保真剪枝：每个epoch上报验证F1，不佳的配置在rung处被剪枝 (抛出TrialPruned)
+            if trial:
+                checkpoint.report(val_f1, epoch, model, optimizer, scheduler,
+                                  best_val_f1=best_val_f1, patience_counter=patience_counter)
+            
+            if patience_counter >= 20:
+                print("🛑 早停触发")
+                break
+        
+        if trial:
+            checkpoint.finish()
         
         # 9. 最终测试评估
         if not trial:
@@ -474,26 +508,31 @@ class AdvancedTrainer:
         
         return best_val_f1 if trial else test_acc
 
-def run_deep_hyperparameter_optimization():
-    """运行深度超参数优化"""
+def advanced_objective(trial, graphs=None):
+    """Optuna目标函数 (模块级函数，供并行worker进程导入)"""
+    return AdvancedTrainer().train_with_advanced_techniques(trial=trial, use_ensemble=True, graphs=graphs)
+
+def run_deep_hyperparameter_optimization(graphs=None, n_jobs=None, threads_per_job=None, storage=DEFAULT_STORAGE,
+                                         pruner='hyperband'):
+    """运行深度超参数优化 (多进程并行试验，数据集只加载一次，Hyperband按epoch剪枝)"""
     print("🔬 开始深度超参数优化（目标: 50次试验）...")
     
-    trainer = AdvancedTrainer()
+    if graphs is None:
+        graphs = load_training_graphs()
     
-    # 创建优化研究
-    study = optuna.create_study(
+    # 创建优化研究并运行优化
+    study = run_parallel_study(
+        advanced_objective, graphs, 'advanced_optimization',
+        storage=storage,
+        n_trials=50,
+        n_jobs=n_jobs,
+        threads_per_job=threads_per_job,
+        timeout=3600*4,  # 4小时超时
         direction='maximize',
         sampler=optuna.samplers.TPESampler(seed=42),
-        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=10)
+        pruner=make_pruner(pruner, max_resource=100)
     )
     
-    # 优化目标函数
-    def objective(trial):
-        return trainer.train_with_advanced_techniques(trial=trial, use_ensemble=True)
-    
-    # 运行优化
-    study.optimize(objective, n_trials=50, timeout=3600*4)  # 4小时超时
-    
     print("📊 超参数优化完成！")
     print("最佳参数:", study.best_params)
     print("最佳F1分数:", study.best_value)
@@ -510,30 +549,32 @@ def run_deep_hyperparameter_optimization():
     
     return study.best_params
 
-def main():
+def main(n_jobs=None, threads_per_job=None, storage=DEFAULT_STORAGE, pruner='hyperband'):
     """主函数"""
     print("🚀 启动BrainGNN高级优化系统...")
     print("目标: 达到80%以上准确率")
     
     trainer = AdvancedTrainer()
+    # 数据只加载一次，三个阶段共用
+    graphs = load_training_graphs()
     
     # 运行超参数优化
     print("\n" + "="*50)
     print("阶段1: 深度超参数优化")
     print("="*50)
-    best_params = run_deep_hyperparameter_optimization()
+    best_params = run_deep_hyperparameter_optimization(graphs, n_jobs, threads_per_job, storage, pruner)
     
     # 使用最佳参数训练集成模型
     print("\n" + "="*50)
     print("阶段2: 集成模型训练")
     print("="*50)
-    ensemble_acc = trainer.train_with_advanced_techniques(use_ensemble=True)
+    ensemble_acc = trainer.train_with_advanced_techniques(use_ensemble=True, graphs=graphs)
     
     # 训练单一最佳模型
     print("\n" + "="*50)
     print("阶段3: 单一最佳模型训练") 
     print("="*50)
-    single_acc = trainer.train_with_advanced_techniques(use_ensemble=False)
+    single_acc = trainer.train_with_advanced_techniques(use_ensemble=False, graphs=graphs)
     
     # 最终结果
     print("\n" + "="*80)
@@ -557,4 +598,14 @@ def main():
     print("- ./model/hyperparameter_optimization_results.json - 超参数优化结果")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=None, help='并行试验进程数 (默认: CPU核数)')
+    parser.add_argument('--threads', type=int, default=None, help='每个进程的torch线程数 (默认: CPU核数 / jobs)')
+    parser.add_argument('--storage', type=str, default=DEFAULT_STORAGE, help='Optuna存储 (journal文件或sqlite:///...)')
+    parser.add_argument('--pruner', type=str, default='hyperband', choices=['hyperband', 'sha', 'median', 'none'],
+                        help='按epoch剪枝的调度器')
+    args = parser.parse_args()
+    
+    main(args.jobs, args.threads, args.storage, args.pruner)
\ No newline at end of file
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Eager vs torch.compile training step time for BrainGNN (Network)
+Runs the same initialisation and the same batches through an eager and a
+compiled Network (Network(..., compile=True): the three MyNNConv layers and the
+classifier; TopK pooling stays eager) and reports the compile warm-up, the
+steady-state time of one training step (forward + backward + Adam step),
+the speedup and the output parity of the two models
+
+Usage:
+    python benchmarks/bench_compile.py
+    python benchmarks/bench_compile.py --batch_size 64 --steps 50 --regions 116
+    python benchmarks/bench_compile.py --output ./results/compile_synthetic.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch_geometric.loader import DataLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from net.braingnn import Network
+from benchmarks.bench_precision import make_graphs
+
+
+def make_model(args, compile):
+    torch.manual_seed(args.seed)
+    model = Network(args.regions, args.ratio, 2, k=8, R=args.regions, compile=compile)
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr, weight_decay=5e-3)
+    return model, optimizer
+
+
+def train_step(model, optimizer, data):
+    optimizer.zero_grad()
+    output = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)[0]
+    loss = F.nll_loss(output, data.y)
+    loss.backward()
+    optimizer.step()
+    return loss.item()
+
+
+def run(model, optimizer, batches, args):
+    """Warm-up seconds (first args.warmup steps) and per-step ms of the following steps"""
+
+    model.train()
+    torch.manual_seed(args.seed)
+    start = time.perf_counter()
+    for data in batches[:args.warmup]:
+        train_step(model, optimizer, data)
+    warmup = time.perf_counter() - start
+
+    times, losses = [], []
+    for step in range(args.steps):
+        data = batches[step % len(batches)]
+        start = time.perf_counter()
+        losses.append(train_step(model, optimizer, data))
+        times.append((time.perf_counter() - start) * 1000)
+    return warmup, np.array(times), losses
+
+
+@torch.no_grad()
+def parity(compiled, batches, args):
+    """Max |Δ| between the compiled model and an eager copy of its trained weights (eval mode;
+    the training losses differ a little anyway, compiled dropout draws its own masks)"""
+
+    eager = make_model(args, compile=False)[0]
+    eager.load_state_dict(compiled.state_dict())
+    eager.eval(), compiled.eval()
+    diff = 0.0
+    for data in batches:
+        inputs = (data.x, data.edge_index, data.batch, data.edge_attr, data.pos)
+        diff = max(diff, (eager(*inputs)[0] - compiled(*inputs)[0]).abs().max().item())
+    return diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eager vs torch.compile training step benchmark")
+    parser.add_argument('--num_graphs', type=int, default=256, help='synthetic graphs')
+    parser.add_argument('--regions', type=int, default=116, help='synthetic ROIs')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=3, help='steps excluded from the timing (compilation)')
+    parser.add_argument('--steps', type=int, default=30, help='timed training steps')
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--ratio', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='optional JSON report')
+    args = parser.parse_args()
+
+    graphs = make_graphs(args.num_graphs, args.regions, args.seed)
+    batches = list(DataLoader(graphs, batch_size=args.batch_size, shuffle=False))
+    print(f"⏱️  torch.compile benchmark: {len(batches)} batches of {args.batch_size} graphs, {args.regions} ROIs, "
+          f"{args.warmup} warm-up + {args.steps} timed steps, {torch.get_num_threads()} threads")
+
+    results = {}
+    for mode in ('eager', 'compiled'):
+        model, optimizer = make_model(args, compile=mode == 'compiled')
+        warmup, times, losses = run(model, optimizer, batches, args)
+        results[mode] = {'warmup_s': warmup, 'median_ms': float(np.median(times)),
+                         'mean_ms': float(times.mean()), 'min_ms': float(times.min()),
+                         'graphs_per_s': args.batch_size * 1000 / float(np.median(times)),
+                         'final_loss': losses[-1]}
+
+    print(f"{'mode':>9} {'warm-up s':>10} {'median ms':>10} {'min ms':>8} {'graphs/s':>9} {'loss':>8}")
+    for mode, row in results.items():
+        print(f"{mode:>9} {row['warmup_s']:>10.2f} {row['median_ms']:>10.2f} {row['min_ms']:>8.2f} "
+              f"{row['graphs_per_s']:>9.1f} {row['final_loss']:>8.4f}")
+
+    speedup = results['eager']['median_ms'] / results['compiled']['median_ms']
+    max_diff = parity(model, batches, args)
+    print(f"torch.compile speedup: x{speedup:.2f} per training step")
+    print(f"Output parity (same weights, eval): max |Δlog-prob| {max_diff:.2e}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'results': results, 'speedup': speedup,
+                       'max_abs_output_diff': max_diff}, f, indent=2)
+        print(f"📁 Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
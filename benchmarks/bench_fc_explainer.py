@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the FCGNNExplainer array kernels
+FC computation, structural attention and Top-K region selection
+on synthetic cohorts of growing size (subjects x regions)
+
+Usage:
+    python benchmarks/bench_fc_explainer.py
+    python benchmarks/bench_fc_explainer.py --subjects 100 300 500 --regions 36 116 432 --reference
+"""
+
+import os
+import sys
+import time
+import argparse
+import contextlib
+import io
+
+import numpy as np
+from scipy import stats
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fc_gnn_explainable_analysis import FCGNNExplainer
+
+NETWORKS = ['cognitive_control', 'sensorimotor', 'attention', 'default_mode',
+            'visual', 'cerebellar', 'limbic', 'subcortical']
+
+
+def make_explainer(num_regions, seed=0):
+    """FCGNNExplainer with a synthetic atlas of num_regions regions"""
+
+    rng = np.random.RandomState(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        explainer = FCGNNExplainer(device='cpu')
+
+    explainer.brain_atlas = {
+        f'Region_{i:03d}': {
+            'mni': rng.uniform(-70, 70, 3).round().tolist(),
+            'network': NETWORKS[i % len(NETWORKS)]
+        }
+        for i in range(num_regions)
+    }
+    explainer.index_brain_atlas()
+    return explainer
+
+
+def make_cohort(num_subjects, num_regions, num_timepoints, seed=42):
+    """Synthetic BOLD-like signals and balanced pain labels"""
+
+    rng = np.random.RandomState(seed)
+    brain_signals = rng.randn(num_subjects, num_regions, num_timepoints)
+    shared = rng.randn(num_subjects, 1, num_timepoints)
+    brain_signals[:, :num_regions // 4] += 0.3 * shared
+    pain_labels = rng.randint(0, 2, size=num_subjects)
+    return brain_signals, pain_labels
+
+
+def reference_fc(explainer, brain_signals):
+    """Per-subject np.corrcoef loop (previous implementation)"""
+
+    fc_matrices = []
+    for signals in brain_signals:
+        fc_matrix = np.nan_to_num(np.corrcoef(signals), nan=0.0)
+        fc_matrices.append(np.where(np.abs(fc_matrix) > explainer.fc_threshold, fc_matrix, 0))
+    return np.array(fc_matrices)
+
+
+def reference_attention_heads(explainer):
+    """Nested region-pair loops for the network and spatial heads (previous implementation)"""
+
+    n = explainer.num_regions
+    network_attention = np.zeros((n, n))
+    spatial_attention = np.zeros((n, n))
+    for i, region_i in enumerate(explainer.region_names):
+        for j, region_j in enumerate(explainer.region_names):
+            same = explainer.brain_atlas[region_i]['network'] == explainer.brain_atlas[region_j]['network']
+            network_attention[i, j] = 1.5 if same else 1.0
+            distance = np.linalg.norm(np.array(explainer.brain_atlas[region_i]['mni']) -
+                                      np.array(explainer.brain_atlas[region_j]['mni']))
+            spatial_attention[i, j] = np.exp(-distance / 50.0)
+    return network_attention, spatial_attention
+
+
+def reference_discrimination(explainer, fc_matrices, pain_labels):
+    """Per-region stats.ttest_ind loop (previous implementation)"""
+
+    pain_indices = np.where(pain_labels == 1)[0]
+    no_pain_indices = np.where(pain_labels == 0)[0]
+    importance = np.zeros(explainer.num_regions)
+    for region in range(explainer.num_regions):
+        t_stat, _ = stats.ttest_ind(np.mean(fc_matrices[pain_indices, region, :], axis=0),
+                                    np.mean(fc_matrices[no_pain_indices, region, :], axis=0))
+        importance[region] = np.abs(t_stat) if not np.isnan(t_stat) else 0
+    return importance
+
+
+def timed(func, *args, repeat=3):
+    """Best wall time of repeat calls, and the last result"""
+
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_case(num_subjects, num_regions, num_timepoints, repeat, reference):
+    explainer = make_explainer(num_regions)
+    explainer.top_k = min(explainer.top_k, num_regions)
+    brain_signals, pain_labels = make_cohort(num_subjects, num_regions, num_timepoints)
+
+    t_fc, fc_matrices = timed(explainer.compute_functional_connectivity, brain_signals, repeat=repeat)
+    t_att, (attention, heads) = timed(explainer.structural_attention_mechanism, fc_matrices, pain_labels,
+                                      repeat=repeat)
+    t_topk, topk = timed(explainer.top_k_region_selection, fc_matrices, pain_labels, attention, repeat=repeat)
+
+    row = {
+        'subjects': num_subjects, 'regions': num_regions,
+        'fc': t_fc, 'attention': t_att, 'top_k': t_topk,
+    }
+
+    if reference:
+        t_ref_fc, ref_fc = timed(reference_fc, explainer, brain_signals, repeat=1)
+        t_ref_att, (ref_net, ref_sp) = timed(reference_attention_heads, explainer, repeat=1)
+        t_ref_topk, ref_disc = timed(reference_discrimination, explainer, fc_matrices, pain_labels, repeat=1)
+
+        assert np.allclose(fc_matrices, ref_fc, atol=1e-10)
+        assert np.allclose(heads[1], ref_net) and np.allclose(heads[2], ref_sp)
+        assert np.allclose(topk[3]['discrimination_importance'], ref_disc)
+
+        row.update({'ref_fc': t_ref_fc, 'ref_attention': t_ref_att, 'ref_top_k': t_ref_topk})
+
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FCGNNExplainer array kernels")
+    parser.add_argument('--subjects', type=int, nargs='+', default=[100, 300, 500])
+    parser.add_argument('--regions', type=int, nargs='+', default=[36, 116, 432])
+    parser.add_argument('--timepoints', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--reference', action='store_true',
+                        help='Also time (and check against) the previous Python-loop implementations')
+    args = parser.parse_args()
+
+    print("⏱️  FCGNNExplainer benchmark (seconds, best of {})".format(args.repeat))
+    header = f"{'subjects':>8} {'regions':>7} {'fc':>8} {'attention':>9} {'top_k':>8}"
+    if args.reference:
+        header += f" {'ref_fc':>8} {'ref_att':>8} {'ref_topk':>8}"
+    print(header)
+
+    for num_regions in args.regions:
+        for num_subjects in args.subjects:
+            row = run_case(num_subjects, num_regions, args.timepoints, args.repeat, args.reference)
+            line = f"{row['subjects']:>8} {row['regions']:>7} {row['fc']:>8.3f} {row['attention']:>9.3f} {row['top_k']:>8.3f}"
+            if args.reference:
+                line += f" {row['ref_fc']:>8.3f} {row['ref_attention']:>8.3f} {row['ref_top_k']:>8.3f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
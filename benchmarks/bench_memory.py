@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Memory / time trade-off of BrainGNN (Network) training steps on large batches
+Runs one training step configuration per process (forward + backward + Adam
+step on a batch of complete FC graphs) and reports the peak resident memory the
+training steps add over the RSS after setup (VmHWM, reset once the batch and model
+are built) and the median step time, for:
+
+    generic          fused=False: [E, C] messages gathered and scattered at once
+    generic+chunk    fused=False, message_budget_mb: messages in checkpointed edge slices
+    fused            default CSR segment softmax-aggregate (no [E, C] tensors)
+    *+ckpt           checkpoint_blocks=True: conv -> pool -> readout blocks recomputed in backward
+
+A configuration is reported as OOM when its process is killed by a signal
+(the kernel OOM killer) or raises an allocation error; any other failure is
+reported as an error with the exception of the child process.
+
+Reference numbers (1 CPU thread, 400 graphs x 116 ROIs, 5.4M edges, --budget_mb 16):
+
+                          indim 116 (FC rows)      indim 1
+    config                step s    peak MB        step s    peak MB
+    generic                 6.95       2414          4.84       1745
+    generic+ckpt            9.93       2474          7.67       1760
+    generic+chunk           5.21       1251          3.60        916
+    generic+chunk+ckpt      7.52       1489          5.79        801
+    fused                   3.81       1055          2.24        564
+    fused+ckpt              6.21       1206          3.79        508
+
+The peak is reached in the backward of the first block (the largest graph),
+which block checkpointing has to recompute anyway: it costs ~50-70% more
+step time and saves at most ~10% memory here (indim 1), or adds some (the
+recomputed block's activations on top of the stored inputs, indim 116).
+It pays off when the later blocks hold a larger share (higher pooling
+ratio). Edge chunking halves the peak of the generic path and is faster
+(smaller working set). The fused path needs no chunking: its messages
+never exist as [E, C] tensors. With indim = R the remaining peak is
+conv1's per-node weights, [N, indim, 32].
+
+Usage:
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --batch_size 400 --regions 60 --indim 1 --budget_mb 64
+    python benchmarks/bench_memory.py --configs fused fused+ckpt --output ./results/memory.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import queue as queue_module
+import multiprocessing as mp
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from net.braingnn import Network
+
+CONFIGS = {
+    'generic': dict(fused=False),
+    'generic+ckpt': dict(fused=False, checkpoint_blocks=True),
+    'generic+chunk': dict(fused=False, chunk=True),
+    'generic+chunk+ckpt': dict(fused=False, chunk=True, checkpoint_blocks=True),
+    'fused': dict(fused=True),
+    'fused+ckpt': dict(fused=True, checkpoint_blocks=True),
+}
+
+# Messages of failed allocations (CPU allocator, CUDA caching allocator)
+ALLOCATION_ERRORS = ("can't allocate memory", 'not enough memory', 'out of memory')
+
+
+def make_batch(args):
+    """One collated batch of complete FC graphs (x = FC rows, edge_attr = FC values), built
+    directly as tensors so that building it does not raise the peak memory"""
+
+    torch.manual_seed(args.seed)
+    R, B = args.regions, args.batch_size
+    fc = torch.tanh(torch.randn(B, R, R) * 0.3)
+    fc = (fc + fc.transpose(1, 2)) / 2
+    edge_index = torch.combinations(torch.arange(R)).t()
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+    edge_attr = fc[:, edge_index[0], edge_index[1]].reshape(-1, 1)
+    edge_index = (edge_index.unsqueeze(0) + (torch.arange(B) * R).view(-1, 1, 1)).permute(1, 0, 2).reshape(2, -1)
+    return SimpleNamespace(x=fc[:, :, :args.indim].reshape(B * R, -1).contiguous(), edge_index=edge_index,
+                           edge_attr=edge_attr, pos=torch.eye(R).repeat(B, 1),
+                           batch=torch.arange(B).repeat_interleave(R), y=torch.arange(B) % 2)
+
+
+def reset_peak():
+    """Reset the peak RSS (VmHWM) to the current RSS, so setup peaks are not counted"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_mb():
+    """Peak RSS (VmHWM) of this process in MB"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def is_allocation_error(error):
+    return isinstance(error, MemoryError) or any(msg in str(error).lower() for msg in ALLOCATION_ERRORS)
+
+
+def measure(name, args, queue):
+    """Child process: puts {'step_s', 'peak_mb'} or {'error', 'oom'} on the queue"""
+    try:
+        queue.put(measure_steps(name, args))
+    except Exception as error:
+        queue.put({'step_s': None, 'peak_mb': None, 'oom': is_allocation_error(error),
+                   'error': traceback.format_exc()})
+
+
+def measure_steps(name, args):
+    config = CONFIGS[name]
+    data = make_batch(args)
+    torch.manual_seed(args.seed)
+    model = Network(args.indim, args.ratio, 2, k=8, R=args.regions,
+                    checkpoint_blocks=config.get('checkpoint_blocks', False), fused=config['fused'],
+                    message_budget_mb=args.budget_mb if config.get('chunk') else None)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    model.train()
+
+    # Peak and baseline from the same counter: after the reset VmHWM equals the current RSS
+    # (if the kernel refuses the reset, the baseline is the setup peak instead)
+    reset_peak()
+    baseline = peak_mb()
+    times = []
+    for _ in range(args.steps):
+        start = time.perf_counter()
+        optimizer.zero_grad()
+        output = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)[0]
+        F.nll_loss(output, data.y).backward()
+        optimizer.step()
+        times.append(time.perf_counter() - start)
+    return {'step_s': float(np.median(times)), 'peak_mb': peak_mb() - baseline}
+
+
+def run(name, args):
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=measure, args=(name, args, queue))
+    process.start()
+    # Read before join: a child with an unflushed queue item cannot exit
+    result = None
+    while result is None and (process.is_alive() or not queue.empty()):
+        try:
+            result = queue.get(timeout=1)
+        except queue_module.Empty:
+            pass
+    process.join()
+    if result is None:
+        # A negative exit code is the signal that killed the child (SIGKILL from the OOM killer)
+        killed = process.exitcode is not None and process.exitcode < 0
+        error = f'killed by signal {-process.exitcode}' if killed else f'exit code {process.exitcode} without a result'
+        return {'step_s': None, 'peak_mb': None, 'oom': killed, 'error': error}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Network training memory / time trade-off")
+    parser.add_argument('--batch_size', type=int, default=400)
+    parser.add_argument('--regions', type=int, default=116)
+    parser.add_argument('--indim', type=int, default=None, help='node features (default: regions, the FC rows)')
+    parser.add_argument('--ratio', type=float, default=0.5)
+    parser.add_argument('--budget_mb', type=float, default=64, help='message_budget_mb of the chunked path')
+    parser.add_argument('--steps', type=int, default=2)
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='optional JSON report')
+    args = parser.parse_args()
+    if args.indim is None:
+        args.indim = args.regions
+    if args.indim > args.regions:
+        parser.error(f'--indim {args.indim} > --regions {args.regions}: node features are the first indim FC columns')
+
+    edges = args.batch_size * args.regions * args.regions
+    print(f"⏱️  Training step memory: {args.batch_size} graphs x {args.regions} ROIs ({edges} edges with loops), "
+          f"indim {args.indim}, chunk budget {args.budget_mb:g} MB, {torch.get_num_threads()} threads")
+
+    results = {}
+    print(f"{'config':>20} {'step s':>8} {'peak MB':>8}")
+    for name in args.configs:
+        row = results[name] = run(name, args)
+        if row['step_s'] is None:
+            print(f"{name:>20} {'OOM' if row['oom'] else 'error':>8} {'-':>8}")
+            if not row['oom']:
+                print(row['error'].rstrip().splitlines()[-1])
+        else:
+            print(f"{name:>20} {row['step_s']:>8.2f} {row['peak_mb']:>8.0f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'edges': edges, 'results': results}, f, indent=2)
+        print(f"📁 Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark and accuracy parity of bf16 autocast against fp32 for BrainGNN (Network)
+Trains the same initialisation in both precisions on one dataset and reports
+training / evaluation throughput (graphs/s), test metrics, and the inference
+parity of the fp32-trained model evaluated in bf16 (max |Δprob|, prediction agreement)
+
+Usage:
+    python benchmarks/bench_precision.py --dataset synthetic
+    python benchmarks/bench_precision.py --dataset abide --dataroot ./data/ABIDE_pcp/cpac/filt_noglobal
+    python benchmarks/bench_precision.py --dataset pain --dataroot ./data/pain_data/all_graphs/ --epochs 20
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import io
+
+import numpy as np
+import torch
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from net.braingnn import Network
+from imports.trainer import Trainer, forward_network
+from imports.precision import PRECISIONS, describe
+
+
+def make_graphs(num_graphs, num_regions, seed=0):
+    """Synthetic complete FC graphs (x = FC rows) with a class-dependent block"""
+
+    rng = np.random.RandomState(seed)
+    edge_index = torch.combinations(torch.arange(num_regions)).t()
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+    graphs = []
+    for i in range(num_graphs):
+        label = i % 2
+        fc = rng.randn(num_regions, num_regions) * 0.3
+        fc[:num_regions // 4, :num_regions // 4] += 0.4 * label
+        fc = np.tanh((fc + fc.T) / 2)
+        x = torch.tensor(fc, dtype=torch.float)
+        graphs.append(Data(x=x, edge_index=edge_index, edge_attr=x[edge_index[0], edge_index[1]].view(-1, 1),
+                           pos=torch.eye(num_regions), y=torch.tensor(label)))
+    return graphs
+
+
+def load_graphs(args):
+    if args.dataset == 'synthetic':
+        return make_graphs(args.num_graphs, args.regions)
+    if args.dataset == 'abide':
+        from imports.ABIDEDataset import ABIDEDataset
+        dataset = ABIDEDataset(args.dataroot, 'ABIDE')
+        dataset.data.y = dataset.data.y.squeeze()
+        return [dataset[i] for i in range(len(dataset))]
+    from imports.PainGraphDataset import PainGraphDataset
+    dataset = PainGraphDataset(args.dataroot)
+    graphs = []
+    for i in range(len(dataset)):
+        data = dataset[i]
+        if data.x.shape == (116, 1):
+            data.y = data.y.long().view(-1)
+            graphs.append(data)
+    return graphs
+
+
+def split(graphs, seed=0):
+    order = np.random.RandomState(seed).permutation(len(graphs))
+    n_train, n_val = int(0.7 * len(graphs)), int(0.15 * len(graphs))
+    pick = lambda idx: [graphs[i] for i in idx]
+    return pick(order[:n_train]), pick(order[n_train:n_train + n_val]), pick(order[n_train + n_val:])
+
+
+def make_trainer(graphs, args, precision, state=None):
+    torch.manual_seed(args.seed)
+    sample = graphs[0]
+    model = Network(sample.x.size(1), args.ratio, int(max(int(g.y) for g in graphs)) + 1,
+                    k=8, R=sample.x.size(0))
+    if state is not None:
+        model.load_state_dict(state)
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr, weight_decay=5e-3)
+    return Trainer(model, optimizer, device=torch.device('cpu'), forward=forward_network,
+                   precision=precision, log_every=10 ** 9)
+
+
+def timed_evaluate(trainer, loader, repeat):
+    """Best evaluation throughput (graphs/s) of repeat passes, and the metrics"""
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        metrics = trainer.evaluate(loader)
+        best = min(best, time.perf_counter() - start)
+    return len(metrics['labels']) / best, metrics
+
+
+def run_precision(train, val, test, args, precision):
+    trainer = make_trainer(train, args, precision)
+    torch.manual_seed(args.seed)
+    train_loader = DataLoader(train, batch_size=args.batch_size, shuffle=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        history = trainer.fit(train_loader, DataLoader(val, batch_size=args.batch_size),
+                              epochs=args.epochs, eval_every=args.epochs, monitor='val_acc')
+    throughput = [record['train_graphs_per_s'] for record in history[1:]] or [history[0]['train_graphs_per_s']]
+    eval_speed, metrics = timed_evaluate(trainer, DataLoader(test, batch_size=args.batch_size), args.repeat)
+    return trainer, {
+        'train_graphs_per_s': float(np.mean(throughput)),
+        'eval_graphs_per_s': eval_speed,
+        'final_train_loss': history[-1]['train_loss'],
+        'test_acc': metrics['acc'], 'test_f1': metrics['f1'], 'test_loss': metrics['loss'],
+    }
+
+
+def inference_parity(trainer, test, args):
+    """fp32-trained weights evaluated in fp32 and bf16"""
+
+    loader = DataLoader(test, batch_size=args.batch_size)
+    fp32 = trainer.evaluate(loader)
+    bf16 = make_trainer(test, args, 'bf16', state=trainer.model.state_dict()).evaluate(loader)
+    return {
+        'max_abs_prob_diff': float(np.abs(fp32['probs'] - bf16['probs']).max()),
+        'prediction_agreement': float((fp32['preds'] == bf16['preds']).mean()),
+        'test_acc_fp32': fp32['acc'], 'test_acc_bf16': bf16['acc'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bf16 autocast vs fp32 benchmark and accuracy parity")
+    parser.add_argument('--dataset', type=str, default='synthetic', choices=['synthetic', 'abide', 'pain'])
+    parser.add_argument('--dataroot', type=str, default=None)
+    parser.add_argument('--num_graphs', type=int, default=400, help='synthetic graphs')
+    parser.add_argument('--regions', type=int, default=116, help='synthetic ROIs')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--ratio', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='JSON report (default ./results/precision_<dataset>.json)')
+    args = parser.parse_args()
+    args.dataroot = args.dataroot or {'abide': './data/ABIDE_pcp/cpac/filt_noglobal',
+                                      'pain': './data/pain_data/all_graphs/'}.get(args.dataset)
+
+    graphs = load_graphs(args)
+    train, val, test = split(graphs, args.seed)
+    print(f"⏱️  Precision benchmark on {args.dataset}: {len(train)}/{len(val)}/{len(test)} graphs, "
+          f"{graphs[0].x.size(0)} ROIs, {args.epochs} epochs, {torch.get_num_threads()} threads")
+
+    results = {}
+    fp32_trainer = None
+    for precision in PRECISIONS:
+        print(f"   {describe('cpu', precision)}")
+        trainer, results[precision] = run_precision(train, val, test, args, precision)
+        fp32_trainer = fp32_trainer or trainer
+
+    print(f"{'precision':>9} {'train g/s':>10} {'eval g/s':>10} {'loss':>8} {'test acc':>9} {'test f1':>8}")
+    for precision, row in results.items():
+        print(f"{precision:>9} {row['train_graphs_per_s']:>10.1f} {row['eval_graphs_per_s']:>10.1f} "
+              f"{row['final_train_loss']:>8.4f} {row['test_acc']:>9.4f} {row['test_f1']:>8.4f}")
+
+    parity = inference_parity(fp32_trainer, test, args)
+    speedup = {key: results['bf16'][key] / results['fp32'][key] for key in ('train_graphs_per_s', 'eval_graphs_per_s')}
+    print(f"bf16 speedup: train x{speedup['train_graphs_per_s']:.2f}, eval x{speedup['eval_graphs_per_s']:.2f}")
+    print(f"Inference parity (fp32 weights): max |Δprob| {parity['max_abs_prob_diff']:.4f}, "
+          f"prediction agreement {parity['prediction_agreement']:.1%}")
+    print(f"Training parity: test acc fp32 {results['fp32']['test_acc']:.4f} / bf16 {results['bf16']['test_acc']:.4f}")
+
+    output = args.output or f'./results/precision_{args.dataset}.json'
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'dataset': args.dataset, 'config': vars(args), 'results': results,
+                   'speedup': speedup, 'inference_parity': parity}, f, indent=2)
+    print(f"📁 Report saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
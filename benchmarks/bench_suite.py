@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite on synthetic data (benchmarks/synthetic.py)
+Times every stage of the pipeline on generated ABIDE-like h5 files, a BIDS-like
+BOLD + events dataset and a .pt graph store of configurable size and R, and
+saves the results as JSON (one file per commit) so that regressions show up
+between commits:
+
+    ingest          read_data over the raw .h5 files (ABIDEDataset.process)
+    bids            layout index build, ROI extraction of one run, event-window FC
+    dataset         PainGraphDataset construction and one pass of dataset[i]
+    collate         Batch.from_data_list per batch size
+    network         Network forward (eval) and forward + backward + Adam step per batch size
+    importance      Network.score_maps streamed into ScoreMapWriter + roi_importance
+    rasterize       atlas and coordinate volume rasterization, surface projection
+
+Times are the best of --repeat runs (seconds). A stage whose dependencies are
+missing (e.g. deepdish / torch_sparse for read_data) is recorded as skipped.
+With --compare, every case is compared with a previous report and cases slower
+than --threshold x are flagged (exit code 1 with --strict).
+
+Usage:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --subjects 64 --regions 200 --batch_sizes 16 64 128
+    python benchmarks/bench_suite.py --stages network importance --compare ./results/benchmarks/<commit>.json
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks import synthetic
+from net.braingnn import Network
+
+STAGES = ['ingest', 'bids', 'dataset', 'collate', 'network', 'importance', 'rasterize']
+
+# MNI152 2mm grid of the volume exports (imports/volume_raster.py)
+MNI_SHAPE = (91, 109, 91)
+MNI_AFFINE = np.array([
+    [-2, 0, 0, 90],
+    [0, 2, 0, -126],
+    [0, 0, 2, -72],
+    [0, 0, 0, 1]
+], dtype=float)
+
+
+def timed(func, *args, repeat=3, setup=None):
+    """Best wall time of repeat calls (stdout silenced), and the last result"""
+
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def case(seconds, items=None, unit=None):
+    row = {'seconds': seconds}
+    if items is not None:
+        row.update({'items': items, 'unit': unit, 'per_second': items / seconds if seconds > 0 else None})
+    return row
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                         stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                        stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, bool(dirty)
+
+
+class Workspace:
+    """Synthetic datasets of one run, generated once under workdir"""
+
+    def __init__(self, workdir, args):
+        self.workdir = workdir
+        self.args = args
+        self._done = {}
+
+    def _once(self, name, build):
+        if name not in self._done:
+            start = time.perf_counter()
+            self._done[name] = build()
+            print(f"   generated {name} in {time.perf_counter() - start:.1f}s")
+        return self._done[name]
+
+    def abide(self):
+        raw_dir = os.path.join(self.workdir, 'abide', 'raw')
+        self._once('abide', lambda: synthetic.write_abide_h5(raw_dir, self.args.subjects, self.args.regions,
+                                                             self.args.seed))
+        return raw_dir
+
+    def bids(self):
+        return self._once('bids', lambda: synthetic.write_bids(
+            os.path.join(self.workdir, 'bids'), self.args.bids_subjects, self.args.regions, self.args.volumes,
+            seed=self.args.seed))
+
+    def graph_store(self):
+        graph_dir = os.path.join(self.workdir, 'graphs')
+        self._once('graphs', lambda: synthetic.write_graph_store(graph_dir, self.args.subjects, self.args.regions,
+                                                                 self.args.seed))
+        return graph_dir
+
+    def graphs(self):
+        from imports.PainGraphDataset import PainGraphDataset
+        graph_dir = self.graph_store()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self._once('graph list', lambda: [data for data in PainGraphDataset(graph_dir)])
+
+    def atlas(self):
+        path = os.path.join(self.workdir, 'atlas_mni.nii.gz')
+        return self._once('atlas', lambda: synthetic.write_atlas(path, self.args.regions, MNI_SHAPE, MNI_AFFINE,
+                                                                 self.args.seed))
+
+
+def bench_ingest(ws, args):
+    from imports.read_abide_stats_parall import read_data
+
+    raw_dir = ws.abide()
+    seconds, _ = timed(read_data, raw_dir, repeat=args.repeat)
+    return {'read_data': case(seconds, args.subjects, 'subjects')}
+
+
+def bench_bids(ws, args):
+    from imports.bids_index import build_layout_index, load_layout_index
+    from imports import roi_extraction
+    from imports.windowed_fc import event_windows, window_correlations
+
+    dataset_dir, atlas_path = ws.bids()
+    rows = {}
+    seconds, _ = timed(build_layout_index, dataset_dir, None, True, repeat=args.repeat)
+    rows['layout_index'] = case(seconds, args.bids_subjects, 'runs')
+
+    layout = load_layout_index(dataset_dir, update=False)
+    run = layout.runs().iloc[0]
+    events = layout.events(run_id=run.run_id)
+
+    # The first run of a dataset also builds the parcellation operator (atlas resampling), later runs reuse it
+    extract = lambda: roi_extraction.RoiExtractor(atlas_path).fit_transform(run.path)
+    seconds, _ = timed(extract, repeat=args.repeat, setup=roi_extraction._operators.clear)
+    rows['roi_extraction_cold'] = case(seconds, args.volumes, 'volumes')
+    seconds, ts = timed(extract, repeat=args.repeat)
+    rows['roi_extraction'] = case(seconds, args.volumes, 'volumes')
+
+    starts, ends = event_windows(events['onset'].values, events['duration'].values, run.tr, len(ts))
+    seconds, _ = timed(window_correlations, ts, starts, ends, repeat=args.repeat)
+    rows['event_fc'] = case(seconds, len(starts), 'windows')
+    return rows
+
+
+def bench_dataset(ws, args):
+    from imports.PainGraphDataset import PainGraphDataset
+
+    graph_dir = ws.graph_store()
+    rows = {}
+    seconds, dataset = timed(PainGraphDataset, graph_dir, repeat=args.repeat)
+    rows['construct'] = case(seconds, len(dataset), 'graphs')
+    seconds, _ = timed(lambda: [dataset[i] for i in range(len(dataset))], repeat=args.repeat)
+    rows['iterate'] = case(seconds, len(dataset), 'graphs')
+    return rows
+
+
+def bench_collate(ws, args):
+    from torch_geometric.data import Batch
+
+    graphs = ws.graphs()
+    rows = {}
+    for batch_size in args.batch_sizes:
+        chunk = graphs[:batch_size]
+        seconds, _ = timed(Batch.from_data_list, chunk, repeat=args.repeat)
+        rows[f'b{batch_size}'] = case(seconds, len(chunk), 'graphs')
+    return rows
+
+
+def make_model(args):
+    torch.manual_seed(args.seed)
+    return Network(args.regions, 0.5, 2, k=8, R=args.regions)
+
+
+def bench_network(ws, args):
+    from torch_geometric.data import Batch
+
+    graphs = ws.graphs()
+    model = make_model(args)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    rows = {}
+
+    def forward(data):
+        with torch.no_grad():
+            return model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)[0]
+
+    def train_step(data):
+        optimizer.zero_grad()
+        output = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)[0]
+        loss = F.nll_loss(output, data.y.view(-1))
+        loss.backward()
+        optimizer.step()
+        return loss.item()
+
+    for batch_size in args.batch_sizes:
+        data = Batch.from_data_list(graphs[:batch_size])
+        model.eval()
+        forward(data)
+        seconds, _ = timed(forward, data, repeat=args.repeat)
+        rows[f'forward_b{batch_size}'] = case(seconds, data.num_graphs, 'graphs')
+        model.train()
+        train_step(data)
+        seconds, _ = timed(train_step, data, repeat=args.repeat)
+        rows[f'train_b{batch_size}'] = case(seconds, data.num_graphs, 'graphs')
+    return rows
+
+
+def bench_importance(ws, args):
+    from torch_geometric.loader import DataLoader
+    from imports.score_maps import ScoreMapWriter, roi_importance
+
+    graphs = ws.graphs()
+    model = make_model(args).eval()
+    loader = DataLoader(graphs, batch_size=max(args.batch_sizes), shuffle=False)
+    save_dir = os.path.join(ws.workdir, 'importance')
+
+    def extract():
+        writer = ScoreMapWriter(save_dir, len(graphs), 3, args.regions)
+        with torch.no_grad():
+            for data in loader:
+                output, scores, masks = model.score_maps(data.x, data.edge_index, data.batch, data.edge_attr,
+                                                         data.pos, num_graphs=data.num_graphs)
+                writer.write(scores, masks, output.argmax(dim=1), data.y)
+        return writer.close()
+
+    rows = {}
+    seconds, maps = timed(extract, repeat=args.repeat)
+    rows['score_maps'] = case(seconds, len(graphs), 'subjects')
+    correct = np.asarray(maps['predictions']) == np.asarray(maps['labels'])
+    seconds, _ = timed(roi_importance, maps['scores'], maps['masks'], correct, repeat=args.repeat)
+    rows['roi_importance'] = case(seconds, len(graphs), 'subjects')
+    return rows
+
+
+def bench_rasterize(ws, args):
+    from imports.volume_raster import AtlasRasterizer, rasterize_coordinates
+    from imports.surface_projection import SurfaceProjector
+
+    atlas_path, centroids = ws.atlas()
+    rng = np.random.RandomState(args.seed)
+    scores = rng.rand(args.subjects, args.regions).astype(np.float32)
+    rows = {}
+
+    seconds, rasterizer = timed(AtlasRasterizer, atlas_path, repeat=args.repeat)
+    rows['atlas_load'] = case(seconds)
+    seconds, _ = timed(rasterizer.rasterize, scores, repeat=args.repeat)
+    rows['atlas_volumes'] = case(seconds, len(scores), 'volumes')
+    seconds, _ = timed(lambda: rasterize_coordinates(centroids, scores[0], max_cached=0), repeat=args.repeat)
+    rows['coordinate_volume'] = case(seconds, 1, 'volumes')
+
+    vertices = synthetic.surface_vertices(args.vertices, seed=args.seed)
+    seconds, _ = timed(lambda: SurfaceProjector(centroids).project(vertices, scores[0], mode='knn'),
+                       repeat=args.repeat)
+    rows['surface_cold'] = case(seconds, len(vertices), 'vertices')
+    projector = SurfaceProjector(centroids)
+    projector.project(vertices, scores[0], mode='knn')
+    seconds, _ = timed(lambda: [projector.project(vertices, s, mode='knn') for s in scores], repeat=args.repeat)
+    rows['surface_cached'] = case(seconds, len(scores), 'maps')
+    return rows
+
+
+BENCHMARKS = {
+    'ingest': bench_ingest,
+    'bids': bench_bids,
+    'dataset': bench_dataset,
+    'collate': bench_collate,
+    'network': bench_network,
+    'importance': bench_importance,
+    'rasterize': bench_rasterize,
+}
+
+
+def compare(results, baseline_path, threshold, min_seconds=0.005):
+    """Print new / old time per case of a previous report; returns the regressed cases
+    (slower than threshold x; cases under min_seconds are too noisy to flag)"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\n📊 Compared with {baseline.get('commit', '?')} ({baseline_path}), flagged above x{threshold:g}")
+    print(f"{'stage':>12} {'case':>20} {'old s':>9} {'new s':>9} {'ratio':>7}")
+    regressions = []
+    for stage, rows in results.items():
+        old_rows = baseline.get('results', {}).get(stage, {})
+        if 'skipped' in rows or 'error' in rows or 'skipped' in old_rows or 'error' in old_rows:
+            continue
+        for name, row in rows.items():
+            old = old_rows.get(name)
+            if old is None or not old.get('seconds'):
+                continue
+            ratio = row['seconds'] / old['seconds']
+            flag = ' ⚠️' if ratio > threshold and max(row['seconds'], old['seconds']) >= min_seconds else ''
+            if flag:
+                regressions.append(f'{stage}/{name}')
+            print(f"{stage:>12} {name:>20} {old['seconds']:>9.4f} {row['seconds']:>9.4f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline benchmark suite on synthetic data")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--subjects', type=int, default=64, help='synthetic subjects / graphs')
+    parser.add_argument('--regions', type=int, default=116, help='ROIs (R)')
+    parser.add_argument('--bids_subjects', type=int, default=2, help='subjects of the synthetic BIDS dataset')
+    parser.add_argument('--volumes', type=int, default=120, help='BOLD volumes per run')
+    parser.add_argument('--vertices', type=int, default=20484, help='surface vertices (fsaverage5)')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', type=str, default=None, help='keep the synthetic data here (default: temp dir)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='JSON report (default ./results/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', type=str, default=None, help='previous JSON report to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio flagged as a regression')
+    parser.add_argument('--min_seconds', type=float, default=0.005, help='cases faster than this are not flagged')
+    parser.add_argument('--strict', action='store_true', help='exit with code 1 on regressions')
+    args = parser.parse_args()
+    args.batch_sizes = [b for b in args.batch_sizes if b <= args.subjects] or [args.subjects]
+
+    commit, dirty = git_commit()
+    print(f"⏱️  Benchmark suite @ {commit}{' (dirty)' if dirty else ''}: {args.subjects} subjects x "
+          f"{args.regions} ROIs, batch sizes {args.batch_sizes}, best of {args.repeat}, "
+          f"{torch.get_num_threads()} threads")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='braingnn_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    ws = Workspace(workdir, args)
+    results = {}
+    try:
+        for stage in args.stages:
+            print(f"▶ {stage}")
+            try:
+                results[stage] = BENCHMARKS[stage](ws, args)
+            except ImportError as e:
+                results[stage] = {'skipped': str(e)}
+                print(f"   ⏭️  skipped: {e}")
+                continue
+            except Exception as e:
+                results[stage] = {'error': f'{type(e).__name__}: {e}'}
+                print(f"   ❌ {type(e).__name__}: {e}")
+                continue
+            for name, row in results[stage].items():
+                rate = f"{row['per_second']:>10.1f} {row['unit']}/s" if row.get('per_second') else ''
+                print(f"   {name:>20} {row['seconds']:>9.4f}s {rate}")
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'commit': commit, 'dirty': dirty, 'date': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'torch': torch.__version__, 'threads': torch.get_num_threads()},
+        'config': vars(args), 'results': results,
+    }
+    output = args.output or os.path.join('results', 'benchmarks', f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📁 Report saved to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"⚠️  {len(regressions)} regression(s): {', '.join(regressions)}")
+            if args.strict:
+                sys.exit(1)
+        else:
+            print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
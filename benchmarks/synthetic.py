@@ -0,0 +1,188 @@
+"""
+Synthetic stand-ins for the datasets the pipeline reads, for the benchmarks
+The real ABIDE / OpenNeuro data is not in the tree; these generators write
+files with the same layout at a configurable size and number of ROIs (R):
+
+    write_abide_h5      <dir>/<subject>.h5 with corr / pcorr [R, R] and label
+                        (the 02-process_data.py output read by read_data)
+    write_atlas         labels NIfTI: R parcels = Voronoi cells of R random
+                        centroids inside an ellipsoidal brain mask
+    write_bids          BIDS-like dataset: participants.tsv and, per subject,
+                        func/sub-XX_task-pain_run-1_bold.nii.gz (parcel
+                        signals + noise on the atlas grid, TR in the header)
+                        with its _events.tsv
+    write_graph_store   <dir>/<name>_graph.pt complete FC graphs as written by
+                        scripts/make_graphs_*.py (x, edge_index, edge_attr, y, pos)
+    surface_vertices    points on an ellipsoid around the brain mask (fsaverage5
+                        sized by default) for the surface projection
+
+Everything is seeded: the same arguments give the same files.
+
+Usage:
+    python benchmarks/synthetic.py --out ./results/synthetic --subjects 20 --regions 116
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+import torch
+import nibabel as nib
+from scipy.spatial import cKDTree
+from torch_geometric.data import Data
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 3 mm grid covering the MNI box, the resolution of most OpenNeuro BOLD runs
+BOLD_SHAPE = (61, 73, 61)
+BOLD_AFFINE = np.array([
+    [-3, 0, 0, 90],
+    [0, 3, 0, -126],
+    [0, 0, 3, -72],
+    [0, 0, 0, 1]
+], dtype=float)
+
+
+def fc_matrix(rng, num_regions, num_timepoints=None):
+    """Correlation matrix [R, R] of random ROI timeseries with a few shared components"""
+    num_timepoints = num_timepoints or 2 * num_regions
+    components = rng.randn(num_timepoints, max(2, num_regions // 10))
+    mixing = rng.randn(components.shape[1], num_regions)
+    ts = components @ mixing + rng.randn(num_timepoints, num_regions)
+    return np.corrcoef(ts.T)
+
+
+def partial_correlation(corr):
+    """Partial correlations from the (pseudo-)inverse of a correlation matrix"""
+    precision = np.linalg.pinv(corr)
+    scale = np.sqrt(np.abs(np.diag(precision)))
+    pcorr = -precision / np.outer(scale, scale)
+    np.fill_diagonal(pcorr, 1.0)
+    return pcorr
+
+
+def write_abide_h5(out_dir, num_subjects, num_regions, seed=0):
+    """ABIDE-like raw/<subject>.h5 files (corr, pcorr, label) as saved by deepdish in 02-process_data.py"""
+    import h5py
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    paths = []
+    for i in range(num_subjects):
+        corr = fc_matrix(rng, num_regions)
+        path = os.path.join(out_dir, f'{50000 + i}.h5')
+        with h5py.File(path, 'w') as f:
+            f['corr'] = corr
+            f['pcorr'] = partial_correlation(corr)
+            f['label'] = np.int64(i % 2)
+        paths.append(path)
+    return paths
+
+
+def brain_mask(shape=BOLD_SHAPE):
+    """Boolean ellipsoid filling ~80% of each axis of the grid"""
+    axes = [(np.arange(n) - (n - 1) / 2) / (0.4 * n) for n in shape]
+    grid = np.meshgrid(*axes, indexing='ij')
+    return sum(g ** 2 for g in grid) <= 1.0
+
+
+def atlas_labels(num_regions, shape=BOLD_SHAPE, seed=0):
+    """(labels [X, Y, Z] with 1..R inside the brain mask, centroids [R, 3] in voxels)"""
+    rng = np.random.RandomState(seed)
+    voxels = np.argwhere(brain_mask(shape))
+    seeds = voxels[rng.choice(len(voxels), num_regions, replace=False)]
+    _, nearest = cKDTree(seeds).query(voxels)
+    labels = np.zeros(shape, dtype=np.int16)
+    labels[tuple(voxels.T)] = nearest + 1
+    centroids = np.stack([voxels[nearest == r].mean(axis=0) for r in range(num_regions)])
+    return labels, centroids
+
+
+def write_atlas(path, num_regions, shape=BOLD_SHAPE, affine=BOLD_AFFINE, seed=0):
+    """Labels NIfTI with R parcels; returns (path, parcel centroids [R, 3] in mm)"""
+    labels, centroids = atlas_labels(num_regions, shape, seed)
+    nib.save(nib.Nifti1Image(labels, affine), path)
+    return path, nib.affines.apply_affine(affine, centroids)
+
+
+def write_bids(out_dir, num_subjects, num_regions, num_volumes=120, tr=2.0, num_trials=12,
+               shape=BOLD_SHAPE, affine=BOLD_AFFINE, seed=0):
+    """BIDS-like pain dataset on the atlas grid; returns (dataset dir, atlas path)"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    labels, _ = atlas_labels(num_regions, shape, seed)
+    atlas_path = os.path.join(out_dir, 'atlas.nii.gz')
+    nib.save(nib.Nifti1Image(labels, affine), atlas_path)
+
+    subjects = [f'sub-{i + 1:02d}' for i in range(num_subjects)]
+    pd.DataFrame({'participant_id': subjects,
+                  'sex': ['M' if i % 2 else 'F' for i in range(num_subjects)],
+                  'age': rng.randint(18, 60, num_subjects)}).to_csv(
+        os.path.join(out_dir, 'participants.tsv'), sep='\t', index=False)
+
+    mask = labels > 0
+    onsets = np.linspace(0, (num_volumes - 4) * tr, num_trials, endpoint=False).round(1)
+    for subject in subjects:
+        func_dir = os.path.join(out_dir, subject, 'func')
+        os.makedirs(func_dir, exist_ok=True)
+        base = os.path.join(func_dir, f'{subject}_task-pain_run-1')
+
+        signals = rng.randn(num_volumes, num_regions).astype(np.float32)
+        bold = np.zeros(shape + (num_volumes,), dtype=np.float32)
+        bold[mask] = 100 + signals[:, labels[mask] - 1].T + 0.5 * rng.randn(mask.sum(), num_volumes)
+        img = nib.Nifti1Image(bold, affine)
+        img.header.set_zooms(tuple(np.abs(np.diag(affine)[:3])) + (tr,))
+        img.header.set_xyzt_units('mm', 'sec')
+        nib.save(img, base + '_bold.nii.gz')
+
+        pd.DataFrame({'onset': onsets, 'duration': 2 * tr,
+                      'trial_type': ['pain' if t % 2 else 'rest' for t in range(num_trials)]}).to_csv(
+            base + '_events.tsv', sep='\t', index=False)
+    return out_dir, atlas_path
+
+
+def write_graph_store(out_dir, num_graphs, num_regions, seed=0):
+    """Complete FC graphs saved one per .pt file (x = FC rows, edge_attr = FC values)"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    edge_index = torch.combinations(torch.arange(num_regions)).t()
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+    paths = []
+    for i in range(num_graphs):
+        fc = torch.from_numpy(fc_matrix(rng, num_regions)).float()
+        data = Data(x=fc, edge_index=edge_index, edge_attr=fc[edge_index[0], edge_index[1]].view(-1, 1),
+                    y=torch.tensor([i % 2]), pos=torch.eye(num_regions))
+        path = os.path.join(out_dir, f'sub-{i + 1:03d}_graph.pt')
+        torch.save(data, path)
+        paths.append(path)
+    return paths
+
+
+def surface_vertices(num_vertices=20484, shape=BOLD_SHAPE, affine=BOLD_AFFINE, seed=0):
+    """[V, 3] mm coordinates on the ellipsoid bounding the brain mask"""
+    rng = np.random.RandomState(seed)
+    directions = rng.randn(num_vertices, 3)
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    center = (np.array(shape) - 1) / 2
+    return nib.affines.apply_affine(affine, center + directions * 0.4 * np.array(shape))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the synthetic benchmark datasets")
+    parser.add_argument('--out', type=str, default='./results/synthetic')
+    parser.add_argument('--subjects', type=int, default=20)
+    parser.add_argument('--regions', type=int, default=116)
+    parser.add_argument('--volumes', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_abide_h5(os.path.join(args.out, 'abide', 'raw'), args.subjects, args.regions, args.seed)
+    write_bids(os.path.join(args.out, 'bids'), args.subjects, args.regions, args.volumes, seed=args.seed)
+    write_graph_store(os.path.join(args.out, 'graphs'), args.subjects, args.regions, args.seed)
+    print(f"📁 Synthetic ABIDE h5, BIDS and graph store written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ import vtk
 from vtk.util.numpy_support import numpy_to_vtk
 import os
 
+from imports.surface_projection import project_activation, region_arrays
+
 class RealBrainSurfaceGenerator:
     """真实大脑表面生成器"""
     
@@ -197,10 +199,7 @@ class RealBrainSurfaceGenerator:
             vtk_points.InsertNextPoint(point)
         
         # 计算激活值 (基于距离最近脑区)
-        activation_values = []
-        for point in all_points:
-            activation = self.calculate_point_activation(point)
-            activation_values.append(activation)
+        activation_values = self.calculate_point_activations(all_points)
         
         # 创建VTK数组
         activation_array = vtk.vtkFloatArray()
@@ -244,22 +243,13 @@ class RealBrainSurfaceGenerator:
     def calculate_point_activation(self, point):
         """计算表面点的激活值"""
         
-        min_distance = float('inf')
-        nearest_activation = 0.0
-        
-        for region_name, region_data in self.brain_regions.items():
-            region_coords = region_data['coords']
-            
-            # 计算欧氏距离
-            distance = np.sqrt(sum((point[i] - region_coords[i])**2 for i in range(3)))
-            
-            if distance < min_distance:
-                min_distance = distance
-                # 使用高斯衰减
-                decay_factor = np.exp(-distance / 25.0)  # 25mm衰减常数
-                nearest_activation = region_data['activation'] * decay_factor
+        return self.calculate_point_activations(np.asarray(point)[None])[0]
+    
+    def calculate_point_activations(self, points):
+        """计算所有表面点的激活值 (最近脑区, 25mm衰减常数)"""
         
-        return nearest_activation
+        centroids, activations = region_arrays(self.brain_regions)
+        return project_activation(points, centroids, activations, mode='nearest', decay=25.0)
     
     def create_brain_outline_vtk(self):
         """创建大脑轮廓线"""
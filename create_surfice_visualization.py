@@ -5,14 +5,14 @@
 Create brain visualization files for SurfIce viewing
 """
 
-import numpy as np
 import nibabel as nib
 import pandas as pd
 import os
-from scipy.ndimage import gaussian_filter
 import matplotlib.pyplot as plt
 from matplotlib import cm
 
+from imports.volume_raster import rasterize_coordinates, MNI152_2MM_SHAPE, MNI152_2MM_AFFINE
+
 class SurfIceVisualizationCreator:
     """创建SurfIce可视化文件"""
     
@@ -50,49 +50,13 @@ class SurfIceVisualizationCreator:
         
         print("🧠 Creating NIfTI overlay for SurfIce...")
         
-        # MNI152标准空间参数
-        dims = (91, 109, 91)  # 2mm分辨率
-        affine = np.array([
-            [-2, 0, 0, 90],
-            [0, 2, 0, -126],
-            [0, 0, 2, -72],
-            [0, 0, 0, 1]
-        ])
-        
-        # 创建空白体积
-        volume = np.zeros(dims)
+        # MNI152标准空间参数 (2mm分辨率)
+        affine = MNI152_2MM_AFFINE
         
-        # 为每个脑区添加激活
-        for region_name, region_data in self.regions.items():
-            mni_coords = region_data['coords']
-            activation = region_data['value']
-            
-            # MNI到体素坐标转换
-            voxel_coords = nib.affines.apply_affine(np.linalg.inv(affine), mni_coords)
-            voxel_coords = voxel_coords.astype(int)
-            
-            # 创建球形激活区域
-            radius = 8  # 体素半径
-            
-            for i in range(max(0, voxel_coords[0] - radius), 
-                         min(dims[0], voxel_coords[0] + radius + 1)):
-                for j in range(max(0, voxel_coords[1] - radius), 
-                             min(dims[1], voxel_coords[1] + radius + 1)):
-                    for k in range(max(0, voxel_coords[2] - radius), 
-                                 min(dims[2], voxel_coords[2] + radius + 1)):
-                        
-                        # 计算到中心的距离
-                        dist = np.sqrt((i - voxel_coords[0])**2 + 
-                                     (j - voxel_coords[1])**2 + 
-                                     (k - voxel_coords[2])**2)
-                        
-                        if dist <= radius:
-                            # 高斯衰减
-                            weight = np.exp(-0.5 * (dist / (radius/2))**2)
-                            volume[i, j, k] += activation * weight
-        
-        # 平滑处理
-        volume = gaussian_filter(volume, sigma=1.5)
+        # 为每个脑区添加球形高斯激活 (8体素半径), 然后平滑处理
+        coords = [region_data['coords'] for region_data in self.regions.values()]
+        values = [region_data['value'] for region_data in self.regions.values()]
+        volume = rasterize_coordinates(coords, values, MNI152_2MM_SHAPE, affine, radius=8, smoothing=1.5)
         
         # 创建NIfTI图像
         nii_img = nib.Nifti1Image(volume, affine)
@@ -14,12 +14,53 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import seaborn as sns
-import networkx as nx
 from scipy import stats
 from scipy.spatial.distance import pdist, squareform
 import pandas as pd
 import json
 
+from imports.graph_metrics import threshold_adjacency, compute_node_metrics
+from imports.mesh_io import write_vtk
+
+def batched_corrcoef(signals):
+    """Pearson correlation matrices for a batch of signals
+    
+    signals: [num_subjects, num_regions, time_points]
+    returns: [num_subjects, num_regions, num_regions], NaN (constant signals) set to 0
+    """
+    
+    signals = np.asarray(signals, dtype=float)
+    centered = signals - signals.mean(axis=-1, keepdims=True)
+    
+    # Scale every signal to unit norm; constant signals become all-zero rows
+    norm = np.sqrt(np.einsum('...t,...t->...', centered, centered))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = np.nan_to_num(centered / norm[..., None], nan=0.0, posinf=0.0, neginf=0.0)
+    
+    # Batched inner products of unit-norm signals give the correlations
+    corr = np.matmul(scaled, np.swapaxes(scaled, -1, -2))
+    
+    # Same clipping as np.corrcoef
+    return np.clip(corr, -1, 1, out=corr)
+
+
+def welch_t_statistic(a, b, axis=0):
+    """Welch's t statistic between samples a and b along axis (vectorized over the other axes)
+    
+    For equal sample sizes this equals the Student t statistic of stats.ttest_ind.
+    """
+    
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    n_a = a.shape[axis]
+    n_b = b.shape[axis]
+    
+    mean_diff = a.mean(axis=axis) - b.mean(axis=axis)
+    std_err = np.sqrt(a.var(axis=axis, ddof=1) / n_a + b.var(axis=axis, ddof=1) / n_b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return mean_diff / std_err
+
+
 class FCGNNExplainer:
     """FC + GNN Explainable Analysis System"""
     
@@ -85,9 +126,22 @@ class FCGNNExplainer:
             'Caudate_R': {'mni': [14, 14, 8], 'network': 'subcortical'}
         }
         
+        self.index_brain_atlas()
+        print(f"📍 Loaded {self.num_regions} brain regions from AAL116 atlas")
+    
+    def index_brain_atlas(self):
+        """Build array views of the atlas (names, MNI coordinates, network one-hot)"""
+        
         self.region_names = list(self.brain_atlas.keys())
         self.num_regions = len(self.region_names)
-        print(f"📍 Loaded {self.num_regions} brain regions from AAL116 atlas")
+        
+        # [num_regions, 3] MNI coordinate matrix
+        self.mni_coords = np.array([self.brain_atlas[r]['mni'] for r in self.region_names], dtype=float)
+        
+        # [num_regions, num_networks] network membership one-hot
+        networks = [self.brain_atlas[r]['network'] for r in self.region_names]
+        self.network_names, network_ids = np.unique(networks, return_inverse=True)
+        self.network_onehot = np.eye(len(self.network_names))[network_ids]
     
     def setup_analysis_parameters(self):
         """Setup analysis parameters"""
@@ -104,27 +158,11 @@ class FCGNNExplainer:
         print("🔗 Computing functional connectivity matrix...")
         
         # brain_signals: [num_subjects, num_regions, time_points]
-        num_subjects, num_regions, num_timepoints = brain_signals.shape
-        
-        # Compute FC for each subject
-        fc_matrices = []
+        # Pearson correlation for all subjects at once
+        fc_matrices = batched_corrcoef(brain_signals)
         
-        for subj in range(num_subjects):
-            # Get subject's brain signals
-            signals = brain_signals[subj]  # [num_regions, time_points]
-            
-            # Compute Pearson correlation
-            fc_matrix = np.corrcoef(signals)
-            
-            # Handle NaN values
-            fc_matrix = np.nan_to_num(fc_matrix, nan=0.0)
-            
-            # Apply threshold
-            fc_matrix = np.where(np.abs(fc_matrix) > self.fc_threshold, fc_matrix, 0)
-            
-            fc_matrices.append(fc_matrix)
-        
-        fc_matrices = np.array(fc_matrices)
+        # Apply threshold (in place, the batch can be large)
+        fc_matrices[np.abs(fc_matrices) <= self.fc_threshold] = 0
         print(f"✅ FC matrices computed: shape {fc_matrices.shape}")
         
         return fc_matrices
@@ -157,35 +195,21 @@ class FCGNNExplainer:
             
             elif head == 1:  # Network-based attention
                 # Focus on within and between network connections
-                network_attention = np.zeros((num_regions, num_regions))
+                # Same-network indicator from the one-hot membership product
+                same_network = self.network_onehot @ self.network_onehot.T
                 
-                for i, region_i in enumerate(self.region_names):
-                    for j, region_j in enumerate(self.region_names):
-                        net_i = self.brain_atlas[region_i]['network']
-                        net_j = self.brain_atlas[region_j]['network']
-                        
-                        # Higher attention for within-network connections
-                        if net_i == net_j:
-                            network_attention[i, j] = 1.5
-                        else:
-                            network_attention[i, j] = 1.0
+                # Higher attention for within-network connections
+                network_attention = 1.0 + 0.5 * same_network
                 
                 attention_weights[head] = network_attention
             
             elif head == 2:  # Spatial distance attention
                 # Attention based on spatial proximity
-                spatial_attention = np.zeros((num_regions, num_regions))
+                # Euclidean distance between all region pairs
+                distance = squareform(pdist(self.mni_coords))
                 
-                for i, region_i in enumerate(self.region_names):
-                    for j, region_j in enumerate(self.region_names):
-                        mni_i = np.array(self.brain_atlas[region_i]['mni'])
-                        mni_j = np.array(self.brain_atlas[region_j]['mni'])
-                        
-                        # Euclidean distance
-                        distance = np.linalg.norm(mni_i - mni_j)
-                        
-                        # Inverse distance attention (closer regions get higher attention)
-                        spatial_attention[i, j] = np.exp(-distance / 50.0)  # Scale factor
+                # Inverse distance attention (closer regions get higher attention)
+                spatial_attention = np.exp(-distance / 50.0)  # Scale factor
                 
                 attention_weights[head] = spatial_attention
             
@@ -220,14 +244,13 @@ class FCGNNExplainer:
         
         discrimination_importance = np.zeros(self.num_regions)
         if len(pain_indices) > 0 and len(no_pain_indices) > 0:
-            for region in range(self.num_regions):
-                # Get region's connectivity patterns
-                region_conn_pain = np.mean(fc_matrices[pain_indices, region, :], axis=0)
-                region_conn_no_pain = np.mean(fc_matrices[no_pain_indices, region, :], axis=0)
-                
-                # T-test for discrimination power
-                t_stat, p_value = stats.ttest_ind(region_conn_pain, region_conn_no_pain)
-                discrimination_importance[region] = np.abs(t_stat) if not np.isnan(t_stat) else 0
+            # Get every region's connectivity pattern
+            region_conn_pain = np.mean(fc_matrices[pain_indices], axis=0)
+            region_conn_no_pain = np.mean(fc_matrices[no_pain_indices], axis=0)
+            
+            # T-test for discrimination power, all regions at once
+            t_stat = welch_t_statistic(region_conn_pain, region_conn_no_pain, axis=1)
+            discrimination_importance = np.nan_to_num(np.abs(t_stat), nan=0.0)
         
         # 4. Network hub importance (degree centrality)
         hub_importance = np.sum(np.abs(np.mean(fc_matrices, axis=0)) > self.fc_threshold, axis=1)
@@ -265,49 +288,18 @@ class FCGNNExplainer:
         # Create graph structure from FC matrices
         avg_fc = np.mean(fc_matrices, axis=0)
         
-        # Build adjacency matrix
-        adj_matrix = np.abs(avg_fc) > self.fc_threshold
-        
-        # Create NetworkX graph for analysis
-        G = nx.from_numpy_array(adj_matrix)
-        
-        # Remove self-loops for core_number analysis
-        G.remove_edges_from(nx.selfloop_edges(G))
-        
-        # Compute graph metrics
-        node_metrics = {}
-        
-        # 1. Degree centrality
-        degree_centrality = nx.degree_centrality(G)
+        # Build adjacency matrix (self-loops removed for core_number analysis)
+        adj_matrix = threshold_adjacency(avg_fc, self.fc_threshold)
         
-        # 2. Betweenness centrality  
-        betweenness_centrality = nx.betweenness_centrality(G)
-        
-        # 3. Eigenvector centrality
-        try:
-            eigenvector_centrality = nx.eigenvector_centrality(G, max_iter=1000)
-        except:
-            eigenvector_centrality = {i: 0 for i in range(self.num_regions)}
-        
-        # 4. PageRank
-        pagerank = nx.pagerank(G)
-        
-        # 5. Clustering coefficient
-        clustering = nx.clustering(G)
-        
-        # 6. Core number
-        core_number = nx.core_number(G)
+        # Compute graph metrics: degree, betweenness, eigenvector centrality,
+        # PageRank, clustering coefficient and core number
+        metric_arrays = compute_node_metrics(adj_matrix)
         
         # Store metrics
-        for i in range(self.num_regions):
-            node_metrics[i] = {
-                'degree_centrality': degree_centrality.get(i, 0),
-                'betweenness_centrality': betweenness_centrality.get(i, 0),
-                'eigenvector_centrality': eigenvector_centrality.get(i, 0),
-                'pagerank': pagerank.get(i, 0),
-                'clustering': clustering.get(i, 0),
-                'core_number': core_number.get(i, 0)
-            }
+        node_metrics = {
+            i: {name: values[i] for name, values in metric_arrays.items()}
+            for i in range(self.num_regions)
+        }
         
         # Compute GNN importance score
         gnn_importance = np.zeros(self.num_regions)
@@ -324,7 +316,7 @@ class FCGNNExplainer:
         
         print("✅ GNN node importance analysis completed")
         
-        return gnn_importance, node_metrics, G
+        return gnn_importance, node_metrics, adj_matrix
     
     def pain_activation_ranking(self, fc_matrices, pain_labels, importance_scores):
         """Rank brain regions by pain activation/suppression patterns"""
@@ -337,42 +329,40 @@ class FCGNNExplainer:
         ranking_results = []
         
         if len(pain_indices) > 0 and len(no_pain_indices) > 0:
+            
+            # Mean absolute connectivity per subject and region: [subjects, regions]
+            pain_connectivity = np.mean(np.abs(fc_matrices[pain_indices]), axis=2)
+            no_pain_connectivity = np.mean(np.abs(fc_matrices[no_pain_indices]), axis=2)
+            
+            # Compute mean connectivity strength
+            pain_strength = np.mean(pain_connectivity, axis=0)
+            no_pain_strength = np.mean(no_pain_connectivity, axis=0)
+            
+            # Activation difference
+            activation_diff = pain_strength - no_pain_strength
+            
+            # Statistical significance for all regions at once
+            t_stats, p_values = stats.ttest_ind(pain_connectivity, no_pain_connectivity, axis=0)
+            
+            gnn_scores = importance_scores.get('gnn_importance', np.zeros(self.num_regions))
+            
             for i, region in enumerate(self.region_names):
-                
-                # Get region's connectivity patterns
-                pain_connectivity = fc_matrices[pain_indices, i, :]  # [pain_subjects, other_regions]
-                no_pain_connectivity = fc_matrices[no_pain_indices, i, :]  # [no_pain_subjects, other_regions]
-                
-                # Compute mean connectivity strength
-                pain_strength = np.mean(np.abs(pain_connectivity))
-                no_pain_strength = np.mean(np.abs(no_pain_connectivity))
-                
-                # Activation difference
-                activation_diff = pain_strength - no_pain_strength
-                
-                # Statistical significance
-                t_stat, p_value = stats.ttest_ind(
-                    np.mean(np.abs(pain_connectivity), axis=1),
-                    np.mean(np.abs(no_pain_connectivity), axis=1)
-                )
-                
-                # Combine with importance scores
-                combined_score = importance_scores['combined_importance'][i]
-                gnn_score = importance_scores.get('gnn_importance', np.zeros(self.num_regions))[i]
+                t_stat = t_stats[i]
+                p_value = p_values[i]
                 
                 ranking_results.append({
                     'region': region,
                     'region_index': i,
-                    'activation_diff': activation_diff,
-                    'pain_strength': pain_strength,
-                    'no_pain_strength': no_pain_strength,
+                    'activation_diff': activation_diff[i],
+                    'pain_strength': pain_strength[i],
+                    'no_pain_strength': no_pain_strength[i],
                     't_statistic': t_stat if not np.isnan(t_stat) else 0,
                     'p_value': p_value if not np.isnan(p_value) else 1,
-                    'combined_importance': combined_score,
-                    'gnn_importance': gnn_score,
+                    'combined_importance': importance_scores['combined_importance'][i],
+                    'gnn_importance': gnn_scores[i],
                     'network': self.brain_atlas[region]['network'],
                     'mni_coords': self.brain_atlas[region]['mni'],
-                    'activation_type': 'Enhanced' if activation_diff > 0 else 'Suppressed'
+                    'activation_type': 'Enhanced' if activation_diff[i] > 0 else 'Suppressed'
                 })
         
         # Sort by combined importance and activation difference
@@ -390,79 +380,28 @@ class FCGNNExplainer:
         import os
         os.makedirs(output_dir, exist_ok=True)
         
-        # 1. Generate VTK point cloud file
+        mni_points = np.array([result['mni_coords'] for result in ranking_results], dtype=np.float32)
+        
+        # 1. Generate VTK point cloud file (binary legacy VTK)
         vtk_file = os.path.join(output_dir, 'brain_regions_pain.vtk')
+        is_top_k = np.isin([result['region_index'] for result in ranking_results], top_k_indices)
         
-        with open(vtk_file, 'w') as f:
-            f.write("# vtk DataFile Version 3.0\\n")
-            f.write("Brain Regions Pain Analysis\\n")
-            f.write("ASCII\\n")
-            f.write("DATASET POLYDATA\\n")
-            
-            # Points (brain regions)
-            f.write(f"POINTS {len(ranking_results)} float\\n")
-            for result in ranking_results:
-                mni = result['mni_coords']
-                f.write(f"{mni[0]} {mni[1]} {mni[2]}\\n")
-            
-            # Point data (attributes)
-            f.write(f"POINT_DATA {len(ranking_results)}\\n")
-            
-            # Activation difference
-            f.write("SCALARS activation_diff float 1\\n")
-            f.write("LOOKUP_TABLE default\\n")
-            for result in ranking_results:
-                f.write(f"{result['activation_diff']}\\n")
-            
-            # Combined importance
-            f.write("SCALARS combined_importance float 1\\n")
-            f.write("LOOKUP_TABLE default\\n")
-            for result in ranking_results:
-                f.write(f"{result['combined_importance']}\\n")
-            
-            # Statistical significance
-            f.write("SCALARS p_value float 1\\n")
-            f.write("LOOKUP_TABLE default\\n")
-            for result in ranking_results:
-                f.write(f"{result['p_value']}\\n")
-            
-            # Top-K indicator
-            f.write("SCALARS top_k_indicator int 1\\n")
-            f.write("LOOKUP_TABLE default\\n")
-            for result in ranking_results:
-                is_top_k = 1 if result['region_index'] in top_k_indices else 0
-                f.write(f"{is_top_k}\\n")
+        write_vtk(vtk_file, mni_points, title="Brain Regions Pain Analysis", vertex_cells=True, scalars={
+            'activation_diff': [result['activation_diff'] for result in ranking_results],
+            'combined_importance': [result['combined_importance'] for result in ranking_results],
+            'p_value': [result['p_value'] for result in ranking_results],
+            'top_k_indicator': is_top_k.astype(np.int32)
+        })
         
         # 2. Generate connectivity network file
         network_file = os.path.join(output_dir, 'brain_connectivity_network.vtk')
         
-        with open(network_file, 'w') as f:
-            f.write("# vtk DataFile Version 3.0\\n")
-            f.write("Brain Connectivity Network\\n")
-            f.write("ASCII\\n")
-            f.write("DATASET POLYDATA\\n")
-            
-            # Points
-            f.write(f"POINTS {len(ranking_results)} float\\n")
-            for result in ranking_results:
-                mni = result['mni_coords'] 
-                f.write(f"{mni[0]} {mni[1]} {mni[2]}\\n")
-            
-            # Lines (connections)
-            # Only show connections between top-K regions
-            connections = []
-            for i, result_i in enumerate(ranking_results):
-                if result_i['region_index'] in top_k_indices:
-                    for j, result_j in enumerate(ranking_results):
-                        if j > i and result_j['region_index'] in top_k_indices:
-                            # Add connection based on importance
-                            if (result_i['combined_importance'] > 0.5 and 
-                                result_j['combined_importance'] > 0.5):
-                                connections.append((i, j))
-            
-            f.write(f"LINES {len(connections)} {len(connections) * 3}\\n")
-            for conn in connections:
-                f.write(f"2 {conn[0]} {conn[1]}\\n")
+        # Only show connections between top-K regions with high importance
+        importance = np.array([result['combined_importance'] for result in ranking_results])
+        strong = is_top_k & (importance > 0.5)
+        connections = np.argwhere(np.triu(np.outer(strong, strong), k=1))
+        
+        write_vtk(network_file, mni_points, lines=connections, title="Brain Connectivity Network")
         
         # 3. Generate JSON metadata for ParaView
         metadata = {
@@ -9,6 +9,8 @@ import numpy as np
 import os
 from pathlib import Path
 
+from imports.mesh_io import grid_faces, read_ply, write_obj, write_ply
+
 def create_realistic_brain_ply():
     """创建真实的大脑PLY模型"""
     
@@ -18,115 +20,75 @@ def create_realistic_brain_ply():
     phi = np.linspace(0, np.pi, 50)  # 增加分辨率
     theta = np.linspace(0, 2*np.pi, 100)
     
-    vertices = []
-    faces = []
-    
-    for i, p in enumerate(phi):
-        for j, t in enumerate(theta):
-            # 基础椭球参数 (更真实的大脑比例)
-            a, b, c = 85, 110, 70  # 左右、前后、上下
-            
-            # 基础椭球坐标
-            x = a * np.sin(p) * np.cos(t)
-            y = b * np.sin(p) * np.sin(t)
-            z = c * np.cos(p)
-            
-            # 大脑形状修正 - 更真实的解剖结构
-            
-            # 1. 前额叶突出 (额叶)
-            if y > 60:  # 前部
-                y *= 1.3  # 更突出
-                z *= 0.8  # 稍微压扁
-                if z > 20:
-                    z *= 0.9
-            
-            # 2. 颞叶下垂和侧面突出
-            if abs(x) > 60 and z < 20 and abs(y) < 40:
-                z -= 35  # 向下延伸
-                x *= 1.25  # 侧面更宽
-                if x > 0:
-                    x += 10
-                else:
-                    x -= 10
-            
-            # 3. 枕叶后突 (后脑勺)
-            if y < -80:  # 后部
-                y *= 1.15
-                z *= 0.95
-                if abs(x) < 40:  # 中线区域更突出
-                    y *= 1.1
-            
-            # 4. 顶叶圆弧 (头顶)
-            if z > 40:
-                z *= 1.1  # 头顶更圆
-                if abs(x) < 50 and abs(y) < 30:
-                    z *= 1.15  # 正顶部最高
-            
-            # 5. 脑干和小脑区域 (底部)
-            if z < -30:
-                z *= 0.7  # 底部收窄
-                if abs(x) < 30 and y > -40:  # 脑干区域
-                    x *= 0.8
-                    y *= 0.8
-            
-            # 6. 左右半球分离的暗示 (纵裂)
-            if abs(x) < 3 and z > 0:  # 中线附近
-                z *= 0.98  # 轻微凹陷
-            
-            # 7. 侧脑室区域 (轻微内凹)
-            if abs(x) > 20 and abs(x) < 40 and abs(y) < 20 and z > 10:
-                distance_from_center = np.sqrt((abs(x)-30)**2 + y**2 + (z-25)**2)
-                if distance_from_center < 20:
-                    factor = 0.95 - 0.05 * np.exp(-distance_from_center/10)
-                    x *= factor
-                    y *= factor
-                    z *= factor
-            
-            # 8. 增加表面粗糙度 (皮层沟回)
-            noise_scale = 2.0
-            noise_x = noise_scale * np.sin(4*p) * np.cos(6*t)
-            noise_y = noise_scale * np.cos(3*p) * np.sin(5*t)  
-            noise_z = noise_scale * np.sin(5*p) * np.cos(4*t)
-            
-            x += noise_x
-            y += noise_y
-            z += noise_z
-            
-            vertices.append([x, y, z])
-            
-            # 创建三角面
-            if i < len(phi)-1 and j < len(theta)-1:
-                v1 = i * len(theta) + j
-                v2 = i * len(theta) + (j + 1) % len(theta)
-                v3 = (i + 1) * len(theta) + j
-                v4 = (i + 1) * len(theta) + (j + 1) % len(theta)
-                
-                # 两个三角形组成一个四边形
-                faces.append([3, v1, v2, v3])
-                faces.append([3, v2, v4, v3])
-    
-    # 保存为PLY文件
+    p, t = np.meshgrid(phi, theta, indexing='ij')
+    p, t = p.ravel(), t.ravel()
+    
+    # 基础椭球参数 (更真实的大脑比例)
+    a, b, c = 85, 110, 70  # 左右、前后、上下
+    
+    # 基础椭球坐标
+    x = a * np.sin(p) * np.cos(t)
+    y = b * np.sin(p) * np.sin(t)
+    z = c * np.cos(p)
+    
+    # 大脑形状修正 - 更真实的解剖结构 (按顺序对所有顶点批量应用)
+    
+    # 1. 前额叶突出 (额叶)
+    front = y > 60  # 前部
+    y[front] *= 1.3  # 更突出
+    z[front] *= 0.8  # 稍微压扁
+    z[front & (z > 20)] *= 0.9
+    
+    # 2. 颞叶下垂和侧面突出
+    temporal = (np.abs(x) > 60) & (z < 20) & (np.abs(y) < 40)
+    z[temporal] -= 35  # 向下延伸
+    x[temporal] *= 1.25  # 侧面更宽
+    x[temporal] += np.sign(x[temporal]) * 10
+    
+    # 3. 枕叶后突 (后脑勺)
+    back = y < -80  # 后部
+    y[back] *= 1.15
+    z[back] *= 0.95
+    y[back & (np.abs(x) < 40)] *= 1.1  # 中线区域更突出
+    
+    # 4. 顶叶圆弧 (头顶)
+    top = z > 40
+    z[top] *= 1.1  # 头顶更圆
+    z[top & (np.abs(x) < 50) & (np.abs(y) < 30)] *= 1.15  # 正顶部最高
+    
+    # 5. 脑干和小脑区域 (底部)
+    bottom = z < -30
+    z[bottom] *= 0.7  # 底部收窄
+    stem = bottom & (np.abs(x) < 30) & (y > -40)  # 脑干区域
+    x[stem] *= 0.8
+    y[stem] *= 0.8
+    
+    # 6. 左右半球分离的暗示 (纵裂)
+    z[(np.abs(x) < 3) & (z > 0)] *= 0.98  # 中线附近轻微凹陷
+    
+    # 7. 侧脑室区域 (轻微内凹)
+    distance_from_center = np.sqrt((np.abs(x)-30)**2 + y**2 + (z-25)**2)
+    ventricle = ((np.abs(x) > 20) & (np.abs(x) < 40) & (np.abs(y) < 20) & (z > 10) &
+                 (distance_from_center < 20))
+    factor = 0.95 - 0.05 * np.exp(-distance_from_center[ventricle]/10)
+    x[ventricle] *= factor
+    y[ventricle] *= factor
+    z[ventricle] *= factor
+    
+    # 8. 增加表面粗糙度 (皮层沟回)
+    noise_scale = 2.0
+    x += noise_scale * np.sin(4*p) * np.cos(6*t)
+    y += noise_scale * np.cos(3*p) * np.sin(5*t)
+    z += noise_scale * np.sin(5*p) * np.cos(4*t)
+    
+    vertices = np.stack([x, y, z], axis=1)
+    
+    # 创建三角面 (两个三角形组成一个四边形)
+    faces = grid_faces(len(phi), len(theta))
+    
+    # 保存为二进制PLY文件
     ply_path = "./figures/surfice_templates/realistic_brain.ply"
-    
-    with open(ply_path, 'w') as f:
-        f.write("ply\n")
-        f.write("format ascii 1.0\n")
-        f.write("comment Created by BrainGNN - Realistic Brain Model\n")
-        f.write(f"element vertex {len(vertices)}\n")
-        f.write("property float x\n")
-        f.write("property float y\n")
-        f.write("property float z\n")
-        f.write(f"element face {len(faces)}\n")
-        f.write("property list uchar int vertex_indices\n")
-        f.write("end_header\n")
-        
-        # 写入顶点
-        for v in vertices:
-            f.write(f"{v[0]:.6f} {v[1]:.6f} {v[2]:.6f}\n")
-        
-        # 写入面
-        for face in faces:
-            f.write(f"{face[0]} {face[1]} {face[2]} {face[3]}\n")
+    write_ply(ply_path, vertices, faces, comment="Created by BrainGNN - Realistic Brain Model")
     
     file_size = os.path.getsize(ply_path) / 1024
     print(f"✅ 真实大脑PLY创建: {ply_path} ({file_size:.1f} KB)")
@@ -162,62 +124,33 @@ def create_anatomical_brain_obj():
         [0, -20, -35], [15, -30, -40], [-15, -30, -40]
     ]
     
-    # 使用关键点生成更多顶点
-    vertices = []
-    
     # 基于关键点插值生成完整表面
     phi_vals = np.linspace(0, np.pi, 40)
     theta_vals = np.linspace(0, 2*np.pi, 80)
-    
-    for p in phi_vals:
-        for t in theta_vals:
-            # 基础形状
-            a, b, c = 80, 105, 65
-            x = a * np.sin(p) * np.cos(t)
-            y = b * np.sin(p) * np.sin(t)
-            z = c * np.cos(p)
-            
-            # 基于关键点调整形状
-            for landmark in brain_landmarks:
-                lx, ly, lz = landmark
-                distance = np.sqrt((x-lx)**2 + (y-ly)**2 + (z-lz)**2)
-                if distance < 50:  # 影响半径
-                    influence = np.exp(-distance/25)
-                    # 向关键点方向调整
-                    x += (lx - x) * influence * 0.1
-                    y += (ly - y) * influence * 0.1  
-                    z += (lz - z) * influence * 0.1
-            
-            vertices.append([x, y, z])
+    p, t = np.meshgrid(phi_vals, theta_vals, indexing='ij')
+    
+    # 基础形状
+    a, b, c = 80, 105, 65
+    vertices = np.stack([
+        (a * np.sin(p) * np.cos(t)).ravel(),
+        (b * np.sin(p) * np.sin(t)).ravel(),
+        (c * np.cos(p)).ravel()
+    ], axis=1)
+    
+    # 基于关键点调整形状 (依次对所有顶点批量调整)
+    for landmark in np.array(brain_landmarks, dtype=float):
+        distance = np.linalg.norm(vertices - landmark, axis=1)
+        influence = np.where(distance < 50, np.exp(-distance/25), 0.0)  # 影响半径
+        # 向关键点方向调整
+        vertices += (landmark - vertices) * influence[:, None] * 0.1
     
     # 生成面
-    faces = []
-    rows, cols = len(phi_vals), len(theta_vals)
-    
-    for i in range(rows-1):
-        for j in range(cols-1):
-            v1 = i * cols + j
-            v2 = i * cols + (j + 1) % cols
-            v3 = (i + 1) * cols + j
-            v4 = (i + 1) * cols + (j + 1) % cols
-            
-            faces.append([v1, v2, v3])
-            faces.append([v2, v4, v3])
+    faces = grid_faces(len(phi_vals), len(theta_vals))
     
     # 保存OBJ文件
     obj_path = "./figures/surfice_templates/realistic_brain.obj"
-    
-    with open(obj_path, 'w') as f:
-        f.write("# Realistic Brain Model for SurfIce\n")
-        f.write("# Generated by BrainGNN - Anatomically Correct\n\n")
-        
-        # 写入顶点
-        for v in vertices:
-            f.write(f"v {v[0]:.6f} {v[1]:.6f} {v[2]:.6f}\n")
-        
-        # 写入面 (OBJ格式索引从1开始)
-        for face in faces:
-            f.write(f"f {face[0]+1} {face[1]+1} {face[2]+1}\n")
+    write_obj(obj_path, vertices, faces,
+              comments=["Realistic Brain Model for SurfIce", "Generated by BrainGNN - Anatomically Correct"])
     
     file_size = os.path.getsize(obj_path) / 1024
     print(f"✅ 真实大脑OBJ创建: {obj_path} ({file_size:.1f} KB)")
@@ -236,56 +169,22 @@ def diagnose_original_brain():
         return
     
     try:
-        with open(original_file, 'r') as f:
-            lines = f.readlines()
-        
-        print(f"📋 文件总行数: {len(lines)}")
-        print(f"📋 文件头: {lines[:10]}")
-        
-        # 找到顶点数量
-        vertex_count = 0
-        face_count = 0
+        # 二进制和ASCII的PLY都可以读取
+        mesh = read_ply(original_file)
+        vertices = np.asarray(mesh.vertices)
         
-        for line in lines:
-            if line.startswith("element vertex"):
-                vertex_count = int(line.split()[-1])
-            elif line.startswith("element face"):
-                face_count = int(line.split()[-1])
-        
-        print(f"📊 顶点数量: {vertex_count}")
-        print(f"📊 面数量: {face_count}")
+        print(f"📊 顶点数量: {len(vertices)}")
+        print(f"📊 面数量: {0 if mesh.faces is None else len(mesh.faces)}")
         
         # 检查第一个顶点坐标
-        in_vertices = False
-        vertex_lines = []
-        
-        for line in lines:
-            if line.strip() == "end_header":
-                in_vertices = True
-                continue
-            if in_vertices and len(vertex_lines) < 5:
-                vertex_lines.append(line.strip())
-        
         print(f"📊 前5个顶点:")
-        for i, vline in enumerate(vertex_lines):
-            print(f"   顶点{i+1}: {vline}")
+        for i, v in enumerate(vertices[:5]):
+            print(f"   顶点{i+1}: {v[0]:.6f} {v[1]:.6f} {v[2]:.6f}")
         
         # 分析坐标范围
-        x_coords, y_coords, z_coords = [], [], []
-        
-        for line in vertex_lines[:100]:  # 分析前100个顶点
-            if line and not line.startswith('3'):  # 不是面数据
-                parts = line.split()
-                if len(parts) >= 3:
-                    try:
-                        x, y, z = float(parts[0]), float(parts[1]), float(parts[2])
-                        x_coords.append(x)
-                        y_coords.append(y)
-                        z_coords.append(z)
-                    except:
-                        pass
+        x_coords, y_coords, z_coords = vertices[:, 0], vertices[:, 1], vertices[:, 2]
         
-        if x_coords:
+        if len(vertices):
             print(f"📊 坐标范围分析:")
             print(f"   X: {min(x_coords):.1f} 到 {max(x_coords):.1f}")
             print(f"   Y: {min(y_coords):.1f} 到 {max(y_coords):.1f}")
@@ -5,6 +5,7 @@ from os import listdir
 import numpy as np
 import os.path as osp
 from imports.read_abide_stats_parall import read_data
+from imports.data_qc import load_qc_table, excluded_files, repair_non_finite
 
 
 class ABIDEDataset(InMemoryDataset):
@@ -13,6 +14,9 @@ class ABIDEDataset(InMemoryDataset):
         self.name = name
         super(ABIDEDataset, self).__init__(root,transform, pre_transform)
         self.data, self.slices = torch.load(self.processed_paths[0])
+        # Non-finite node features (e.g. data.pt processed before the QC repair) are zeroed once here
+        if not torch.isfinite(self.data.x).all():
+            self.data.x = repair_non_finite(self.data.x)
 
     @property
     def raw_file_names(self):
@@ -22,6 +26,9 @@ class ABIDEDataset(InMemoryDataset):
         return onlyfiles
     @property
     def processed_file_names(self):
+        # a pre_transform (e.g. imports/edge_precompute.PrecomputeEdgeNorm) gets its own cache file
+        if self.pre_transform is not None:
+            return 'data_{}.pt'.format(self.pre_transform.__class__.__name__)
         return  'data.pt'
 
     def download(self):
@@ -29,8 +36,9 @@ class ABIDEDataset(InMemoryDataset):
         return
 
     def process(self):
-        # Read data into huge `Data` list.
-        self.data, self.slices = read_data(self.raw_dir)
+        # Read data into huge `Data` list, skipping samples the QC table (scripts/qc.py) excludes
+        exclude = excluded_files(load_qc_table(self.raw_dir))
+        self.data, self.slices = read_data(self.raw_dir, exclude=exclude)
 
         if self.pre_filter is not None:
             data_list = [self.get(idx) for idx in range(len(self))]
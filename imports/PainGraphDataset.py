@@ -2,26 +2,52 @@ import os
 import torch
 from torch_geometric.data import Dataset, Data
 
+from imports.graph_attributes import GraphAttributeStore
+from imports.data_qc import load_qc_table, excluded_files, needs_repair, repair_non_finite
+from imports.node_features import NodeFeatureStore
+
 class PainGraphDataset(Dataset):
-    def __init__(self, root_dir):
-        super().__init__()
+    def __init__(self, root_dir, node_features=None, transform=None):
+        # transform: applied to every graph as it is loaded (e.g. imports/edge_precompute.PrecomputeEdgeNorm)
+        super().__init__(transform=transform)
         self.root_dir = root_dir
         self.pt_files = []
+        # QC table written by scripts/qc.py: exclude / repair without test-loading every file
+        self.qc_table = load_qc_table(root_dir)
         
-        # Filter for valid .pt files
-        for f in os.listdir(root_dir):
-            if f.endswith('.pt'):
-                file_path = os.path.join(root_dir, f)
-                try:
-                    # Test if the file can be loaded
-                    test_data = torch.load(file_path)
-                    if hasattr(test_data, 'x') and hasattr(test_data, 'y'):
-                        self.pt_files.append(file_path)
-                except:
-                    print(f"Skipping corrupted file: {f}")
-                    continue
+        if self.qc_table is not None:
+            excluded = excluded_files(self.qc_table)
+            names = [f for f in os.listdir(root_dir) if f.endswith('.pt') and f not in excluded]
+            # Graphs added after the last scan are kept (unchecked) rather than dropped
+            unscanned = [f for f in names if f not in self.qc_table]
+            if unscanned:
+                print(f"⚠️ {len(unscanned)} graph files are not in the QC table, loaded without QC "
+                      f"(re-run scripts/qc.py): {', '.join(sorted(unscanned)[:5])}{' ...' if len(unscanned) > 5 else ''}")
+            self.pt_files = [os.path.join(root_dir, f) for f in names]
+        else:
+            # Filter for valid .pt files
+            for f in os.listdir(root_dir):
+                if f.endswith('.pt'):
+                    file_path = os.path.join(root_dir, f)
+                    try:
+                        # Test if the file can be loaded
+                        test_data = torch.load(file_path, weights_only=False)
+                        if hasattr(test_data, 'x') and hasattr(test_data, 'y'):
+                            self.pt_files.append(file_path)
+                    except:
+                        print(f"Skipping corrupted file: {f}")
+                        continue
         
         self.pt_files.sort()
+        # Per-sample attributes patched through the sidecar table (task_type, dataset, ...)
+        self.attributes = GraphAttributeStore.open_if_exists(root_dir)
+        # Node features from the feature store (e.g. ['mean', 'fc_rows']) replace the x saved in the graphs
+        self.node_features = list(node_features) if node_features else None
+        self.feature_store = None
+        if self.node_features:
+            self.feature_store = NodeFeatureStore(root_dir)
+            failed = self.feature_store.compute(self.node_features, self.pt_files)
+            self.pt_files = [f for f in self.pt_files if os.path.basename(f) not in failed]
         print(f"Loaded {len(self.pt_files)} valid graph files")
 
     def len(self):
@@ -29,7 +55,16 @@ class PainGraphDataset(Dataset):
 
     def get(self, idx):
         file_path = self.pt_files[idx]
-        data = torch.load(file_path)
+        # Graphs are pickled PyG Data objects, which the weights_only loader (torch >= 2.6 default) rejects
+        data = torch.load(file_path, weights_only=False)
+        if self.attributes is not None:
+            data = self.attributes.attach(data, file_path)
+        if self.feature_store is not None:
+            data.x = self.feature_store.assemble(file_path, self.node_features)
+        if needs_repair(self.qc_table, file_path):
+            data.x = repair_non_finite(data.x)
+            if getattr(data, 'edge_attr', None) is not None:
+                data.edge_attr = repair_non_finite(data.edge_attr)
         # Ensure 'pos' attribute exists and is not None, as it's required by MyNNConv
         if not hasattr(data, 'pos') or data.pos is None:
             data.pos = torch.eye(data.x.size(0))
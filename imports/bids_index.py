@@ -0,0 +1,273 @@
+'''
+Cached layout index of a BIDS pain dataset (ds000140, ds003836, ds005413).
+
+One filesystem walk fills a sqlite database at <dataset_dir>/layout_index.sqlite:
+
+    participants  subject, attributes (participants.tsv row as JSON)
+    runs          run_id, subject, base, path, n_vols, shape, tr, events_path,
+                  file size / mtime of the BOLD file
+    events        run_id, trial_index, onset, duration, trial_type,
+                  start_vol, end_vol, attributes (events.tsv row as JSON)
+
+BOLD shape and TR come from the NIfTI header only (no voxel data is read).
+Event volume windows use the run's own TR: start_vol = onset // TR,
+end_vol = (onset + duration) // TR.
+
+Re-indexing is incremental: the update is a directory listing plus one
+stat per file, and a BOLD or events file is only re-read when its size or
+mtime changed. load_layout_index(update=False) skips even that and only
+queries the cached database.
+'''
+
+import os
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import nibabel as nib
+from nibabel.openers import ImageOpener
+
+INDEX_NAME = 'layout_index.sqlite'
+BOLD_SUFFIXES = ('_bold.nii.gz', '_bold.nii')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS participants (
+    subject TEXT PRIMARY KEY,
+    attributes TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT,
+    base TEXT,
+    path TEXT UNIQUE,
+    n_vols INTEGER,
+    nx INTEGER, ny INTEGER, nz INTEGER,
+    tr REAL,
+    file_size INTEGER,
+    mtime REAL,
+    events_path TEXT,
+    events_size INTEGER,
+    events_mtime REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    run_id INTEGER,
+    trial_index INTEGER,
+    onset REAL,
+    duration REAL,
+    trial_type TEXT,
+    start_vol INTEGER,
+    end_vol INTEGER,
+    attributes TEXT
+);
+CREATE INDEX IF NOT EXISTS events_run ON events (run_id);
+'''
+
+
+def volume_window(onset, duration, tr):
+    """(start_vol, end_vol) of an event, the convention used by the graph builders"""
+    return int(onset // tr), int((onset + duration) // tr)
+
+
+def read_bold_header(path):
+    """(shape, TR in seconds) from the NIfTI header only; TR is None when the header has none"""
+    try:
+        with ImageOpener(path) as f:
+            header = nib.Nifti1Header.from_fileobj(f)
+    except Exception:
+        header = nib.load(path).header
+
+    shape = tuple(int(n) for n in header.get_data_shape())
+    zooms = header.get_zooms()
+    tr = float(zooms[3]) if len(zooms) > 3 and zooms[3] > 0 else None
+    if tr is not None and header.get_xyzt_units()[1] == 'msec':
+        tr /= 1000.0
+    return shape, tr
+
+
+def _json_row(row):
+    """JSON of a pandas row with NaN as null"""
+    return json.dumps({key: (None if isinstance(value, float) and np.isnan(value) else value)
+                       for key, value in row.items()}, default=str)
+
+
+def _to_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnan(value) else value
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def _walk_bold_files(dataset_dir):
+    """(subject, base, bold path, events path or None) for every run, in sorted order"""
+    with os.scandir(dataset_dir) as entries:
+        subjects = sorted(e.name for e in entries if e.name.startswith('sub-') and e.is_dir())
+    for subject in subjects:
+        func_dir = os.path.join(dataset_dir, subject, 'func')
+        if not os.path.isdir(func_dir):
+            continue
+        names = sorted(os.listdir(func_dir))
+        name_set = set(names)
+        for name in names:
+            suffix = next((s for s in BOLD_SUFFIXES if name.endswith(s)), None)
+            if suffix is None:
+                continue
+            base = name[:-len(suffix)]
+            events_name = base + '_events.tsv'
+            events_path = os.path.join(func_dir, events_name) if events_name in name_set else None
+            yield subject, base, os.path.join(func_dir, name), events_path
+
+
+def _index_events(conn, run_id, events_path, tr):
+    conn.execute('DELETE FROM events WHERE run_id = ?', (run_id,))
+    if events_path is None:
+        return
+    try:
+        events = pd.read_csv(events_path, sep='\t')
+    except Exception as e:
+        print(f"❌ Failed to read {events_path}: {e}")
+        return
+
+    rows = []
+    for idx, row in zip(events.index, events.to_dict('records')):
+        onset = _to_float(row.get('onset'))
+        duration = _to_float(row.get('duration'))
+        start_vol = end_vol = None
+        if tr and onset is not None and duration is not None:
+            start_vol, end_vol = volume_window(onset, duration, tr)
+        trial_type = row.get('trial_type')
+        rows.append((run_id, int(idx), onset, duration, None if pd.isna(trial_type) else str(trial_type),
+                     start_vol, end_vol, _json_row(row)))
+    conn.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def build_layout_index(dataset_dir, db_path=None, refresh=False):
+    """Create / incrementally update the index of dataset_dir; returns the database path"""
+    db_path = db_path or os.path.join(dataset_dir, INDEX_NAME)
+    if refresh and os.path.exists(db_path):
+        os.remove(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(_SCHEMA)
+    known = {row[0]: row[1:] for row in conn.execute(
+        'SELECT path, run_id, file_size, mtime, events_path, events_size, events_mtime, tr FROM runs')}
+    seen = set()
+
+    with conn:
+        participants_path = os.path.join(dataset_dir, 'participants.tsv')
+        if os.path.exists(participants_path):
+            participants = pd.read_csv(participants_path, sep='\t')
+            conn.execute('DELETE FROM participants')
+            conn.executemany('INSERT INTO participants VALUES (?, ?)',
+                             [(str(row['participant_id']), _json_row(row))
+                              for row in participants.to_dict('records')])
+
+        for subject, base, path, events_path in _walk_bold_files(dataset_dir):
+            seen.add(path)
+            size, mtime = _stat(path)
+            events_size, events_mtime = _stat(events_path) if events_path else (None, None)
+            previous = known.get(path)
+
+            if previous is not None and previous[1:3] == (size, mtime):
+                run_id, tr = previous[0], previous[6]
+                if previous[3:6] != (events_path, events_size, events_mtime):
+                    _index_events(conn, run_id, events_path, tr)
+                    conn.execute('UPDATE runs SET events_path = ?, events_size = ?, events_mtime = ? '
+                                 'WHERE run_id = ?', (events_path, events_size, events_mtime, run_id))
+                continue
+
+            try:
+                shape, tr = read_bold_header(path) if size > 0 else ((), None)
+            except Exception as e:
+                print(f"❌ Failed to read header of {path}: {e}")
+                shape, tr = (), None
+            dims = (list(shape) + [None] * 4)[:4]
+
+            if previous is not None:
+                conn.execute('DELETE FROM runs WHERE run_id = ?', (previous[0],))
+                conn.execute('DELETE FROM events WHERE run_id = ?', (previous[0],))
+            cursor = conn.execute(
+                'INSERT INTO runs (subject, base, path, n_vols, nx, ny, nz, tr, file_size, mtime, '
+                'events_path, events_size, events_mtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (subject, base, path, dims[3], dims[0], dims[1], dims[2], tr, size, mtime,
+                 events_path, events_size, events_mtime))
+            _index_events(conn, cursor.lastrowid, events_path, tr)
+
+        # Runs whose BOLD file disappeared
+        for path, previous in known.items():
+            if path not in seen:
+                conn.execute('DELETE FROM runs WHERE run_id = ?', (previous[0],))
+                conn.execute('DELETE FROM events WHERE run_id = ?', (previous[0],))
+
+    conn.close()
+    return db_path
+
+
+class LayoutIndex:
+    """Read-only queries on a layout index database"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _query(self, sql, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+    def participants(self):
+        """participants.tsv as a DataFrame indexed by subject"""
+        frame = self._query('SELECT subject, attributes FROM participants ORDER BY subject')
+        rows = [json.loads(attributes) for attributes in frame['attributes']]
+        return pd.DataFrame(rows, index=pd.Index(frame['subject'], name='subject'))
+
+    def runs(self, subject=None, suffix=None):
+        """Runs (one row per BOLD file) in subject / file-name order"""
+        sql = 'SELECT * FROM runs'
+        params = []
+        if subject is not None:
+            sql += ' WHERE subject = ?'
+            params.append(subject)
+        runs = self._query(sql + ' ORDER BY path', params)
+        if suffix is not None:
+            runs = runs[runs['path'].str.endswith(suffix)]
+        return runs.reset_index(drop=True)
+
+    def events(self, run_id=None, subject=None, expand=False):
+        """Event rows with their volume windows, joined with subject / path / n_vols / tr of the run.
+
+        expand=True adds every events.tsv column (e.g. pain_rating) from the JSON attributes.
+        """
+        sql = ('SELECT e.*, r.subject, r.base, r.path, r.events_path, r.n_vols, r.tr FROM events e '
+               'JOIN runs r ON e.run_id = r.run_id')
+        conditions, params = [], []
+        if run_id is not None:
+            conditions.append('e.run_id = ?')
+            params.append(int(run_id))
+        if subject is not None:
+            conditions.append('r.subject = ?')
+            params.append(subject)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        events = self._query(sql + ' ORDER BY r.path, e.trial_index', params)
+
+        if expand and len(events):
+            extra = pd.DataFrame([json.loads(a) for a in events['attributes']], index=events.index)
+            extra = extra.drop(columns=[c for c in extra.columns if c in events.columns])
+            events = pd.concat([events, extra], axis=1)
+        return events
+
+
+def load_layout_index(dataset_dir, db_path=None, refresh=False, update=True):
+    """LayoutIndex of dataset_dir; builds the cache if needed and, with update=True, refreshes it"""
+    db_path = db_path or os.path.join(dataset_dir, INDEX_NAME)
+    if update or refresh or not os.path.exists(db_path):
+        build_layout_index(dataset_dir, db_path=db_path, refresh=refresh)
+    return LayoutIndex(db_path)
@@ -0,0 +1,232 @@
+'''
+Asynchronous checkpoints with top-k retention and resume.
+
+CheckpointManager copies the state to CPU on the calling thread (so the
+training loop can keep updating the weights) and writes it from one
+background thread: torch.save to <file>.tmp, then os.replace, so a file
+on disk is always complete. Writes run in submission order.
+
+    <directory>/epoch{E:04d}.pt     top_k checkpoints by the monitored metric
+    <directory>/last.pt             latest state for resume (every save_last_every epochs)
+    <directory>/checkpoints.json    index of the top-k checkpoints (best first), last and metadata
+    weights_path                    optional plain state_dict of the best model (model.load_state_dict)
+
+A checkpoint holds the model / optimizer / scheduler state dicts, the
+Python / NumPy / torch (and CUDA) RNG states, the epoch, the metrics, the
+config metadata and any extra loop state.
+'''
+
+import os
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+INDEX_FILE = 'checkpoints.json'
+LAST_FILE = 'last.pt'
+
+
+def cpu_state(state):
+    """Copy of a (nested) state dict with every tensor cloned to CPU"""
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: cpu_state(value) for key, value in state.items()}
+    if isinstance(state, list):
+        return [cpu_state(value) for value in state]
+    if isinstance(state, tuple):
+        return tuple(cpu_state(value) for value in state)
+    return state
+
+
+def rng_state():
+    state = {'python': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def _write(obj, path):
+    tmp_path = path + '.tmp'
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(obj, path):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(obj, f, indent=2, default=str)
+    os.replace(path + '.tmp', path)
+
+
+def _load(path, map_location):
+    # Checkpoints hold NumPy / Python RNG states, which the weights_only loader rejects
+    return torch.load(path, map_location=map_location, weights_only=False)
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class CheckpointManager:
+    """Top-k / last / best-weights checkpoints of one training run
+
+    Args:
+        directory: run directory for the top-k and last checkpoints, or None for best weights only
+        monitor, mode: metric ranking the checkpoints ('max' / 'min'; None: set by Trainer.fit)
+        top_k: number of ranked checkpoints kept
+        save_last_every: write last.pt every N epochs (0: never)
+        weights_path: where to export the state_dict of the best model
+        metadata: config stored with every checkpoint (e.g. vars(args))
+    """
+
+    def __init__(self, directory=None, monitor=None, mode=None, top_k=3, save_last_every=1,
+                 weights_path=None, metadata=None):
+        self.directory = directory
+        self.monitor = monitor
+        self.mode = mode or ('min' if monitor and monitor.endswith('loss') else 'max')
+        self.top_k = top_k if directory else 0
+        self.save_last_every = save_last_every if directory else 0
+        self.weights_path = weights_path
+        self.metadata = metadata or {}
+        self.entries = []
+        self.best_score = None
+        self.last_epoch = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+        for path in (directory, os.path.dirname(weights_path) if weights_path else None):
+            if path:
+                os.makedirs(path, exist_ok=True)
+        if directory and os.path.exists(self._path(INDEX_FILE)):
+            with open(self._path(INDEX_FILE)) as f:
+                index = json.load(f)
+            self.entries = index.get('checkpoints', [])
+            self.best_score = index.get('best_score')
+            self.last_epoch = index.get('last_epoch')
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def set_monitor(self, monitor, mode):
+        if self.monitor is None:
+            self.monitor, self.mode = monitor, mode
+
+    def _better(self, score, than):
+        return than is None or (score < than if self.mode == 'min' else score > than)
+
+    def _submit(self, fn, *args):
+        self._pending = [f for f in self._pending if not f.done() or f.exception() is not None]
+        self._pending.append(self._executor.submit(fn, *args))
+
+    def snapshot(self, model, optimizer=None, scheduler=None, epoch=None, metrics=None, state=None):
+        """CPU copy of everything needed to resume"""
+        return {
+            'epoch': epoch,
+            'model': cpu_state(model.state_dict()),
+            'optimizer': cpu_state(optimizer.state_dict()) if optimizer is not None else None,
+            'scheduler': cpu_state(scheduler.state_dict()) if scheduler is not None else None,
+            'rng': rng_state(),
+            'metrics': {k: v for k, v in (metrics or {}).items() if isinstance(v, (int, float, bool, str))},
+            'metadata': self.metadata,
+            'state': cpu_state(state or {}),
+        }
+
+    def save(self, model, optimizer=None, scheduler=None, epoch=None, metrics=None, state=None):
+        """Queue the checkpoints due after epoch (1-based); returns True if metrics are a new best
+
+        Nothing is copied when no file is due.
+        """
+        metrics = metrics or {}
+        score = metrics.get(self.monitor)
+        is_best = score is not None and self._better(score, self.best_score)
+        ranked = (score is not None and self.top_k > 0 and
+                  (len(self.entries) < self.top_k or self._better(score, self.entries[-1]['score'])))
+        last = self.save_last_every > 0 and epoch is not None and epoch % self.save_last_every == 0
+        if not (ranked or last or (is_best and self.weights_path)):
+            return is_best
+
+        snapshot = self.snapshot(model, optimizer, scheduler, epoch, metrics, state)
+        if is_best:
+            self.best_score = score
+            if self.weights_path:
+                self._submit(_write, snapshot['model'], self.weights_path)
+        if ranked:
+            name = f'epoch{epoch:04d}.pt'
+            self._submit(_write, snapshot, self._path(name))
+            self.entries = [e for e in self.entries if e['file'] != name]
+            self.entries.append({'file': name, 'epoch': epoch, 'score': score, 'metrics': snapshot['metrics']})
+            self.entries.sort(key=lambda e: e['score'], reverse=self.mode == 'max')
+            for entry in self.entries[self.top_k:]:
+                self._submit(_remove, self._path(entry['file']))
+            self.entries = self.entries[:self.top_k]
+        if last:
+            self.last_epoch = epoch
+            self._submit(_write, snapshot, self._path(LAST_FILE))
+        if self.directory:
+            index = {'monitor': self.monitor, 'mode': self.mode, 'best_score': self.best_score,
+                     'checkpoints': [dict(e) for e in self.entries],
+                     'last_epoch': self.last_epoch, 'metadata': self.metadata}
+            self._submit(_write_json, index, self._path(INDEX_FILE))
+        return is_best
+
+    def wait(self):
+        """Block until every queued write is on disk; re-raises write errors"""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+    def best_path(self):
+        """Path of the best ranked checkpoint (or the exported weights), None if nothing was saved"""
+        self.wait()
+        if self.entries:
+            return self._path(self.entries[0]['file'])
+        if self.weights_path and os.path.exists(self.weights_path):
+            return self.weights_path
+        return None
+
+    def best_state_dict(self, map_location='cpu'):
+        """Model state_dict of the best saved checkpoint, None if nothing was saved"""
+        path = self.best_path()
+        if path is None:
+            return None
+        checkpoint = _load(path, map_location)
+        return checkpoint['model'] if path != self.weights_path else checkpoint
+
+    def load_best(self, model, map_location='cpu'):
+        """Load the best saved weights into model; returns model"""
+        state_dict = self.best_state_dict(map_location)
+        if state_dict is None:
+            raise FileNotFoundError('No checkpoint has been saved yet')
+        model.load_state_dict(state_dict)
+        return model
+
+    def resume(self, model, optimizer=None, scheduler=None, map_location='cpu', restore_rng=True):
+        """(epochs done, loop state) after loading last.pt; (0, {}) if there is nothing to resume"""
+        path = self._path(LAST_FILE) if self.directory else None
+        if path is None or not os.path.exists(path):
+            return 0, {}
+        checkpoint = _load(path, map_location)
+        model.load_state_dict(checkpoint['model'])
+        if optimizer is not None and checkpoint['optimizer'] is not None:
+            optimizer.load_state_dict(checkpoint['optimizer'])
+        if scheduler is not None and checkpoint['scheduler'] is not None:
+            scheduler.load_state_dict(checkpoint['scheduler'])
+        if restore_rng:
+            set_rng_state(checkpoint['rng'])
+        print(f"♻️ Resumed from {path} (epoch {checkpoint['epoch']})")
+        return checkpoint['epoch'], checkpoint['state']
@@ -0,0 +1,202 @@
+'''
+Data-quality checks for connectivity matrices and graph files.
+
+scan_file() runs vectorized checks on one ABIDE .h5 raw file (every 2-D
+array in it, e.g. pcorr / corr), one .npy FC file or one .pt graph.
+run_qc() streams a list of files through a process pool and
+write_qc_table() stores one row per file as <dir>/qc_table.csv.
+
+Per array <name>:
+    <name>_shape           shape
+    <name>_nan / _posinf / _neginf
+                           non-finite counts
+    <name>_min / _max      range of the finite values
+    <name>_sym_err         max |A - A^T| over finite entries (square only)
+    <name>_diag_min / _diag_max
+                           diagonal range (square only)
+    <name>_degenerate      ROIs (rows) with no finite value, or with a
+                           constant off-diagonal row (square only)
+
+status is 'exclude' (unreadable, empty, all values non-finite, every ROI
+degenerate, graphs without y or with edge indices out of range), 'repair'
+(some non-finite values, fixed by fix_inf_nan_matrix / repair_non_finite)
+or 'ok'.
+'''
+
+import os
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+QC_TABLE_NAME = 'qc_table.csv'
+QC_EXTENSIONS = ('.h5', '.npy', '.pt')
+
+
+def fix_inf_nan_matrix(matrix, diagonal_value=1.0):
+    """nan -> 0, +inf -> 1, -inf -> -1 and the diagonal set to diagonal_value ([R, R] or [..., R, R])"""
+    fixed_matrix = np.nan_to_num(np.array(matrix, copy=True), nan=0.0, posinf=1.0, neginf=-1.0)
+    if fixed_matrix.ndim >= 2 and fixed_matrix.shape[-1] == fixed_matrix.shape[-2]:
+        n = fixed_matrix.shape[-1]
+        fixed_matrix[..., np.arange(n), np.arange(n)] = diagonal_value
+    return fixed_matrix
+
+
+def repair_non_finite(tensor, value=0.0):
+    """Node features with every nan / inf replaced by value (torch tensor or numpy array)"""
+    if hasattr(tensor, 'nan_to_num'):
+        return tensor.nan_to_num(nan=value, posinf=value, neginf=value)
+    return np.nan_to_num(tensor, nan=value, posinf=value, neginf=value)
+
+
+def matrix_checks(matrix, name):
+    """QC columns of one array [R, C] or stacked arrays [..., R, C]"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    row = {f'{name}_shape': 'x'.join(map(str, matrix.shape))}
+    if matrix.size == 0:
+        row[f'{name}_empty'] = True
+        return row
+
+    finite = np.isfinite(matrix)
+    row[f'{name}_nan'] = int(np.isnan(matrix).sum())
+    row[f'{name}_posinf'] = int(np.isposinf(matrix).sum())
+    row[f'{name}_neginf'] = int(np.isneginf(matrix).sum())
+    row[f'{name}_min'] = float(matrix[finite].min()) if finite.any() else np.nan
+    row[f'{name}_max'] = float(matrix[finite].max()) if finite.any() else np.nan
+
+    if matrix.ndim < 2:
+        return row
+
+    # Rows without any finite value
+    degenerate = ~finite.any(axis=-1)
+
+    if matrix.shape[-1] == matrix.shape[-2]:
+        n = matrix.shape[-1]
+        zeroed = np.where(finite, matrix, 0.0)
+        both_finite = finite & np.swapaxes(finite, -1, -2)
+        row[f'{name}_sym_err'] = float(np.where(both_finite, np.abs(zeroed - np.swapaxes(zeroed, -1, -2)), 0).max())
+
+        diagonal = matrix[..., np.arange(n), np.arange(n)]
+        finite_diagonal = diagonal[np.isfinite(diagonal)]
+        row[f'{name}_diag_min'] = float(finite_diagonal.min()) if finite_diagonal.size else np.nan
+        row[f'{name}_diag_max'] = float(finite_diagonal.max()) if finite_diagonal.size else np.nan
+
+        # Constant off-diagonal rows carry no connectivity information
+        off_diagonal = finite & ~np.eye(n, dtype=bool)
+        row_max = np.where(off_diagonal, matrix, -np.inf).max(axis=-1)
+        row_min = np.where(off_diagonal, matrix, np.inf).min(axis=-1)
+        degenerate |= ~off_diagonal.any(axis=-1) | (row_max == row_min)
+
+    row[f'{name}_degenerate'] = int(degenerate.sum())
+    row[f'{name}_all_degenerate'] = bool(degenerate.all())
+    row[f'{name}_all_nonfinite'] = not finite.any()
+    return row
+
+
+def _arrays_h5(path):
+    import deepdish as dd
+    content = dd.io.load(path)
+    return {key: np.asarray(value) for key, value in content.items()
+            if isinstance(value, np.ndarray) and value.ndim == 2}, {}
+
+
+def _arrays_npy(path):
+    return {'fc': np.load(path, mmap_mode='r')}, {}
+
+
+def _arrays_pt(path):
+    import torch
+    # Graphs are pickled PyG Data objects, which the weights_only loader (torch >= 2.6 default) rejects
+    data = torch.load(path, weights_only=False)
+    arrays = {'x': data.x.numpy()}
+    extra = {'num_nodes': int(data.x.size(0)), 'has_y': getattr(data, 'y', None) is not None}
+    if getattr(data, 'edge_attr', None) is not None:
+        arrays['edge_attr'] = data.edge_attr.reshape(len(data.edge_attr), -1).numpy()
+    if getattr(data, 'edge_index', None) is not None:
+        edge_index = data.edge_index
+        extra['num_edges'] = int(edge_index.size(1))
+        extra['edge_index_out_of_range'] = bool(
+            edge_index.numel() > 0 and (int(edge_index.min()) < 0 or int(edge_index.max()) >= data.x.size(0)))
+    return arrays, extra
+
+
+_READERS = {'.h5': _arrays_h5, '.npy': _arrays_npy, '.pt': _arrays_pt}
+
+
+def scan_file(path):
+    """QC row of one .h5 / .npy / .pt file (never raises: errors give status 'exclude')"""
+    extension = os.path.splitext(path)[1]
+    row = {'file': os.path.basename(path), 'kind': extension.lstrip('.'), 'status': 'ok', 'error': ''}
+    try:
+        arrays, extra = _READERS[extension](path)
+        row.update(extra)
+        for name, array in arrays.items():
+            row.update(matrix_checks(array, name))
+    except Exception as e:
+        row.update(status='exclude', error=f'{type(e).__name__}: {e}')
+        return row
+
+    reasons = [key for key, value in row.items()
+               if key.endswith(('_empty', '_all_nonfinite', '_all_degenerate', 'edge_index_out_of_range')) and value]
+    if row.get('has_y') is False:
+        reasons.append('missing_y')
+    if not arrays:
+        reasons.append('no_arrays')
+    if reasons:
+        row.update(status='exclude', error=' '.join(reasons))
+    elif any(row[key] for key in row if key.endswith(('_nan', '_posinf', '_neginf'))):
+        row['status'] = 'repair'
+    return row
+
+
+def list_qc_files(paths, extensions=QC_EXTENSIONS):
+    """Files to scan from a mix of file and directory paths"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(extensions))
+        elif path.endswith(extensions):
+            files.append(path)
+    return files
+
+
+def run_qc(files, num_workers=None, chunksize=None):
+    """QC rows of every file, scanned in a process pool (in input order)"""
+    workers = num_workers or os.cpu_count() or 1
+    if workers == 1 or len(files) <= 1:
+        return [scan_file(f) for f in files]
+    chunksize = chunksize or max(1, len(files) // (8 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(scan_file, files, chunksize=chunksize))
+
+
+def write_qc_table(rows, path):
+    """CSV with one row per file and the union of all QC columns"""
+    fieldnames = []
+    for row in rows:
+        fieldnames.extend(key for key in row if key not in fieldnames)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_qc_table(path):
+    """{file name: row} of a QC table, or None when there is no table"""
+    if os.path.isdir(path):
+        path = os.path.join(path, QC_TABLE_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, newline='') as f:
+        return {row['file']: row for row in csv.DictReader(f)}
+
+
+def excluded_files(table):
+    return {fname for fname, row in (table or {}).items() if row['status'] == 'exclude'}
+
+
+def needs_repair(table, fname):
+    return table is not None and table.get(os.path.basename(fname), {}).get('status') == 'repair'
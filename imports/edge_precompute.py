@@ -0,0 +1,43 @@
+'''
+Dataset-level precomputation of the first MyNNConv layer's edge inputs.
+
+MyNNConv adds the self loops to every graph on every forward, and the
+first layer's edge softmax only depends on the input graph (edge_attr),
+so it comes out identical every epoch. PrecomputeEdgeNorm does both once
+per graph:
+
+    edge_index   self loops added (add_remaining_self_loops, fill 1) and the
+                 edges sorted by target node (CSR order; batching keeps it)
+    edge_attr    [E, 1] weights in the same order, loop weights included
+    edge_norm    [E] softmax of edge_attr over the incoming edges of each node
+
+Network.forward(..., edge_norm=data.edge_norm) (Trainer's forward_network
+passes it when present) feeds edge_norm to conv1 instead of the softmax,
+and tells every conv that the loops are already there. The pooled graphs
+keep the loops, so conv2 / conv3 skip add_remaining_self_loops too and
+only recompute the softmax on the remaining edges.
+
+    ABIDEDataset(root, 'ABIDE', pre_transform=PrecomputeEdgeNorm())   cached in processed/data_PrecomputeEdgeNorm.pt
+    PainGraphDataset(root_dir, transform=PrecomputeEdgeNorm())        graphs are read lazily: applied on load
+'''
+
+import torch
+from torch_geometric.transforms import BaseTransform
+from torch_geometric.utils import add_remaining_self_loops, softmax
+
+
+class PrecomputeEdgeNorm(BaseTransform):
+    """Self loops, target-sorted (CSR) edges and layer-1 normalised edge weights of one graph"""
+
+    def forward(self, data):
+        num_nodes = data.num_nodes
+        edge_weight = data.edge_attr.view(-1) if data.edge_attr is not None else None
+        edge_index, edge_weight = add_remaining_self_loops(data.edge_index, edge_weight, 1, num_nodes)
+        if edge_weight is None:
+            edge_weight = torch.ones(edge_index.size(1))
+
+        perm = torch.sort(edge_index[1] * num_nodes + edge_index[0]).indices
+        data.edge_index = edge_index[:, perm]
+        data.edge_attr = edge_weight[perm].view(-1, 1)
+        data.edge_norm = softmax(data.edge_attr.view(-1).float(), data.edge_index[1], num_nodes=num_nodes)
+        return data
@@ -0,0 +1,193 @@
+'''
+Sidecar attribute table for directories of graph .pt files.
+
+Small per-sample attributes (task_type, dataset, cached labels, ...) live
+in one versioned JSON table next to the graphs instead of inside every
+.pt file. Changing them is a column update on the table, and the values
+are merged into the Data objects when the dataset loads them.
+
+Layout of <root_dir>/graph_attributes.json:
+
+    {
+      "schema_version": 2,
+      "history": [{"version": 1, "name": "...", "applied_at": "..."}, ...],
+      "attached": ["task_type", "dataset"],
+      "rows": {"sub-01_run-1.pt": {"task_type": 1, "_migrations": [...]}, ...}
+    }
+
+Migrations are identified by name and applied once per file, so graphs
+merged into the directory later only get the migrations they are missing.
+A migration either
+    * only reads the table row (column patch, no file is opened),
+    * reads each graph (reads_data=True, run in a process pool, the graph
+      files are not rewritten), or
+    * rewrites each graph (rewrite=True, process pool, atomic replace),
+      for changes that really have to touch the tensors.
+'''
+
+import os
+import json
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+
+SIDECAR_NAME = 'graph_attributes.json'
+
+
+class Migration:
+    """One named schema step.
+
+    Args:
+        name: unique name, recorded in the table history
+        fn: fn(fname, row) -> {column: value}, or fn(fname, row, data) when
+            reads_data / rewrite is set (rewrite migrations modify data in place)
+        reads_data: fn needs the loaded graph
+        rewrite: fn modifies the graph, which is saved back to its file
+        attach: columns written by fn are merged into Data at load time
+    """
+
+    def __init__(self, name, fn, reads_data=False, rewrite=False, attach=True):
+        self.name = name
+        self.fn = fn
+        self.reads_data = reads_data or rewrite
+        self.rewrite = rewrite
+        self.attach = attach
+
+
+def _load_and_apply(job):
+    """Process-pool worker: (fname, error) or (fname, column updates)"""
+    fn, path, row, rewrite = job
+    fname = os.path.basename(path)
+    try:
+        # Graphs are pickled PyG Data objects, which the weights_only loader (torch >= 2.6 default) rejects
+        data = torch.load(path, weights_only=False)
+        if not rewrite:
+            return fname, fn(fname, row, data), None
+        fn(fname, row, data)
+        tmp_path = path + '.tmp'
+        torch.save(data, tmp_path)
+        os.replace(tmp_path, path)
+        return fname, {}, None
+    except Exception as e:
+        return fname, {}, str(e)
+
+
+class GraphAttributeStore:
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.path = os.path.join(root_dir, SIDECAR_NAME)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                table = json.load(f)
+        else:
+            table = {'schema_version': 0, 'history': [], 'attached': [], 'rows': {}}
+        self.schema_version = table['schema_version']
+        self.history = table['history']
+        self.attached = table['attached']
+        self.rows = table['rows']
+
+    @classmethod
+    def open_if_exists(cls, root_dir):
+        """Store of root_dir, or None when it has no sidecar table"""
+        if os.path.exists(os.path.join(root_dir, SIDECAR_NAME)):
+            return cls(root_dir)
+        return None
+
+    def files(self):
+        return sorted(f for f in os.listdir(self.root_dir) if f.endswith('.pt'))
+
+    def row(self, fname):
+        return self.rows.setdefault(fname, {})
+
+    def column(self, name):
+        """{fname: value} of one column"""
+        return {fname: row[name] for fname, row in self.rows.items() if name in row}
+
+    def set_column(self, name, values, attach=True):
+        """Column update from a {fname: value} dict"""
+        for fname, value in values.items():
+            self.row(fname)[name] = value
+        if attach and name not in self.attached:
+            self.attached.append(name)
+
+    def save(self):
+        """Atomic write of the table"""
+        table = {
+            'schema_version': self.schema_version,
+            'history': self.history,
+            'attached': self.attached,
+            'rows': self.rows,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(table, f)
+        os.replace(tmp_path, self.path)
+
+    def attach(self, data, fname):
+        """Merge the attached columns of fname into a Data object (numbers become [1] tensors)"""
+        row = self.rows.get(os.path.basename(fname))
+        if not row:
+            return data
+        for name in self.attached:
+            if name not in row:
+                continue
+            value = row[name]
+            if isinstance(value, bool):
+                value = torch.tensor([value])
+            elif isinstance(value, int):
+                value = torch.tensor([value], dtype=torch.long)
+            elif isinstance(value, float):
+                value = torch.tensor([value], dtype=torch.float)
+            setattr(data, name, value)
+        return data
+
+    def migrate(self, migrations, num_workers=None):
+        """Apply every migration to the files that have not had it yet; returns failed files
+
+        A file that fails a migration is skipped by the later migrations of the same call
+        (they may depend on its columns), and a step with failures is not recorded in the
+        history until a re-run applies it to every file.
+        """
+        files = self.files()
+        failed = {}
+
+        for migration in migrations:
+            pending = [f for f in files
+                       if f not in failed and migration.name not in self.row(f).get('_migrations', [])]
+            if not pending:
+                continue
+            print(f"🔧 {migration.name}: {len(pending)} files")
+
+            if migration.reads_data:
+                jobs = [(migration.fn, os.path.join(self.root_dir, f), self.row(f), migration.rewrite)
+                        for f in pending]
+                workers = num_workers or os.cpu_count() or 1
+                if workers > 1 and len(jobs) > 1:
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        results = list(pool.map(_load_and_apply, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+                else:
+                    results = [_load_and_apply(job) for job in jobs]
+            else:
+                results = [(f, migration.fn(f, self.row(f)), None) for f in pending]
+
+            for fname, updates, error in results:
+                if error is not None:
+                    failed[fname] = error
+                    print(f"Failed to process {fname}: {error}")
+                    continue
+                for name, value in updates.items():
+                    self.set_column(name, {fname: value}, attach=migration.attach)
+                self.row(fname).setdefault('_migrations', []).append(migration.name)
+
+            # failed holds this step's failures and the files earlier steps skipped it for
+            if not any(f in failed for f in files) and migration.name not in [step['name'] for step in self.history]:
+                self.schema_version += 1
+                self.history.append({
+                    'version': self.schema_version,
+                    'name': migration.name,
+                    'applied_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                })
+            self.save()
+
+        return failed
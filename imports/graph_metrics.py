@@ -0,0 +1,235 @@
+'''
+Array-native graph-theory metrics for brain connectivity graphs.
+
+Every metric accepts a single adjacency matrix [R, R] or a batch of
+subjects [B, R, R] (numpy array or torch tensor) and returns [R] or
+[B, R] respectively. Degree, eigenvector centrality, PageRank and
+clustering also run directly on a scipy CSR matrix; core number and
+betweenness densify it first. Graphs are treated as undirected and
+unweighted-by-default like the networkx calls they replace
+(weights are used where networkx would use them).
+'''
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def _as_array(adj):
+    """numpy view of a numpy array / torch tensor / scipy sparse matrix"""
+    if sp.issparse(adj):
+        return adj
+    if hasattr(adj, 'detach'):
+        adj = adj.detach().cpu().numpy()
+    return np.asarray(adj, dtype=np.float64)
+
+
+def _dense_batch(adj):
+    """Dense float64 [B, R, R] batch and whether the input was a single graph"""
+    adj = _as_array(adj)
+    if sp.issparse(adj):
+        adj = adj.toarray().astype(np.float64)
+    single = adj.ndim == 2
+    return (adj[None] if single else adj), single
+
+
+def _unbatch(values, single):
+    return values[0] if single else values
+
+
+def _left_matmul(x, adj):
+    """x @ A for node vectors x [B, R] and A a dense batch or a single sparse matrix"""
+    if sp.issparse(adj):
+        return np.asarray(adj.T @ x.T).T
+    return np.matmul(x[:, None, :], adj)[:, 0, :]
+
+
+def _prepare(adj):
+    """(A, single, B, N) where A is a [B, R, R] dense batch or a single CSR matrix"""
+    adj = _as_array(adj)
+    if sp.issparse(adj):
+        adj = sp.csr_matrix(adj, dtype=np.float64)
+        return adj, True, 1, adj.shape[0]
+    single = adj.ndim == 2
+    adj = adj[None] if single else adj
+    return adj, single, adj.shape[0], adj.shape[-1]
+
+
+def _row_sum(adj):
+    if sp.issparse(adj):
+        return np.asarray(adj.sum(axis=1)).reshape(1, -1)
+    return adj.sum(axis=-1)
+
+
+def threshold_adjacency(fc, threshold):
+    """Binary adjacency |fc| > threshold without self-loops, for [R, R] or [B, R, R]"""
+    fc = _as_array(fc)
+    adj = (np.abs(fc) > threshold).astype(np.float64)
+    n = adj.shape[-1]
+    adj[..., np.arange(n), np.arange(n)] = 0
+    return adj
+
+
+def edge_list(adj):
+    """Edges (row, col) of every non-zero entry of a [R, R] matrix and their values.
+
+    The pattern is symmetrised (an edge exists if either direction is non-zero),
+    values are read from adj itself, and edges are in row-major order.
+    """
+    adj = _as_array(adj)
+    if sp.issparse(adj):
+        adj = adj.toarray()
+    mask = (adj != 0) | (adj.T != 0)
+    row, col = np.nonzero(mask)
+    return np.stack([row, col]), adj[row, col]
+
+
+def degree_centrality(adj):
+    """Degree divided by the maximum possible degree (R - 1)"""
+    A, single, _, n = _prepare(adj)
+    degree = _row_sum((A != 0).astype(np.float64))
+    scale = 1.0 / (n - 1) if n > 1 else 1.0
+    return _unbatch(degree * scale, single)
+
+
+def eigenvector_centrality(adj, max_iter=100, tol=1.0e-6):
+    """Eigenvector centrality by power iteration on A + I (networkx convention).
+
+    Graphs that do not converge within max_iter get all-zero centrality.
+    """
+    A, single, batch, n = _prepare(adj)
+    x = np.full((batch, n), 1.0 / n)
+    done = np.zeros(batch, dtype=bool)
+
+    for _ in range(max_iter):
+        x_new = x + _left_matmul(x, A)
+        norm = np.linalg.norm(x_new, axis=1, keepdims=True)
+        norm[norm == 0] = 1
+        x_new /= norm
+
+        converged = np.abs(x_new - x).sum(axis=1) < n * tol
+        x = np.where(done[:, None], x, x_new)
+        done |= converged
+        if done.all():
+            break
+
+    x[~done] = 0
+    return _unbatch(x, single)
+
+
+def pagerank(adj, alpha=0.85, max_iter=100, tol=1.0e-6):
+    """PageRank by power iteration, dangling nodes teleport uniformly.
+
+    Graphs that do not converge within max_iter keep their last iterate.
+    """
+    A, single, batch, n = _prepare(adj)
+    out_weight = _row_sum(A)
+    dangling = out_weight == 0
+    inv_weight = np.where(dangling, 0.0, 1.0 / np.where(dangling, 1.0, out_weight))
+
+    p = 1.0 / n
+    x = np.full((batch, n), p)
+    done = np.zeros(batch, dtype=bool)
+
+    for _ in range(max_iter):
+        dangling_mass = (x * dangling).sum(axis=1, keepdims=True)
+        x_new = alpha * (_left_matmul(x * inv_weight, A) + dangling_mass * p) + (1 - alpha) * p
+
+        converged = np.abs(x_new - x).sum(axis=1) < n * tol
+        x = np.where(done[:, None], x, x_new)
+        done |= converged
+        if done.all():
+            break
+
+    return _unbatch(x, single)
+
+
+def clustering(adj):
+    """Local clustering coefficient diag(A^3) / (deg (deg - 1)) of the binary graph"""
+    A, single, _, _ = _prepare(adj)
+    if sp.issparse(A):
+        A = (A != 0).astype(np.float64)
+        closed_walks = np.asarray((A @ A).multiply(A).sum(axis=1)).reshape(1, -1)
+    else:
+        A = (A != 0).astype(np.float64)
+        # diag(A^3) without forming A^3: row sums of (A @ A) * A
+        closed_walks = (np.matmul(A, A) * A).sum(axis=-1)
+    degree = _row_sum(A)
+
+    possible = degree * (degree - 1)
+    coefficient = np.divide(closed_walks, possible, out=np.zeros_like(closed_walks), where=possible > 0)
+    return _unbatch(coefficient, single)
+
+
+def core_number(adj):
+    """k-core number of every node by batched peeling of the binary graph"""
+    A, single = _dense_batch(adj)
+    A = (A != 0).astype(np.float64)
+    degree = A.sum(axis=-1)
+    alive = np.ones(degree.shape, dtype=bool)
+    core = np.zeros(degree.shape, dtype=np.int64)
+
+    k = 0
+    while alive.any():
+        # Peel every node with degree <= k until none is left at this level
+        removed = alive & (degree <= k)
+        while removed.any():
+            core[removed] = k
+            alive &= ~removed
+            degree -= np.matmul(A, removed[..., None].astype(np.float64))[..., 0]
+            removed = alive & (degree <= k)
+        k += 1
+
+    return _unbatch(core, single)
+
+
+def betweenness_centrality(adj, normalized=True):
+    """Shortest-path betweenness of the binary graph (Brandes), all sources at once.
+
+    Breadth-first search and the dependency accumulation both run level by
+    level as [B, R, R] (graph, source, node) matrix products.
+    """
+    A, single = _dense_batch(adj)
+    A = (A != 0).astype(np.float64)
+    batch, n, _ = A.shape
+    A_T = np.swapaxes(A, -1, -2)
+
+    # Forward: BFS from every source, counting shortest paths (sigma)
+    sigma = np.broadcast_to(np.eye(n), (batch, n, n)).copy()
+    depth = np.where(sigma > 0, 0, -1)
+    frontier = sigma > 0
+    level = 0
+    while frontier.any():
+        paths = np.matmul(sigma * frontier, A)
+        frontier = (paths > 0) & (depth < 0)
+        level += 1
+        sigma += paths * frontier
+        depth[frontier] = level
+
+    # Backward: accumulate dependencies from the deepest level up
+    delta = np.zeros_like(sigma)
+    safe_sigma = np.where(sigma > 0, sigma, 1)
+    for d in range(level - 1, 0, -1):
+        share = np.where(depth == d, (1 + delta) / safe_sigma, 0)
+        delta += np.where(depth == d - 1, sigma * np.matmul(share, A_T), 0)
+
+    # Sources do not count towards their own betweenness
+    delta[:, np.arange(n), np.arange(n)] = 0
+    betweenness = delta.sum(axis=1)
+
+    if normalized:
+        betweenness *= 1.0 / ((n - 1) * (n - 2)) if n > 2 else 1.0
+    else:
+        betweenness *= 0.5
+    return _unbatch(betweenness, single)
+
+
+def compute_node_metrics(adj, eigenvector_max_iter=1000):
+    """All node metrics used by the explainability analyses, as a dict of arrays"""
+    return {
+        'degree_centrality': degree_centrality(adj),
+        'betweenness_centrality': betweenness_centrality(adj),
+        'eigenvector_centrality': eigenvector_centrality(adj, max_iter=eigenvector_max_iter),
+        'pagerank': pagerank(adj),
+        'clustering': clustering(adj),
+        'core_number': core_number(adj),
+    }
@@ -0,0 +1,262 @@
+'''
+Parallel Optuna search over one preloaded graph dataset.
+
+load_shared_graphs() reads a dataset once and collates it into a single
+set of tensors in shared memory (SharedGraphs, an InMemoryDataset whose
+items are views). run_parallel_study() starts n_jobs spawned worker
+processes, each with torch.set_num_threads(threads_per_job). The shared
+tensors reach the workers as shared-memory handles rather than copies.
+Every worker pulls trials from the same study in a local storage:
+
+    path.log / anything else   optuna JournalStorage file (safe for several processes)
+    sqlite:///path.db          optuna RDB storage
+
+Objectives are module-level functions objective(trial, graphs=graphs)
+so that the spawned workers can import them.
+
+Multi-fidelity search: the training loops report the validation score
+after every epoch (step = epochs trained) through TrialCheckpoint.report(),
+and make_pruner() builds a Hyperband / successive-halving pruner with
+epochs as the resource. A trial is checkpointed at every rung boundary
+(min_resource * reduction_factor^k epochs), keyed by its trial number.
+Interrupted and failed trials are re-queued when the study is resumed, and
+the re-queued trial warm-starts from the last rung of the trial it replaces.
+Keying on the trial (not the parameters) keeps two concurrent trials with
+the same sampled parameters on separate files.
+'''
+
+import os
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from torch_geometric.data import InMemoryDataset
+
+DEFAULT_STORAGE = './model/optuna_journal.log'
+CHECKPOINT_DIR = './model/hpo_checkpoints'
+
+
+class SharedGraphs(InMemoryDataset):
+    """Graphs collated into one set of shared-memory tensors; graphs[i] is a view"""
+
+    def __init__(self, data, slices):
+        super().__init__()
+        self.data, self.slices = data, slices
+
+    @classmethod
+    def from_data_list(cls, data_list):
+        data, slices = cls.collate(data_list)
+        for _, value in data:
+            if torch.is_tensor(value):
+                value.share_memory_()
+        for value in slices.values():
+            value.share_memory_()
+        return cls(data, slices)
+
+    def labels(self):
+        return [int(data.y.item()) for data in self]
+
+
+def balanced_indices(labels):
+    """Indices oversampling every class to the size of the largest (repeats, then the first remainder)"""
+    labels = np.asarray(labels)
+    unique_labels, counts = np.unique(labels, return_counts=True)
+    max_count = max(counts)
+    indices = []
+    for label in unique_labels:
+        label_indices = np.where(labels == label)[0]
+        repeats = max_count // len(label_indices)
+        remainder = max_count % len(label_indices)
+        indices.extend(label_indices.tolist() * repeats)
+        indices.extend(label_indices[:remainder].tolist())
+    return indices
+
+
+def load_shared_graphs(dataset, prepare=None, balance_classes=False):
+    """Read every graph of dataset once into SharedGraphs
+
+    Args:
+        prepare: prepare(data) -> data, or None to drop the graph
+        balance_classes: oversample minority classes (index views, no copies)
+    """
+    data_list = []
+    for i in range(len(dataset)):
+        try:
+            data = dataset[i]
+        except Exception:
+            continue
+        if prepare is not None:
+            data = prepare(data)
+        if data is not None:
+            data_list.append(data)
+
+    graphs = SharedGraphs.from_data_list(data_list)
+    if balance_classes:
+        graphs = graphs.index_select(balanced_indices(graphs.labels()))
+    print(f"✅ {len(data_list)} graphs loaded into shared memory ({len(graphs)} samples)")
+    return graphs
+
+
+def open_storage(storage=DEFAULT_STORAGE):
+    """Optuna storage from an RDB URL or a journal file path"""
+    if '://' in storage:
+        return storage
+    import optuna
+    os.makedirs(os.path.dirname(os.path.abspath(storage)), exist_ok=True)
+    try:
+        from optuna.storages.journal import JournalFileBackend
+    except ImportError:
+        from optuna.storages import JournalFileStorage as JournalFileBackend
+    return optuna.storages.JournalStorage(JournalFileBackend(storage))
+
+
+def make_pruner(kind='hyperband', max_resource=50, min_resource=3, reduction_factor=3):
+    """Pruner with epochs as the resource: 'hyperband', 'sha' (successive halving), 'median' or 'none'"""
+    import optuna
+    if kind == 'hyperband':
+        return optuna.pruners.HyperbandPruner(min_resource=min_resource, max_resource=max_resource,
+                                              reduction_factor=reduction_factor)
+    if kind == 'sha':
+        return optuna.pruners.SuccessiveHalvingPruner(min_resource=min_resource, reduction_factor=reduction_factor)
+    if kind == 'median':
+        return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=min_resource)
+    if kind == 'none':
+        return optuna.pruners.NopPruner()
+    raise ValueError(f"Unknown pruner: {kind}")
+
+
+def rung_steps(max_resource, min_resource=3, reduction_factor=3):
+    """Epoch counts at which successive halving compares trials"""
+    steps = []
+    step = min_resource
+    while step < max_resource:
+        steps.append(step)
+        step *= reduction_factor
+    return steps
+
+
+class TrialCheckpoint:
+    """Per-epoch reporting and rung checkpoints of one trial, keyed by (study, original trial number)
+
+    Usage in a training loop:
+        checkpoint = TrialCheckpoint(trial, max_epochs)
+        start_epoch, state = checkpoint.restore(model, optimizer, scheduler)
+        for epoch in range(start_epoch, max_epochs):
+            ...
+            checkpoint.report(val_f1, epoch, model, optimizer, scheduler, best_val_f1=...)  # may raise TrialPruned
+        checkpoint.finish()
+    """
+
+    def __init__(self, trial, max_epochs, min_resource=3, reduction_factor=3, directory=CHECKPOINT_DIR):
+        self.trial = trial
+        # A re-queued trial continues the checkpoint of the first trial it replaces (see requeue_unfinished)
+        number = trial.user_attrs.get('checkpoint_of', trial.user_attrs.get('requeued_from', trial.number))
+        self.path = os.path.join(directory, trial.study.study_name, f'trial_{number}.pt')
+        self.rungs = set(rung_steps(max_epochs, min_resource, reduction_factor))
+        self.values = {}
+
+    def restore(self, model, optimizer, scheduler=None):
+        """(first epoch to train, extra state) after loading the last rung checkpoint of this trial"""
+        if not os.path.exists(self.path):
+            return 0, {}
+        checkpoint = torch.load(self.path)
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        if scheduler is not None and checkpoint.get('scheduler') is not None:
+            scheduler.load_state_dict(checkpoint['scheduler'])
+        # Re-report the curve so the pruner sees the same history as the interrupted run
+        self.values = {int(step): value for step, value in checkpoint['values'].items()}
+        for step, value in sorted(self.values.items()):
+            self.trial.report(value, step)
+        print(f"♻️ Trial {self.trial.number}: warm start from epoch {checkpoint['epoch']} ({self.path})")
+        return checkpoint['epoch'], checkpoint['state']
+
+    def report(self, value, epoch, model, optimizer, scheduler=None, **state):
+        """Report the score after epoch (0-based), checkpoint on rung boundaries, raise TrialPruned if pruned"""
+        import optuna
+        step = epoch + 1
+        self.values[step] = float(value)
+        self.trial.report(float(value), step)
+        if step in self.rungs:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            torch.save({
+                'epoch': step,
+                'model': model.state_dict(),
+                'optimizer': optimizer.state_dict(),
+                'scheduler': scheduler.state_dict() if scheduler is not None else None,
+                'values': self.values,
+                'state': state,
+            }, tmp_path)
+            os.replace(tmp_path, self.path)
+        if self.trial.should_prune():
+            self.finish()
+            raise optuna.TrialPruned(f"pruned after {step} epochs")
+
+    def finish(self):
+        """Drop the checkpoint once the trial is complete or pruned"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def requeue_unfinished(study):
+    """Enqueue the parameters of failed / interrupted trials once, so they warm-start from their checkpoints"""
+    import optuna
+    trials = study.get_trials(deepcopy=False)
+    already = {t.user_attrs.get('requeued_from') for t in trials}
+    requeued = 0
+    for trial in trials:
+        if trial.state in (optuna.trial.TrialState.FAIL, optuna.trial.TrialState.RUNNING) \
+                and trial.number not in already and trial.params:
+            # checkpoint_of: the original trial, also when a re-queued trial is interrupted again
+            study.enqueue_trial(trial.params, user_attrs={
+                'requeued_from': trial.number,
+                'checkpoint_of': trial.user_attrs.get('checkpoint_of', trial.number)})
+            requeued += 1
+    if requeued:
+        print(f"♻️ Re-queued {requeued} unfinished trials")
+    return requeued
+
+
+def _run_worker(objective, graphs, study_name, storage, n_trials, timeout, num_threads, sampler, pruner):
+    import optuna
+    torch.set_num_threads(num_threads)
+    study = optuna.load_study(study_name=study_name, storage=open_storage(storage),
+                              sampler=sampler, pruner=pruner)
+    # Copies of one seeded sampler would suggest the same parameters in every worker
+    study.sampler.reseed_rng()
+    # Stops once the study holds n_trials trials (running ones included) across all workers;
+    # workers that start a trial at the same moment can overshoot by up to n_jobs - 1
+    stop = optuna.study.MaxTrialsCallback(n_trials, states=None)
+    study.optimize(partial(objective, graphs=graphs), n_trials=n_trials, timeout=timeout, callbacks=[stop])
+
+
+def run_parallel_study(objective, graphs, study_name, storage=DEFAULT_STORAGE, n_trials=20,
+                       n_jobs=None, threads_per_job=None, timeout=None, direction='maximize',
+                       sampler=None, pruner=None):
+    """Run n_trials of objective(trial, graphs=graphs) in n_jobs processes; returns the study
+
+    The study is created with load_if_exists, so an interrupted search resumes from the storage
+    (its unfinished configurations are re-queued and warm-start from their checkpoints).
+    """
+    import optuna
+    n_jobs = n_jobs or os.cpu_count() or 1
+    threads_per_job = threads_per_job or max(1, (os.cpu_count() or 1) // n_jobs)
+
+    study = optuna.create_study(study_name=study_name, storage=open_storage(storage), direction=direction,
+                                sampler=sampler, pruner=pruner, load_if_exists=True)
+    requeue_unfinished(study)
+    done = len([t for t in study.trials if t.state != optuna.trial.TrialState.WAITING])
+    print(f"🔬 {study_name}: {n_trials} trials ({done} in storage), {n_jobs} workers x {threads_per_job} threads")
+
+    job = (objective, graphs, study_name, storage, done + n_trials, timeout, threads_per_job, sampler, pruner)
+    if n_jobs == 1:
+        _run_worker(*job)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp.get_context('spawn')) as pool:
+            for future in [pool.submit(_run_worker, *job) for _ in range(n_jobs)]:
+                future.result()
+
+    return optuna.load_study(study_name=study_name, storage=open_storage(storage))
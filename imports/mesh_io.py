@@ -0,0 +1,507 @@
+'''
+Binary mesh I/O shared by the SurfIce / ParaView / viewer scripts.
+
+Formats:
+    PLY   binary little-endian (read: also ASCII and big-endian)
+    VTK   legacy POLYDATA, BINARY (big-endian per the VTK spec) or ASCII,
+          with POINTS, VERTICES / LINES / POLYGONS and POINT_DATA scalars
+    MZ3   SurfIce native format, gzipped by default
+    STL   binary
+    OBJ   text only (no binary variant), written in one formatting pass
+
+Vertex and face blocks are numpy (structured) arrays written with tofile()
+and read with frombuffer(). Uncompressed binary files larger
+than MMAP_THRESHOLD bytes are memory-mapped on read, so the returned arrays
+are read-only views of the file.
+
+All readers return a Mesh(vertices [V, 3], faces [F, 3] or None,
+scalars {name: [V] array}, lines [L, 2] or None).
+'''
+
+import os
+import gzip
+import mmap as _mmap
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib import recfunctions
+
+Mesh = namedtuple('Mesh', ['vertices', 'faces', 'scalars', 'lines'], defaults=(None, {}, None))
+
+# Uncompressed binary meshes above this size are memory-mapped by default
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def _load_buffer(path, mmap='auto'):
+    """Bytes of a file, memory-mapped when mmap is True (or 'auto' and the file is large)"""
+    if mmap == 'auto':
+        mmap = os.path.getsize(path) >= MMAP_THRESHOLD
+    with open(path, 'rb') as f:
+        if mmap:
+            return _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        return f.read()
+
+
+def _as_vertices(vertices):
+    return np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+
+
+def _as_faces(faces, width=3):
+    if faces is None:
+        return np.zeros((0, width), dtype=np.int32)
+    return np.asarray(faces, dtype=np.int32).reshape(-1, width)
+
+
+def grid_faces(rows, cols, wrap=False):
+    """Triangles of a rows x cols vertex grid (row-major vertex ids), two per quad.
+
+    Quad (i, j) gives [v1, v2, v3] and [v2, v4, v3] with v1 = i * cols + j,
+    v2 its right neighbour and v3 / v4 the vertices below. With wrap=True the
+    last column is joined back to the first (closed in theta).
+    """
+    i, j = np.meshgrid(np.arange(rows - 1), np.arange(cols if wrap else cols - 1), indexing='ij')
+    v1 = i * cols + j
+    v2 = i * cols + (j + 1) % cols
+    v3 = v1 + cols
+    v4 = v2 + cols
+    faces = np.stack([np.stack([v1, v2, v3], axis=-1), np.stack([v2, v4, v3], axis=-1)], axis=2)
+    return faces.reshape(-1, 3).astype(np.int32)
+
+
+# ---------------------------------------------------------------- PLY
+
+_PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+
+def write_ply(path, vertices, faces=None, scalars=None, comment=None):
+    """Binary little-endian PLY with float xyz (+ one float property per scalar) and triangle faces"""
+    vertices = _as_vertices(vertices)
+    faces = _as_faces(faces)
+    scalars = scalars or {}
+
+    vertex_dtype = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')] + [(name, '<f4') for name in scalars]
+    vertex_data = np.empty(len(vertices), dtype=vertex_dtype)
+    vertex_data['x'], vertex_data['y'], vertex_data['z'] = vertices.T
+    for name, values in scalars.items():
+        vertex_data[name] = np.asarray(values, dtype=np.float32).ravel()
+
+    face_data = np.empty(len(faces), dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+    face_data['n'] = 3
+    face_data['v'] = faces
+
+    header = ["ply", "format binary_little_endian 1.0"]
+    if comment:
+        header.append(f"comment {comment}")
+    header.append(f"element vertex {len(vertices)}")
+    header += [f"property float {name}" for name, _ in vertex_dtype]
+    header.append(f"element face {len(faces)}")
+    header.append("property list uchar int vertex_indices")
+    header.append("end_header")
+
+    with open(path, 'wb') as f:
+        f.write(("\n".join(header) + "\n").encode('ascii'))
+        vertex_data.tofile(f)
+        face_data.tofile(f)
+    return path
+
+
+def _read_ply_header(f):
+    """(format, [(element, count, [(name, type) | (name, count_type, item_type)])], data offset)"""
+    if f.readline().strip() != b'ply':
+        raise ValueError("Not a PLY file")
+
+    fmt = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("PLY header has no end_header")
+        parts = line.decode('ascii', errors='replace').split()
+        if not parts or parts[0] in ('comment', 'obj_info'):
+            continue
+        if parts[0] == 'end_header':
+            break
+        if parts[0] == 'format':
+            fmt = parts[1]
+        elif parts[0] == 'element':
+            elements.append((parts[1], int(parts[2]), []))
+        elif parts[0] == 'property':
+            if parts[1] == 'list':
+                elements[-1][2].append((parts[4], _PLY_TYPES[parts[2]], _PLY_TYPES[parts[3]]))
+            else:
+                elements[-1][2].append((parts[2], _PLY_TYPES[parts[1]]))
+    return fmt, elements, f.tell()
+
+
+def read_ply(path, mmap='auto'):
+    """Mesh from a PLY file; every vertex property other than x, y, z is returned as a scalar"""
+    with open(path, 'rb') as f:
+        fmt, elements, offset = _read_ply_header(f)
+
+    vertices, faces, scalars = None, None, {}
+
+    if fmt == 'ascii':
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            values = np.array(f.read().split(), dtype=np.float64)
+        position = 0
+        for name, count, properties in elements:
+            if name == 'vertex':
+                block = values[position:position + count * len(properties)].reshape(count, len(properties))
+                columns = {prop[0]: block[:, k] for k, prop in enumerate(properties)}
+                vertices = np.stack([columns['x'], columns['y'], columns['z']], axis=1).astype(np.float32)
+                scalars = {key: value for key, value in columns.items() if key not in ('x', 'y', 'z')}
+                position += block.size
+            elif name == 'face':
+                block = values[position:position + count * 4].reshape(count, 4)
+                if count and not np.all(block[:, 0] == 3):
+                    raise ValueError("Only triangle PLY meshes are supported")
+                faces = block[:, 1:].astype(np.int32)
+                position += block.size
+        return Mesh(vertices, faces, scalars)
+
+    if fmt not in ('binary_little_endian', 'binary_big_endian'):
+        raise ValueError(f"Unsupported PLY format: {fmt}")
+    order = '<' if fmt == 'binary_little_endian' else '>'
+    buffer = _load_buffer(path, mmap)
+
+    for name, count, properties in elements:
+        if any(len(prop) == 3 for prop in properties):
+            # Only fixed-size triangle lists can be read as a structured block
+            if name != 'face' or len(properties) != 1:
+                raise ValueError(f"Unsupported list property in PLY element '{name}'")
+            _, count_type, item_type = properties[0]
+            dtype = np.dtype([('n', order + count_type), ('v', order + item_type, (3,))])
+        else:
+            dtype = np.dtype([(prop[0], order + prop[1]) for prop in properties])
+
+        data = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += count * dtype.itemsize
+
+        if name == 'vertex':
+            vertices = recfunctions.structured_to_unstructured(data[['x', 'y', 'z']])
+            scalars = {prop[0]: data[prop[0]] for prop in properties if prop[0] not in ('x', 'y', 'z')}
+        elif name == 'face':
+            if count and not np.all(data['n'] == 3):
+                raise ValueError("Only triangle PLY meshes are supported")
+            faces = data['v']
+
+    return Mesh(vertices, faces, scalars)
+
+
+# ---------------------------------------------------------------- VTK (legacy)
+
+_VTK_TYPES = {
+    'bit': 'u1', 'unsigned_char': 'u1', 'char': 'i1',
+    'unsigned_short': 'u2', 'short': 'i2', 'unsigned_int': 'u4', 'int': 'i4',
+    'unsigned_long': 'u8', 'long': 'i8', 'vtktypeint64': 'i8', 'vtktypeuint64': 'u8',
+    'float': 'f4', 'double': 'f8',
+}
+_VTK_NAMES = {'f4': 'float', 'f8': 'double', 'i4': 'int', 'i8': 'vtktypeint64', 'u1': 'unsigned_char'}
+
+
+class _VTKCursor:
+    """Line / block reader over the bytes of a legacy VTK file"""
+
+    def __init__(self, buffer, binary):
+        self.buffer = buffer
+        self.binary = binary
+        self.pos = 0
+
+    def line(self):
+        """Next non-empty line, or None at the end of the file"""
+        while self.pos < len(self.buffer):
+            end = self.buffer.find(b'\n', self.pos)
+            end = len(self.buffer) if end < 0 else end
+            line = self.buffer[self.pos:end].decode('ascii', errors='replace').strip()
+            self.pos = end + 1
+            if line:
+                return line
+        return None
+
+    def peek(self):
+        pos = self.pos
+        line = self.line()
+        self.pos = pos
+        return line
+
+    def array(self, count, dtype):
+        if self.binary:
+            dtype = np.dtype('>' + dtype)
+            data = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.pos)
+            self.pos += count * dtype.itemsize
+            return data
+        tokens = []
+        while len(tokens) < count:
+            tokens.extend(self.line().split())
+        return np.array(tokens[:count], dtype=np.float64).astype(dtype)
+
+
+def _vtk_cells(cursor, num_cells, size):
+    """Fixed-width [N, k] connectivity of a VERTICES / LINES / POLYGONS section"""
+    if (cursor.peek() or '').startswith('OFFSETS'):
+        # VTK >= 9 layout: OFFSETS and CONNECTIVITY arrays (num_cells is offsets length)
+        offsets = cursor.array(num_cells, _VTK_TYPES[cursor.line().split()[1]])
+        connectivity = cursor.array(size, _VTK_TYPES[cursor.line().split()[1]])
+        widths = np.diff(offsets)
+    else:
+        flat = cursor.array(size, 'i4')
+        if num_cells == 0:
+            return np.zeros((0, 0), dtype=np.int32)
+        width = int(flat[0])
+        if size != num_cells * (width + 1) or np.any(flat[::width + 1] != width):
+            raise ValueError("Mixed cell sizes in VTK file are not supported")
+        return flat.reshape(num_cells, width + 1)[:, 1:].astype(np.int32)
+
+    if len(widths) == 0:
+        return np.zeros((0, 0), dtype=np.int32)
+    if np.any(widths != widths[0]):
+        raise ValueError("Mixed cell sizes in VTK file are not supported")
+    return connectivity.reshape(-1, int(widths[0])).astype(np.int32)
+
+
+def write_vtk(path, vertices, faces=None, lines=None, scalars=None, title="BrainGNN mesh",
+              binary=True, vertex_cells=False):
+    """Legacy VTK POLYDATA with optional POLYGONS, LINES and POINT_DATA scalars.
+
+    Scalars keep integer dtypes (written as 'int'), everything else is float.
+    vertex_cells=True adds one VERTICES cell per point so point clouds render
+    without a glyph filter.
+    """
+    vertices = _as_vertices(vertices)
+    order = '>' if binary else '<'
+
+    def block(f, values, dtype):
+        values = np.ascontiguousarray(values, dtype=order + dtype)
+        if binary:
+            values.tofile(f)
+            f.write(b"\n")
+        else:
+            fmt = '%d' if dtype[0] in 'iu' else '%.6g'
+            np.savetxt(f, values.reshape(len(values), -1), fmt=fmt)
+
+    def cells(f, keyword, connectivity):
+        connectivity = np.asarray(connectivity, dtype=np.int32)
+        n, width = connectivity.shape
+        f.write(f"{keyword} {n} {n * (width + 1)}\n".encode('ascii'))
+        block(f, np.column_stack([np.full(n, width, dtype=np.int32), connectivity]), 'i4')
+
+    with open(path, 'wb') as f:
+        f.write(f"# vtk DataFile Version 3.0\n{title}\n{'BINARY' if binary else 'ASCII'}\n"
+                f"DATASET POLYDATA\nPOINTS {len(vertices)} float\n".encode('ascii'))
+        block(f, vertices, 'f4')
+
+        if vertex_cells:
+            cells(f, 'VERTICES', np.arange(len(vertices)).reshape(-1, 1))
+        if lines is not None:
+            cells(f, 'LINES', _as_faces(lines, width=2))
+        if faces is not None:
+            cells(f, 'POLYGONS', _as_faces(faces))
+
+        if scalars:
+            f.write(f"POINT_DATA {len(vertices)}\n".encode('ascii'))
+            for name, values in scalars.items():
+                values = np.asarray(values).ravel()
+                dtype = 'i4' if values.dtype.kind in 'iub' else 'f4'
+                f.write(f"SCALARS {name} {_VTK_NAMES[dtype]} 1\nLOOKUP_TABLE default\n".encode('ascii'))
+                block(f, values, dtype)
+    return path
+
+
+def read_vtk(path, mmap='auto'):
+    """Mesh from a legacy POLYDATA VTK file (BINARY or ASCII).
+
+    POLYGONS become faces (all cells must have the same size), LINES become
+    lines, and every POINT_DATA SCALARS / FIELD array becomes a scalar.
+    """
+    buffer = _load_buffer(path, mmap)
+
+    cursor = _VTKCursor(buffer, binary=False)
+    if not cursor.line().startswith('# vtk'):
+        raise ValueError("Not a legacy VTK file")
+    cursor.line()  # title
+    cursor.binary = cursor.line().upper() == 'BINARY'
+
+    vertices, faces, lines, scalars = None, None, None, {}
+    section = None
+    num_values = 0
+
+    while True:
+        line = cursor.line()
+        if line is None:
+            break
+        parts = line.split()
+        keyword = parts[0].upper()
+
+        if keyword == 'DATASET':
+            if parts[1].upper() != 'POLYDATA':
+                raise ValueError(f"Unsupported VTK dataset: {parts[1]}")
+        elif keyword == 'POINTS':
+            vertices = cursor.array(int(parts[1]) * 3, _VTK_TYPES[parts[2]]).reshape(-1, 3)
+        elif keyword in ('VERTICES', 'LINES', 'POLYGONS', 'TRIANGLE_STRIPS'):
+            connectivity = _vtk_cells(cursor, int(parts[1]), int(parts[2]))
+            if keyword == 'POLYGONS':
+                faces = connectivity
+            elif keyword == 'LINES':
+                lines = connectivity
+        elif keyword in ('POINT_DATA', 'CELL_DATA'):
+            section = keyword
+            num_values = int(parts[1])
+        elif keyword == 'SCALARS':
+            components = int(parts[3]) if len(parts) > 3 else 1
+            if (cursor.peek() or '').startswith('LOOKUP_TABLE'):
+                cursor.line()
+            values = cursor.array(num_values * components, _VTK_TYPES[parts[2]])
+            if section == 'POINT_DATA':
+                scalars[parts[1]] = values if components == 1 else values.reshape(num_values, components)
+        elif keyword == 'LOOKUP_TABLE':
+            cursor.array(int(parts[2]) * 4, 'u1' if cursor.binary else 'f4')
+        elif keyword in ('VECTORS', 'NORMALS'):
+            cursor.array(num_values * 3, _VTK_TYPES[parts[2]])
+        elif keyword == 'FIELD':
+            for _ in range(int(parts[2])):
+                name, components, tuples, dtype = cursor.line().split()[:4]
+                values = cursor.array(int(components) * int(tuples), _VTK_TYPES[dtype])
+                if section == 'POINT_DATA':
+                    scalars[name] = values if int(components) == 1 else values.reshape(int(tuples), -1)
+        elif keyword == 'METADATA':
+            # Information block terminated by an empty line
+            while cursor.pos < len(buffer):
+                end = buffer.find(b'\n', cursor.pos)
+                end = len(buffer) if end < 0 else end
+                empty = not buffer[cursor.pos:end].strip()
+                cursor.pos = end + 1
+                if empty:
+                    break
+
+    return Mesh(vertices, faces, scalars, lines)
+
+
+# ---------------------------------------------------------------- MZ3
+
+MZ3_MAGIC = 23117  # b'MZ'
+MZ3_FACE, MZ3_VERT, MZ3_RGBA, MZ3_SCALAR, MZ3_DOUBLE = 1, 2, 4, 8, 16
+
+
+def write_mz3(path, vertices, faces=None, scalars=None, compress=True):
+    """SurfIce MZ3 mesh; scalars [V] or [layers, V] are stored as float32 layers"""
+    vertices = _as_vertices(vertices)
+    attributes = MZ3_VERT
+    blocks = [vertices.astype('<f4')]
+
+    if faces is not None:
+        faces = _as_faces(faces)
+        attributes |= MZ3_FACE
+        blocks.insert(0, faces.astype('<i4'))
+    if scalars is not None:
+        attributes |= MZ3_SCALAR
+        blocks.append(np.asarray(scalars, dtype='<f4').reshape(-1, len(vertices)))
+
+    header = np.array([(MZ3_MAGIC, attributes, 0 if faces is None else len(faces), len(vertices), 0)],
+                      dtype=[('magic', '<u2'), ('attr', '<u2'), ('nface', '<u4'), ('nvert', '<u4'), ('nskip', '<u4')])
+
+    with (gzip.open(path, 'wb', compresslevel=6) if compress else open(path, 'wb')) as f:
+        f.write(header.tobytes())
+        for data in blocks:
+            f.write(np.ascontiguousarray(data).tobytes())
+    return path
+
+
+def read_mz3(path, mmap='auto'):
+    """Mesh from a (gzipped or raw) MZ3 file; scalar layers are returned as 'layer0', 'layer1', ..."""
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+
+    if compressed:
+        with gzip.open(path, 'rb') as f:
+            buffer = f.read()
+    else:
+        buffer = _load_buffer(path, mmap)
+
+    header = np.frombuffer(buffer, dtype=[('magic', '<u2'), ('attr', '<u2'), ('nface', '<u4'),
+                                          ('nvert', '<u4'), ('nskip', '<u4')], count=1)[0]
+    if header['magic'] != MZ3_MAGIC:
+        raise ValueError("Not an MZ3 file")
+
+    attributes = int(header['attr'])
+    num_faces, num_vertices = int(header['nface']), int(header['nvert'])
+    offset = 16 + int(header['nskip'])
+
+    def take(dtype, count):
+        nonlocal offset
+        data = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += data.nbytes
+        return data
+
+    faces = take('<i4', num_faces * 3).reshape(-1, 3) if attributes & MZ3_FACE else None
+    vertices = take('<f4', num_vertices * 3).reshape(-1, 3) if attributes & MZ3_VERT else None
+    scalars = {}
+    if attributes & MZ3_RGBA:
+        scalars['rgba'] = take('u1', num_vertices * 4).reshape(-1, 4)
+    if attributes & MZ3_SCALAR and num_vertices:
+        dtype = np.dtype('<f8' if attributes & MZ3_DOUBLE else '<f4')
+        num_layers = (len(buffer) - offset) // (num_vertices * dtype.itemsize)
+        layers = take(dtype, num_layers * num_vertices).reshape(num_layers, num_vertices)
+        scalars.update({f'layer{k}': layer for k, layer in enumerate(layers)})
+
+    return Mesh(vertices, faces, scalars)
+
+
+# ---------------------------------------------------------------- STL / OBJ
+
+_STL_DTYPE = np.dtype([('normal', '<f4', (3,)), ('v', '<f4', (3, 3)), ('attr', '<u2')])
+
+
+def write_stl(path, vertices, faces, header=b"BrainGNN binary STL"):
+    """Binary STL with per-triangle unit normals (zero for degenerate triangles)"""
+    triangles = _as_vertices(vertices)[_as_faces(faces)]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+    data = np.zeros(len(triangles), dtype=_STL_DTYPE)
+    data['normal'] = normals
+    data['v'] = triangles
+
+    with open(path, 'wb') as f:
+        f.write(header[:80].ljust(80, b' '))
+        np.array([len(data)], dtype='<u4').tofile(f)
+        data.tofile(f)
+    return path
+
+
+def read_stl(path, mmap='auto'):
+    """Mesh from a binary STL (vertices are not merged: 3 per triangle)"""
+    buffer = _load_buffer(path, mmap)
+    count = int(np.frombuffer(buffer, dtype='<u4', count=1, offset=80)[0])
+    data = np.frombuffer(buffer, dtype=_STL_DTYPE, count=count, offset=84)
+    return Mesh(data['v'].reshape(-1, 3), np.arange(3 * count, dtype=np.int32).reshape(-1, 3))
+
+
+def write_obj(path, vertices, faces=None, comments=()):
+    """Wavefront OBJ (1-based faces)"""
+    with open(path, 'w') as f:
+        for comment in comments:
+            f.write(f"# {comment}\n")
+        if comments:
+            f.write("\n")
+        np.savetxt(f, np.asarray(vertices, dtype=np.float64).reshape(-1, 3), fmt='v %.6f %.6f %.6f')
+        if faces is not None:
+            np.savetxt(f, _as_faces(faces) + 1, fmt='f %d %d %d')
+    return path
+
+
+_READERS = {'.ply': read_ply, '.vtk': read_vtk, '.mz3': read_mz3, '.stl': read_stl}
+
+
+def read_mesh(path, **kwargs):
+    """Mesh from any supported file, dispatched on the extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in _READERS:
+        raise ValueError(f"Unsupported mesh format: {extension}")
+    return _READERS[extension](path, **kwargs)
@@ -0,0 +1,280 @@
+'''
+Node-feature store for graph directories, keyed by (sample, feature spec).
+
+Node features are computed in batch from cached inputs instead of being
+fixed when the NIfTI -> graph pipeline runs:
+
+    timeseries  the ROI timeseries window of the sample, located through the
+                sidecar columns ts_file / ts_start / ts_end / ts_tr written by
+                the make_graphs_ds* builders (graph_attributes.json)
+    fc          the dense FC matrix rebuilt from the graph's own edges
+
+Feature specs are 'name' or 'name:key=value,...':
+
+    mean            ROI mean of the window                      [R, 1]
+    variance        ROI variance of the window                  [R, 1]
+    alff            mean amplitude spectrum in low..high Hz     [R, 1]
+                    (alff:low=0.01,high=0.08; tr from ts_tr or tr=)
+    fc_rows         full FC rows, as the ABIDE graphs use       [R, R]
+    degree          weighted degree sum_j |fc_ij|, j != i       [R, 1]
+                    (degree:threshold=0.3 keeps |fc| > threshold)
+
+Every spec is stored as <root_dir>/node_features/<spec>.npy ([N, R, F],
+read back as a memmap) plus <spec>.json with the file name and the source
+fingerprint of each row. The fingerprint covers the inputs of the spec:
+the graph file's size / mtime for fc features, the sidecar ts_* values and
+the timeseries file's size / mtime for timeseries features. Samples added
+to the directory later are computed and appended on demand, and rows whose
+fingerprint changed (rebuilt graph, moved window) are recomputed in place.
+'''
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from imports.graph_attributes import GraphAttributeStore
+
+FEATURE_DIR = 'node_features'
+TIMESERIES_COLUMNS = ('ts_file', 'ts_start', 'ts_end', 'ts_tr')
+
+
+def parse_spec(spec):
+    """'name:key=value,...' -> (name, {key: float value})"""
+    name, _, args = spec.partition(':')
+    params = {}
+    for item in filter(None, args.split(',')):
+        key, _, value = item.partition('=')
+        params[key.strip()] = float(value)
+    return name.strip(), params
+
+
+def spec_slug(spec):
+    return spec.replace(':', '__').replace(',', '_').replace('=', '-')
+
+
+def _mean(ts, params):
+    return ts.mean(axis=0)[:, None]
+
+
+def _variance(ts, params):
+    return ts.var(axis=0)[:, None]
+
+
+def _alff(ts, params):
+    tr = params['tr']
+    amplitude = np.abs(np.fft.rfft(ts - ts.mean(axis=0), axis=0)) / len(ts)
+    freqs = np.fft.rfftfreq(len(ts), d=tr)
+    band = (freqs >= params.get('low', 0.01)) & (freqs <= params.get('high', 0.08))
+    if not band.any():
+        return np.zeros((ts.shape[1], 1))
+    return amplitude[band].mean(axis=0)[:, None]
+
+
+def _fc_rows(fc, params):
+    return fc
+
+
+def _degree(fc, params):
+    weights = np.abs(fc)
+    np.fill_diagonal(weights, 0)
+    if 'threshold' in params:
+        weights = weights * (weights > params['threshold'])
+    return weights.sum(axis=1)[:, None]
+
+
+# name -> (input, fn(input, params) -> [R, F])
+FEATURES = {
+    'mean': ('timeseries', _mean),
+    'variance': ('timeseries', _variance),
+    'alff': ('timeseries', _alff),
+    'fc_rows': ('fc', _fc_rows),
+    'degree': ('fc', _degree),
+}
+
+
+def record_timeseries_source(store, fname, ts_file, start, end, tr):
+    """Sidecar columns pointing a graph at its window of a cached [T, R] timeseries .npy"""
+    values = dict(zip(TIMESERIES_COLUMNS, (os.path.abspath(ts_file), int(start), int(end),
+                                          None if tr is None else float(tr))))
+    for name, value in values.items():
+        store.set_column(name, {os.path.basename(fname): value}, attach=False)
+
+
+def _stat(path):
+    """(size, mtime) of a file, (None, None) if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, None
+    return stat.st_size, stat.st_mtime
+
+
+def source_fingerprints(path, row):
+    """{input: fingerprint} of a graph file and its sidecar row, JSON-serialisable"""
+    ts_file = row.get('ts_file')
+    return {'fc': list(_stat(path)),
+            'timeseries': [row.get(name) for name in TIMESERIES_COLUMNS] + list(_stat(ts_file) if ts_file else (None, None))}
+
+
+def spec_input(spec):
+    return FEATURES[parse_spec(spec)[0]][0]
+
+
+def dense_fc(data):
+    """[R, R] FC matrix of a graph from edge_index / edge_attr"""
+    num_nodes = data.x.size(0)
+    fc = np.zeros((num_nodes, num_nodes), dtype=np.float64)
+    edge_index = data.edge_index.numpy()
+    fc[edge_index[0], edge_index[1]] = data.edge_attr.reshape(edge_index.shape[1], -1)[:, 0].numpy()
+    return fc
+
+
+def _compute_sample(job):
+    """Process-pool worker: (fname, {spec: [R, F]}, error)"""
+    path, row, specs = job
+    fname = os.path.basename(path)
+    try:
+        inputs = {}
+        needed = {FEATURES[parse_spec(spec)[0]][0] for spec in specs}
+        if 'fc' in needed:
+            # Graphs are pickled PyG Data objects, which the weights_only loader (torch >= 2.6 default) rejects
+            inputs['fc'] = dense_fc(torch.load(path, weights_only=False))
+        if 'timeseries' in needed:
+            if 'ts_file' not in row:
+                raise KeyError('no ts_file in graph_attributes.json (rebuild with make_graphs_ds*)')
+            ts = np.load(row['ts_file'], mmap_mode='r')
+            inputs['timeseries'] = np.asarray(ts[int(row['ts_start']):int(row['ts_end'])], dtype=np.float64)
+
+        features = {}
+        for spec in specs:
+            name, params = parse_spec(spec)
+            source, fn = FEATURES[name]
+            if name == 'alff' and 'tr' not in params:
+                params['tr'] = float(row.get('ts_tr') or 2.0)
+            features[spec] = np.asarray(fn(inputs[source], params), dtype=np.float32)
+        return fname, features, None
+    except Exception as e:
+        return fname, {}, f'{type(e).__name__}: {e}'
+
+
+class NodeFeatureStore:
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.feature_dir = os.path.join(root_dir, FEATURE_DIR)
+        self.attributes = GraphAttributeStore(root_dir)
+        self._arrays = {}
+        self._index = {}
+        self._fingerprints = {}
+
+    def _paths(self, spec):
+        base = os.path.join(self.feature_dir, spec_slug(spec))
+        return base + '.npy', base + '.json'
+
+    def index(self, spec):
+        """{fname: row} of the stored rows of spec"""
+        if spec not in self._index:
+            _, index_path = self._paths(spec)
+            files, fingerprints = [], []
+            if os.path.exists(index_path):
+                with open(index_path) as f:
+                    stored = json.load(f)
+                files = stored['files']
+                # Stores written before fingerprints were recorded are recomputed once
+                fingerprints = stored.get('fingerprints', [None] * len(files))
+            self._index[spec] = {fname: i for i, fname in enumerate(files)}
+            self._fingerprints[spec] = dict(zip(files, fingerprints))
+        return self._index[spec]
+
+    def array(self, spec):
+        if spec not in self._arrays:
+            self._arrays[spec] = np.load(self._paths(spec)[0], mmap_mode='r')
+        return self._arrays[spec]
+
+    def _stale(self, spec, fname, fingerprints):
+        """No stored row of fname for spec, or one computed from other source files"""
+        return fname not in self.index(spec) or self._fingerprints[spec][fname] != fingerprints[spec_input(spec)]
+
+    def _pending(self, specs, files):
+        """[(fname, fingerprints, [stale specs])] of the files with a stale spec"""
+        pending = []
+        for fname in files:
+            fingerprints = source_fingerprints(os.path.join(self.root_dir, fname), self.attributes.rows.get(fname, {}))
+            stale = [spec for spec in specs if self._stale(spec, fname, fingerprints)]
+            if stale:
+                pending.append((fname, fingerprints, stale))
+        return pending
+
+    def missing(self, specs, files):
+        """Files with a spec not stored yet or stored from changed source files"""
+        return [fname for fname, _, _ in self._pending(specs, [os.path.basename(f) for f in files])]
+
+    def compute(self, specs, files=None, num_workers=None):
+        """Compute every (file, spec) not stored yet or stale; returns {fname: error} of failures"""
+        for spec in specs:
+            if parse_spec(spec)[0] not in FEATURES:
+                raise ValueError(f"Unknown node feature '{spec}', expected one of {sorted(FEATURES)}")
+        files = self.attributes.files() if files is None else [os.path.basename(f) for f in files]
+        pending = self._pending(specs, files)
+        if not pending:
+            return {}
+        print(f"🔧 Computing node features {specs} for {len(pending)} graphs")
+
+        fingerprints = {fname: fingerprint for fname, fingerprint, _ in pending}
+        jobs = [(os.path.join(self.root_dir, fname), self.attributes.rows.get(fname, {}), stale)
+                for fname, _, stale in pending]
+        workers = num_workers or os.cpu_count() or 1
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_compute_sample, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+        else:
+            results = [_compute_sample(job) for job in jobs]
+
+        failed = {fname: error for fname, _, error in results if error is not None}
+        for fname, error in failed.items():
+            print(f"Failed to compute node features of {fname}: {error}")
+        for spec in specs:
+            new = [(fname, features[spec]) for fname, features, error in results
+                   if error is None and spec in features]
+            if new:
+                self._write(spec, [fname for fname, _ in new], np.stack([value for _, value in new]),
+                            [fingerprints[fname][spec_input(spec)] for fname, _ in new])
+        return failed
+
+    def _write(self, spec, fnames, values, fingerprints):
+        """Replace the rows of stored fnames, append the others"""
+        array_path, index_path = self._paths(spec)
+        os.makedirs(self.feature_dir, exist_ok=True)
+        index = dict(self.index(spec))
+        stored = self._fingerprints[spec]
+        array = np.load(array_path) if os.path.exists(array_path) else values[:0]
+        self._arrays.pop(spec, None)
+
+        replaced = [i for i, fname in enumerate(fnames) if fname in index]
+        appended = [i for i, fname in enumerate(fnames) if fname not in index]
+        if replaced:
+            array[[index[fnames[i]] for i in replaced]] = values[replaced]
+        array = np.concatenate([array, values[appended]])
+        for i in appended:
+            index[fnames[i]] = len(index)
+        stored = {**stored, **dict(zip(fnames, fingerprints))}
+
+        tmp_path = array_path + '.tmp.npy'
+        np.save(tmp_path, array)
+        os.replace(tmp_path, array_path)
+        files = sorted(index, key=index.get)
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump({'spec': spec, 'files': files, 'fingerprints': [stored.get(fname) for fname in files]}, f)
+        os.replace(index_path + '.tmp', index_path)
+        self._index[spec] = index
+        self._fingerprints[spec] = stored
+
+    def get(self, fname, spec):
+        """[R, F] feature of one sample"""
+        return self.array(spec)[self.index(spec)[os.path.basename(fname)]]
+
+    def assemble(self, fname, specs):
+        """Node features x [R, sum F] of one sample, specs concatenated in order"""
+        return torch.from_numpy(np.concatenate([self.get(fname, spec) for spec in specs], axis=1))
@@ -0,0 +1,67 @@
+'''
+Mixed-precision (bf16 autocast) training and inference on CPU / GPU.
+
+    --precision fp32   default, no autocast
+    --precision bf16   torch.autocast(dtype=torch.bfloat16): the Linear edge-weight
+                       generators and the per-node matmul of MyNNConv and the
+                       classifier Linear layers run in bf16, messages are aggregated
+                       in bf16; the conv bias (fp32) brings the node features and
+                       the TopK scores back to fp32
+
+Numerically sensitive ops stay in fp32 under bf16:
+  * the edge softmax of MyNNConv and the final log_softmax of Network
+    (cast in the model code; no-ops in fp32)
+  * normalisation layers (BatchNorm / LayerNorm / GroupNorm / InstanceNorm):
+    keep_norm_fp32() casts their inputs to fp32 with forward pre-hooks
+  * losses: Trainer computes the loss terms outside autocast on fp32 outputs
+
+Parameters, gradients and optimizer state stay fp32 (autocast casts
+weights on the fly), so bf16 needs no loss scaling.
+'''
+
+import contextlib
+
+import torch
+import torch.nn as nn
+
+PRECISIONS = ('fp32', 'bf16')
+
+NORM_LAYERS = (nn.modules.batchnorm._BatchNorm, nn.LayerNorm, nn.GroupNorm,
+               nn.modules.instancenorm._InstanceNorm)
+
+
+def autocast(device, precision='fp32'):
+    """Autocast context for precision on device ('fp32': no-op context)"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    if precision == 'fp32':
+        return contextlib.nullcontext()
+    device_type = torch.device(device).type
+    return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+
+
+def _inputs_to_fp32(module, args):
+    return tuple(a.float() if torch.is_tensor(a) and a.is_floating_point() else a for a in args)
+
+
+def keep_norm_fp32(model):
+    """Run every normalisation layer of model on fp32 inputs; returns the hook handles"""
+    return [module.register_forward_pre_hook(_inputs_to_fp32)
+            for module in model.modules() if isinstance(module, NORM_LAYERS)]
+
+
+def bf16_hardware():
+    """Short description of native bf16 support of this CPU ('' if unknown)"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = next((line for line in f if line.startswith('flags')), '').split()
+    except OSError:
+        return ''
+    return ', '.join(flag for flag in ('amx_bf16', 'avx512_bf16') if flag in flags)
+
+
+def describe(device, precision):
+    if precision == 'fp32':
+        return f"fp32 on {device}"
+    native = bf16_hardware() if torch.device(device).type == 'cpu' else 'cuda'
+    return f"bf16 autocast on {device} ({native or 'no native bf16 instructions, expect a slowdown'})"
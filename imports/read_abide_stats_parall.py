@@ -13,14 +13,14 @@ import torch
 import numpy as np
 from scipy.io import loadmat
 from torch_geometric.data import Data
-import networkx as nx
-from networkx.convert_matrix import from_numpy_array as from_numpy_matrix
 import multiprocessing
 from torch_sparse import coalesce
 from torch_geometric.utils import remove_self_loops
 from functools import partial
 import deepdish as dd
 from imports.gdc import GDC
+from imports.graph_metrics import edge_list
+from imports.data_qc import fix_inf_nan_matrix
 
 
 def split(data, batch):
@@ -69,8 +69,9 @@ class NoDaemonContext(type(multiprocessing.get_context())):
     Process = NoDaemonProcess
 
 
-def read_data(data_dir):
-    onlyfiles = [f for f in listdir(data_dir) if osp.isfile(osp.join(data_dir, f))]
+def read_data(data_dir, exclude=()):
+    onlyfiles = [f for f in listdir(data_dir) if osp.isfile(osp.join(data_dir, f))
+                 and f.endswith('.h5') and f not in exclude]
     onlyfiles.sort()
     batch = []
     pseudo = []
@@ -127,8 +128,6 @@ def read_data(data_dir):
 
 def read_sigle_data(data_dir, filename, use_gdc=False):
     import deepdish as dd
-    from networkx.convert_matrix import from_numpy_array as from_numpy_matrix
-    import networkx as nx
     from torch_geometric.utils import remove_self_loops
     from torch_sparse import coalesce
     from imports.gdc import GDC
@@ -136,24 +135,13 @@ def read_sigle_data(data_dir, filename, use_gdc=False):
     import numpy as np
     import torch
     import os
-    def fix_inf_nan_matrix(matrix, diagonal_value=1.0):
-        fixed_matrix = matrix.copy()
-        fixed_matrix = np.nan_to_num(fixed_matrix, nan=0.0, posinf=1.0, neginf=-1.0)
-        np.fill_diagonal(fixed_matrix, diagonal_value)
-        return fixed_matrix
     temp = dd.io.load(os.path.join(data_dir, filename))
     pcorr = np.abs(temp['pcorr'][()])
     pcorr_fixed = fix_inf_nan_matrix(pcorr, diagonal_value=1.0)
     corr = temp['corr'][()]
     corr_fixed = fix_inf_nan_matrix(corr, diagonal_value=1.0)
     num_nodes = pcorr_fixed.shape[0]
-    G = from_numpy_matrix(pcorr_fixed)
-    A = nx.to_scipy_sparse_array(G)
-    adj = A.tocoo()
-    edge_att = np.zeros(len(adj.row))
-    for i in range(len(adj.row)):
-        edge_att[i] = pcorr_fixed[adj.row[i], adj.col[i]]
-    edge_index = np.stack([adj.row, adj.col])
+    edge_index, edge_att = edge_list(pcorr_fixed)
     edge_index, edge_att = remove_self_loops(torch.from_numpy(edge_index), torch.from_numpy(edge_att))
     edge_index = edge_index.long()
     edge_index, edge_att = coalesce(edge_index, edge_att, num_nodes, num_nodes)
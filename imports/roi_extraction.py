@@ -0,0 +1,144 @@
+'''
+ROI timeseries extraction with a precomputed sparse parcellation operator.
+
+A drop-in for NiftiLabelsMasker(labels_img=..., standardize=True).fit_transform
+in the graph builders. The atlas is resampled (nearest neighbour) to the
+BOLD grid once and turned into a sparse [R, V] averaging matrix with
+1 / n_voxels(ROI) on the voxels of every ROI; operators are cached per
+(atlas, BOLD shape, BOLD affine), so all runs of a dataset share one.
+
+The BOLD file is read through nibabel's proxy dataobj in chunks of
+chunk_size volumes (the file handle stays open, so .nii.gz is decompressed
+once, front to back). Each chunk is reduced by one sparse matmul in a
+thread pool while the next chunk is being read, so at most
+num_workers + 1 chunks are in memory.
+
+ROI i is the i-th smallest non-zero label present on the BOLD grid, the
+column order of NiftiLabelsMasker.
+'''
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import nibabel as nib
+from nibabel.processing import resample_from_to
+from scipy import sparse
+
+from imports.surface_projection import array_key
+
+
+class ParcellationOperator:
+    """Sparse ROI-averaging matrix of a label image on one voxel grid"""
+
+    def __init__(self, labels_img, shape, affine):
+        labels_img = nib.load(labels_img) if isinstance(labels_img, str) else labels_img
+        shape = tuple(int(n) for n in shape[:3])
+        affine = np.asarray(affine, dtype=float)
+
+        if labels_img.shape[:3] == shape and np.allclose(labels_img.affine, affine):
+            label_data = np.asarray(labels_img.dataobj)
+        else:
+            # Nearest-neighbour resampling, as NiftiLabelsMasker does for labels
+            resampled = resample_from_to(labels_img, (shape, affine), order=0, mode='constant', cval=0)
+            label_data = np.asarray(resampled.dataobj)
+        label_data = np.rint(label_data).astype(np.int64).reshape(-1, order='F')
+
+        self.shape = shape
+        self.affine = affine
+        self.labels = np.unique(label_data[label_data != 0])
+        self.num_rois = len(self.labels)
+
+        # Columns in Fortran voxel order, matching dataobj[..., t0:t1].reshape(-1, t, order='F')
+        voxels = np.flatnonzero(label_data)
+        rows = np.searchsorted(self.labels, label_data[voxels])
+        counts = np.bincount(rows, minlength=self.num_rois)
+        self.matrix = sparse.csr_matrix((1.0 / counts[rows], (rows, voxels)),
+                                        shape=(self.num_rois, label_data.size))
+
+    def reduce(self, chunk):
+        """[X, Y, Z, T] (or [X, Y, Z]) volumes -> [T, R] ROI means"""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.ndim == 3:
+            chunk = chunk[..., None]
+        return np.asarray(self.matrix @ chunk.reshape(-1, chunk.shape[-1], order='F')).T
+
+
+_operators = {}
+
+
+def get_parcellation_operator(labels_img, shape, affine):
+    """Cached ParcellationOperator per (atlas, grid shape, grid affine)"""
+    if isinstance(labels_img, str):
+        atlas_key = os.path.abspath(labels_img)
+    else:
+        atlas_key = (array_key(np.asarray(labels_img.dataobj)), array_key(labels_img.affine))
+    key = (atlas_key, tuple(int(n) for n in shape[:3]), array_key(np.asarray(affine, dtype=float)))
+    if key not in _operators:
+        _operators[key] = ParcellationOperator(labels_img, shape, affine)
+    return _operators[key]
+
+
+def standardize_signals(signals, standardize=True):
+    """z-score every column like nilearn.signal (True / 'zscore': population std, 'zscore_sample': ddof=1)"""
+    if not standardize or signals.shape[0] == 1:
+        return signals
+    if standardize not in (True, 'zscore', 'zscore_sample'):
+        raise ValueError(f"Unsupported standardize strategy: {standardize}")
+    signals = signals - signals.mean(axis=0)
+    std = signals.std(axis=0, ddof=1 if standardize == 'zscore_sample' else 0)
+    std[std < np.finfo(np.float64).eps] = 1.0
+    return signals / std
+
+
+def _volume_chunks(img, chunk_size):
+    if len(img.shape) == 3:
+        yield img.dataobj[...]
+        return
+    for start in range(0, img.shape[3], chunk_size):
+        yield img.dataobj[..., start:start + chunk_size]
+
+
+class RoiExtractor:
+    """NiftiLabelsMasker-compatible ROI extraction (fit_transform returns [T, R])
+
+    Args:
+        labels_img: atlas path or Nifti image
+        standardize: True / 'zscore' / 'zscore_sample' / False, see standardize_signals
+        chunk_size: volumes read and reduced per step
+        num_workers: reduction threads (default: CPU count)
+    """
+
+    def __init__(self, labels_img, standardize=True, chunk_size=32, num_workers=None):
+        self.labels_img = labels_img
+        self.standardize = standardize
+        self.chunk_size = chunk_size
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.labels_ = None
+
+    def operator_for(self, img):
+        return get_parcellation_operator(self.labels_img, img.shape, img.affine)
+
+    def fit_transform(self, img):
+        img = nib.load(img, keep_file_open=True) if isinstance(img, str) else img
+        operator = self.operator_for(img)
+        self.labels_ = operator.labels
+
+        parts = []
+        if self.num_workers == 1:
+            parts = [operator.reduce(chunk) for chunk in _volume_chunks(img, self.chunk_size)]
+        else:
+            # Read in this thread, reduce in the pool; bounded number of chunks in flight
+            with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+                pending = deque()
+                for chunk in _volume_chunks(img, self.chunk_size):
+                    pending.append(pool.submit(operator.reduce, chunk))
+                    if len(pending) > self.num_workers:
+                        parts.append(pending.popleft().result())
+                parts.extend(future.result() for future in pending)
+
+        signals = np.concatenate(parts, axis=0) if parts else np.zeros((0, operator.num_rois))
+        return standardize_signals(signals, self.standardize)
+
+    transform = fit_transform
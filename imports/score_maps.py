@@ -0,0 +1,102 @@
+'''
+Per-subject ROI score maps of the TopK pooling layers, memory-mapped on disk.
+
+Network.score_maps() returns, for every pooling layer, the TopK scores
+scattered back to [B, R] by ROI id plus the keep-mask (a dropped ROI has
+no score). ScoreMapWriter streams them batch by batch into .npy memmaps:
+
+    <save_dir>/score_maps.npy     float32 [n_subjects, n_layers, R]   0 where dropped
+    <save_dir>/keep_masks.npy     bool    [n_subjects, n_layers, R]
+    <save_dir>/predictions.npy    int64   [n_subjects]
+    <save_dir>/labels.npy         int64   [n_subjects]
+
+load_score_maps() opens them read-only (np.load(mmap_mode='r')) and
+roi_importance() reduces them over subjects in chunks, so neither side
+holds all subjects in memory.
+'''
+
+import os
+
+import numpy as np
+import torch
+
+FILES = {'scores': 'score_maps.npy', 'masks': 'keep_masks.npy',
+         'predictions': 'predictions.npy', 'labels': 'labels.npy'}
+
+
+def _numpy(value):
+    return value.detach().cpu().numpy() if torch.is_tensor(value) else np.asarray(value)
+
+
+class ScoreMapWriter:
+    """Streams [B, L, R] score maps / keep masks (and predictions / labels) into memmaps"""
+
+    def __init__(self, save_dir, n_subjects, n_layers, n_rois):
+        os.makedirs(save_dir, exist_ok=True)
+        self.save_dir = save_dir
+        self.n_subjects = n_subjects
+        open_memmap = np.lib.format.open_memmap
+        self.arrays = {
+            'scores': open_memmap(self._path('scores'), 'w+', np.float32, (n_subjects, n_layers, n_rois)),
+            'masks': open_memmap(self._path('masks'), 'w+', np.bool_, (n_subjects, n_layers, n_rois)),
+            'predictions': open_memmap(self._path('predictions'), 'w+', np.int64, (n_subjects,)),
+            'labels': open_memmap(self._path('labels'), 'w+', np.int64, (n_subjects,)),
+        }
+        self.offset = 0
+
+    def _path(self, key):
+        return os.path.join(self.save_dir, FILES[key])
+
+    def write(self, scores, masks, predictions=None, labels=None):
+        """Append one batch of subjects"""
+        scores, masks = _numpy(scores), _numpy(masks)
+        end = self.offset + scores.shape[0]
+        if end > self.n_subjects:
+            raise ValueError(f'{end} subjects written, the score maps were sized for {self.n_subjects}')
+        self.arrays['scores'][self.offset:end] = scores
+        self.arrays['masks'][self.offset:end] = masks
+        if predictions is not None:
+            self.arrays['predictions'][self.offset:end] = _numpy(predictions)
+        if labels is not None:
+            self.arrays['labels'][self.offset:end] = _numpy(labels).reshape(-1)
+        self.offset = end
+
+    def close(self):
+        for array in self.arrays.values():
+            array.flush()
+        return load_score_maps(self.save_dir)
+
+
+def load_score_maps(save_dir, mmap_mode='r'):
+    """dict of the memmapped arrays (scores, masks, predictions, labels)"""
+    return {key: np.load(os.path.join(save_dir, name), mmap_mode=mmap_mode) for key, name in FILES.items()}
+
+
+def roi_importance(scores, masks, subjects=None, layer=0, method='mean', chunk_size=1024):
+    """Per-ROI importance of one pooling layer over the selected subjects (bool mask or indices)
+
+    mean      mean score over the subjects that kept the ROI
+    weighted  same, each subject weighted by its highest kept score (its confidence)
+    max       highest score over the subjects that kept the ROI
+    An ROI no selected subject kept gets 0.
+    """
+    subjects = np.arange(scores.shape[0]) if subjects is None else np.asarray(subjects)
+    if subjects.dtype == np.bool_:
+        subjects = np.flatnonzero(subjects)
+    n_rois = scores.shape[-1]
+    total, weight, best = np.zeros(n_rois), np.zeros(n_rois), np.full(n_rois, -np.inf)
+    for start in range(0, len(subjects), chunk_size):
+        index = subjects[start:start + chunk_size]
+        s = np.asarray(scores[index, layer], dtype=np.float64)
+        m = np.asarray(masks[index, layer])
+        if method == 'weighted':
+            w = np.where(m, s, -np.inf).max(axis=1, keepdims=True)
+            w = np.where(np.isfinite(w), w, 0.0) * m
+        else:
+            w = m.astype(np.float64)
+        total += (w * s).sum(axis=0)
+        weight += w.sum(axis=0)
+        best = np.maximum(best, np.where(m, s, -np.inf).max(axis=0))
+    if method == 'max':
+        return np.where(np.isfinite(best), best, 0.0)
+    return np.divide(total, weight, out=np.zeros(n_rois), where=weight != 0)
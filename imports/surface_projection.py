@@ -0,0 +1,128 @@
+'''
+Projection of ROI values onto surface meshes for the 3D brain viewers.
+
+A SurfaceProjector builds one cKDTree over the ROI centroids of an atlas
+and maps all mesh vertices in a single vectorized query. Neighbour queries
+are cached per mesh, and projectors are cached per atlas, so re-colouring
+the same (mesh, atlas) pair with new ROI values only costs a gather.
+
+Modes:
+    nearest   value of the nearest ROI times exp(-d / decay)
+    knn       inverse-distance weighted mean of the k nearest ROI values
+    gaussian  sum of ROI values weighted by exp(-d^2 / (2 sigma^2))
+'''
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def array_key(array):
+    """Hashable content key of an array (shape, dtype and bytes)"""
+    array = np.ascontiguousarray(array)
+    return array.shape, array.dtype.str, hashlib.sha1(array.tobytes()).hexdigest()
+
+
+class SurfaceProjector:
+    def __init__(self, centroids, max_cached_meshes=8):
+        self.centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 3)
+        self.num_regions = len(self.centroids)
+        self.tree = cKDTree(self.centroids)
+        self.max_cached_meshes = max_cached_meshes
+        self._neighbours = OrderedDict()
+
+    def query(self, vertices, k=1, distance_upper_bound=np.inf):
+        """Distances and ROI indices of the k nearest centroids, [V, k] each.
+
+        Missing neighbours (beyond distance_upper_bound) have distance inf
+        and index num_regions.
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        k = min(k, self.num_regions)
+        key = (array_key(vertices), k, distance_upper_bound)
+
+        if key in self._neighbours:
+            self._neighbours.move_to_end(key)
+            return self._neighbours[key]
+
+        distance, index = self.tree.query(vertices, k=k, distance_upper_bound=distance_upper_bound)
+        distance = distance.reshape(len(vertices), k)
+        index = index.reshape(len(vertices), k)
+
+        self._neighbours[key] = (distance, index)
+        if len(self._neighbours) > self.max_cached_meshes:
+            self._neighbours.popitem(last=False)
+        return distance, index
+
+    def project(self, vertices, values, mode='nearest', k=4, decay=25.0, sigma=25.0, truncate=None):
+        """Per-vertex activation for ROI values, same leading shape as vertices[..., 3].
+
+        Args:
+            vertices: mesh vertices [..., 3] (e.g. np.stack([x, y, z], axis=-1) of a grid)
+            values: one value per ROI centroid
+            mode: 'nearest', 'knn' or 'gaussian'
+            k: neighbours used by 'knn'
+            decay: distance decay constant (mm) of 'nearest'
+            sigma: Gaussian width (mm) of 'gaussian'
+            truncate: ignore ROIs further than truncate * sigma in 'gaussian' (None = use all)
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        shape = vertices.shape[:-1]
+        # Padded with a zero for missing neighbours (index num_regions)
+        values = np.append(np.asarray(values, dtype=np.float64).ravel(), 0.0)
+
+        if mode == 'nearest':
+            distance, index = self.query(vertices, k=1)
+            activation = values[index[:, 0]] * np.exp(-distance[:, 0] / decay)
+
+        elif mode == 'knn':
+            distance, index = self.query(vertices, k=k)
+            weight = 1.0 / np.maximum(distance, 1e-6)
+            activation = (values[index] * weight).sum(axis=1) / weight.sum(axis=1)
+
+        elif mode == 'gaussian':
+            bound = np.inf if truncate is None else truncate * sigma
+            num_neighbours = self.num_regions
+            if truncate is not None:
+                # Centroids within bound of one vertex are within 2 * bound of each other,
+                # so this count bounds the neighbours any vertex can have
+                counts = self.tree.query_ball_point(self.centroids, 2 * bound, return_length=True)
+                num_neighbours = max(int(counts.max()), 1)
+            distance, index = self.query(vertices, k=num_neighbours, distance_upper_bound=bound)
+            weight = np.exp(-distance ** 2 / (2 * sigma ** 2))
+            activation = (values[index] * weight).sum(axis=1)
+
+        else:
+            raise ValueError(f"Unknown projection mode: {mode}")
+
+        return activation.reshape(shape)
+
+
+_projectors = OrderedDict()
+
+
+def get_projector(centroids, max_cached_atlases=8):
+    """Cached SurfaceProjector for an atlas (keyed by its centroid coordinates)"""
+    centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 3)
+    key = array_key(centroids)
+
+    if key not in _projectors:
+        _projectors[key] = SurfaceProjector(centroids)
+        if len(_projectors) > max_cached_atlases:
+            _projectors.popitem(last=False)
+    _projectors.move_to_end(key)
+    return _projectors[key]
+
+
+def project_activation(vertices, centroids, values, **kwargs):
+    """Project ROI values onto mesh vertices through the cached projector of the atlas"""
+    return get_projector(centroids).project(vertices, values, **kwargs)
+
+
+def region_arrays(brain_regions, coord_key='coords', value_key='activation'):
+    """(centroids [R, 3], values [R]) from the viewers' {name: {coords, activation}} dicts"""
+    centroids = np.array([region[coord_key] for region in brain_regions.values()], dtype=np.float64)
+    values = np.array([region[value_key] for region in brain_regions.values()], dtype=np.float64)
+    return centroids, values
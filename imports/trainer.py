@@ -0,0 +1,494 @@
+'''
+Training engine shared by the BrainGNN training scripts.
+
+    trainer = Trainer(model, optimizer, scheduler, forward=forward_multitask,
+                      loss_terms=[LossTerm('nll', nll_loss)], grad_clip=1.0)
+    history = trainer.fit(train_loader, val_loader, epochs=100, eval_every=1,
+                          monitor='val_acc', patience=20, checkpoint='./model/best.pth')
+    test = trainer.evaluate(test_loader)
+
+forward(model, data) -> (output [B, C], extras) adapts the model signature
+(forward_multitask, forward_network, forward_logits). Loss terms are
+fn(output, data, extras, model) -> scalar tensor; the training loss is
+their weighted sum, and every term is logged separately.
+
+The training pass accumulates the loss terms and the number of correct
+predictions on the device and reads them once per epoch, so there is no
+.item() per step and no extra pass over the training set for the training
+accuracy. Validation runs every eval_every epochs and after the last one;
+early stopping counts evaluations. Every epoch logs the throughput of the
+training pass in graphs/s.
+
+Checkpoints go through imports.checkpoints.CheckpointManager (CPU snapshot,
+background write), so saving does not stall the epoch loop; with a run
+directory fit(resume=True) continues a preempted run from its last epoch.
+
+EnsembleTrainer trains several members together, one Trainer (optimizer,
+scheduler, loss terms, early stopping, checkpoint) per member:
+
+    ensemble = EnsembleTrainer([Trainer(model, AdamW(model.parameters())) for model in models])
+    ensemble.fit(train_loader, val_loader, epochs=150, monitor='val_f1', patience=30,
+                 checkpoints=[f'./model/member_{i}.pth' for i in range(len(models))])
+
+Every batch is loaded and augmented once; members sharing an architecture
+run in one stacked forward / backward (net.stacked_ensemble), and members
+that stopped early leave the following passes.
+'''
+
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from sklearn.metrics import f1_score
+
+from imports.checkpoints import CheckpointManager, cpu_state
+from imports.precision import autocast, keep_norm_fp32
+from net.stacked_ensemble import ensemble_forward, group_members
+
+EPS = 1e-10
+
+
+class LossTerm:
+    def __init__(self, name, fn, weight=1.0):
+        self.name = name
+        self.fn = fn
+        self.weight = weight
+
+
+# ---- model signatures ----
+
+def forward_multitask(model, data):
+    """MultiTaskBrainGNN / ImprovedBrainGNN: model(data) -> (out, task_type)"""
+    out, task_type = model(data)
+    return out, {'task_type': task_type}
+
+
+def forward_network(model, data):
+    """net.braingnn.Network: (out, perm1, score1, perm2, score2, perm3, score3)"""
+    out, *pools = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos,
+                        edge_norm=getattr(data, 'edge_norm', None))
+    return out, {'perm': pools[0::2], 'score': pools[1::2]}
+
+
+def forward_logits(model, data):
+    """Models returning the output tensor only"""
+    return model(data), {}
+
+
+# ---- loss terms ----
+
+def nll_loss(output, data, extras, model):
+    return F.nll_loss(output, data.y)
+
+
+def cross_entropy_loss(output, data, extras, model):
+    return F.cross_entropy(output, data.y)
+
+
+def weighted_nll_loss(class_weights):
+    """NLL with per-class weights, averaged over the batch"""
+    def fn(output, data, extras, model):
+        if class_weights is None:
+            return F.nll_loss(output, data.y)
+        return (F.nll_loss(output, data.y, reduction='none') * class_weights[data.y]).mean()
+    return fn
+
+
+def label_smoothing_loss(smoothing=0.1):
+    """KL divergence to the smoothed one-hot target while training, plain NLL in evaluation"""
+    def fn(output, data, extras, model):
+        if not model.training:
+            return F.nll_loss(output, data.y)
+        n_classes = output.size(1)
+        target = torch.zeros_like(output).scatter_(1, data.y.unsqueeze(1), 1)
+        target = target * (1 - smoothing) + smoothing / n_classes
+        return F.kl_div(F.log_softmax(output, dim=1), target, reduction='batchmean')
+    return fn
+
+
+def pool_scores(extras, layer, num_graphs):
+    """sigmoid TopK scores of pooling layer (1-based) as [B, k], as the original BrainGNN returns them"""
+    return torch.sigmoid(extras['score'][layer - 1].float()).view(num_graphs, -1)
+
+
+def unit_loss(layer):
+    """(||w|| - 1)^2 of the TopK projection vector of pool<layer>"""
+    def fn(output, data, extras, model):
+        weight = getattr(model, f'pool{layer}').pool.select.weight
+        return (torch.norm(weight, p=2) - 1) ** 2
+    return fn
+
+
+def topk_loss(layer, ratio):
+    """Pushes the kept / dropped TopK scores of pool<layer> towards 1 / 0"""
+    def fn(output, data, extras, model):
+        r = 1 - ratio if ratio > 0.5 else ratio
+        s = pool_scores(extras, layer, data.num_graphs).sort(dim=1).values
+        return -torch.log(s[:, -int(s.size(1) * r):] + EPS).mean() - torch.log(1 - s[:, :int(s.size(1) * r)] + EPS).mean()
+    return fn
+
+
+def consist_loss(layer, nclass):
+    """Group-level consistency of the pool<layer> scores within every class"""
+    def fn(output, data, extras, model):
+        s1 = pool_scores(extras, layer, data.num_graphs)
+        loss = output.new_zeros(())
+        for c in range(nclass):
+            s = torch.sigmoid(s1[data.y == c])
+            if len(s) == 0:
+                continue
+            laplacian = len(s) * torch.eye(len(s), device=s.device) - torch.ones(len(s), len(s), device=s.device)
+            loss = loss + torch.trace(s.t() @ laplacian @ s) / (len(s) * len(s))
+        return loss
+    return fn
+
+
+def l2_loss(output, data, extras, model):
+    return sum(torch.norm(param, p=2) for param in model.parameters())
+
+
+def braingnn_loss_terms(opt, classification=nll_loss):
+    """Classification loss and the BrainGNN regularisers, weighted by opt.lamb0 .. opt.lamb5"""
+    terms = [LossTerm('classification', classification, opt.lamb0),
+             LossTerm('unit1', unit_loss(1), opt.lamb1),
+             LossTerm('unit2', unit_loss(2), opt.lamb2),
+             LossTerm('topk1', topk_loss(1, opt.ratio), opt.lamb3),
+             LossTerm('topk2', topk_loss(2, opt.ratio), opt.lamb4),
+             LossTerm('consist', consist_loss(1, opt.nclass), opt.lamb5)]
+    return terms
+
+
+# ---- engine ----
+
+class _PassStats:
+    """Loss terms and correct predictions of one pass, summed on the device and read once"""
+
+    def __init__(self, trainer, keep_outputs=False):
+        self.loss_terms = trainer.loss_terms
+        self.device = trainer.device
+        self.sums = torch.zeros(len(self.loss_terms) + 1, device=self.device)
+        self.correct = torch.zeros((), dtype=torch.long, device=self.device)
+        self.n = 0
+        self.outputs = ([], [], []) if keep_outputs else None  # labels, preds, probs
+
+    @torch.no_grad()
+    def add(self, data, output, total, terms):
+        self.sums += torch.stack([total.detach()] + [torch.as_tensor(t, device=self.device).detach().float()
+                                                     for t in terms]) * data.num_graphs
+        pred = output.argmax(dim=1)
+        self.correct += (pred == data.y).sum()
+        self.n += data.num_graphs
+        if self.outputs is not None:
+            for values, value in zip(self.outputs, (data.y, pred, torch.softmax(output, dim=1))):
+                values.append(value)
+
+    def summary(self):
+        """loss / per-term losses / acc; with kept outputs also weighted f1, labels, preds and probs (numpy)"""
+        values = (self.sums / max(self.n, 1)).tolist()  # one device sync per pass
+        summary = {'loss': values[0], 'acc': self.correct.item() / max(self.n, 1)}
+        summary.update({term.name: value for term, value in zip(self.loss_terms, values[1:])})
+        if self.outputs is not None:
+            labels, preds, probs = self.outputs
+            labels = torch.cat(labels).cpu().numpy() if labels else np.zeros(0, dtype=np.int64)
+            preds = torch.cat(preds).cpu().numpy() if preds else np.zeros(0, dtype=np.int64)
+            summary['f1'] = f1_score(labels, preds, average='weighted') if self.n else 0.0
+            summary.update(labels=labels, preds=preds, probs=torch.cat(probs).cpu().numpy() if probs else None)
+        return summary
+
+
+class Trainer:
+    """Epoch loop with pluggable loss terms
+
+    Args:
+        forward: forward(model, data) -> (output, extras)
+        loss_terms: [LossTerm], default NLL
+        grad_clip: max gradient norm, or None
+        augment: augment(data) -> data applied to every training batch
+        on_epoch_end: on_epoch_end(epoch, record) after every epoch (logging, extra checkpoints)
+        log_every: print every log_every epochs
+        precision: 'fp32' or 'bf16' (autocast forward, loss terms in fp32; see imports.precision)
+        name: prefix of the log lines (ensemble members)
+    """
+
+    def __init__(self, model, optimizer, scheduler=None, device=None, forward=forward_multitask,
+                 loss_terms=None, grad_clip=None, augment=None, on_epoch_end=None, log_every=1,
+                 precision='fp32', name=None):
+        self.device = device or next(model.parameters()).device
+        self.model = model.to(self.device)
+        self.optimizer = optimizer
+        self.scheduler = scheduler
+        self.forward = forward
+        self.loss_terms = loss_terms or [LossTerm('nll', nll_loss)]
+        self.grad_clip = grad_clip
+        self.augment = augment
+        self.on_epoch_end = on_epoch_end
+        self.log_every = log_every
+        self.precision = precision
+        self.name = name
+        if precision != 'fp32':
+            keep_norm_fp32(self.model)
+        self.best_state = None
+        self.best_score = None
+        self.history = []
+
+    def _loss(self, data):
+        with autocast(self.device, self.precision):
+            output, extras = self.forward(self.model, data)
+        return self._loss_terms(output, data, extras)
+
+    def _loss_terms(self, output, data, extras):
+        output = output.float()
+        terms = [term.fn(output, data, extras, self.model) for term in self.loss_terms]
+        total = sum(term.weight * value for term, value in zip(self.loss_terms, terms))
+        return output, total, terms
+
+    def _step(self):
+        if self.grad_clip:
+            torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.grad_clip)
+        self.optimizer.step()
+
+    def train_epoch(self, loader):
+        """One pass over loader; loss terms and accuracy accumulated on the device"""
+        self.model.train()
+        stats = _PassStats(self)
+        start = time.perf_counter()
+
+        for data in loader:
+            data = data.to(self.device)
+            if self.augment is not None:
+                data = self.augment(data)
+            self.optimizer.zero_grad()
+            output, total, terms = self._loss(data)
+            total.backward()
+            self._step()
+            stats.add(data, output, total, terms)
+
+        summary = stats.summary()
+        summary['graphs_per_s'] = stats.n / (time.perf_counter() - start)
+        return summary
+
+    @torch.inference_mode()
+    def evaluate(self, loader):
+        """loss / per-term losses / acc / weighted f1, with labels, preds and probs as numpy arrays"""
+        self.model.eval()
+        stats = _PassStats(self, keep_outputs=True)
+        for data in loader:
+            data = data.to(self.device)
+            stats.add(data, *self._loss(data))
+        return stats.summary()
+
+    def _improved(self, score, mode):
+        if self.best_score is None:
+            return True
+        return score < self.best_score if mode == 'min' else score > self.best_score
+
+    def fit(self, train_loader, val_loader=None, epochs=100, eval_every=1, monitor='val_acc',
+            patience=None, checkpoint=None, resume=False):
+        """Train for epochs; returns the per-epoch history (list of dicts)
+
+        monitor: 'val_acc' / 'val_f1' (maximised) or 'val_loss' (minimised); the best weights are kept
+        on CPU in best_state. patience counts evaluations without improvement.
+        checkpoint: path the best weights are exported to, or a CheckpointManager (top-k / last / resume);
+        files are written in a background thread. resume: continue from the manager's last checkpoint.
+        """
+        start_epoch = self._start_fit(monitor, patience, checkpoint, resume)
+        for epoch in range(start_epoch, epochs):
+            if self.stopped:
+                break
+            train = self.train_epoch(train_loader)
+            val = self.evaluate(val_loader) if evaluate_epoch(val_loader, epoch, epochs, eval_every) else None
+            self._end_epoch(epoch, epochs, train, val)
+        self._end_fit()
+        return self.history
+
+    def _start_fit(self, monitor, patience, checkpoint, resume):
+        """Monitor, patience and checkpoint manager of a fit; returns the epoch to start from"""
+        self.monitor = monitor
+        self.mode = 'min' if monitor.endswith('loss') else 'max'
+        self.patience = patience
+        self.checkpoint = checkpoint
+        self.manager = checkpoint if isinstance(checkpoint, CheckpointManager) else None
+        if checkpoint and self.manager is None:
+            self.manager = CheckpointManager(weights_path=checkpoint)
+        if self.manager is not None:
+            self.manager.set_monitor(monitor, self.mode)
+
+        self.bad_evals = 0
+        start_epoch = 0
+        if resume and self.manager is not None:
+            start_epoch, state = self.manager.resume(self.model, self.optimizer, self.scheduler)
+            if start_epoch:
+                self.history = state.get('history', [])
+                self.best_score = state.get('best_score')
+                self.bad_evals = state.get('bad_evals', 0)
+                self.best_state = self.manager.best_state_dict()
+        return start_epoch
+
+    @property
+    def stopped(self):
+        """patience evaluations without improvement (early stopping)"""
+        return self.patience is not None and self.bad_evals >= self.patience
+
+    def _end_epoch(self, epoch, epochs, train, val=None):
+        """Record the epoch: best weights / patience, scheduler, checkpoint, log; returns the record"""
+        record = {'epoch': epoch + 1, 'lr': self.optimizer.param_groups[0]['lr']}
+        record.update({f'train_{k}': v for k, v in train.items()})
+
+        if val is not None:
+            record.update({f'val_{k}': val[k] for k in ['loss', 'acc', 'f1'] + [t.name for t in self.loss_terms]})
+            record['improved'] = self._improved(record[self.monitor], self.mode)
+            if record['improved']:
+                self.best_score = record[self.monitor]
+                self.best_state = cpu_state(self.model.state_dict())
+                self.bad_evals = 0
+            else:
+                self.bad_evals += 1
+
+        if self.scheduler is not None:
+            if isinstance(self.scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+                if val is not None:
+                    self.scheduler.step(record[self.monitor])
+            else:
+                self.scheduler.step()
+
+        self.history.append(record)
+        if self.manager is not None:
+            self.manager.save(self.model, self.optimizer, self.scheduler, epoch + 1, record,
+                              state={'history': self.history, 'best_score': self.best_score,
+                                     'bad_evals': self.bad_evals})
+        if (epoch + 1) % self.log_every == 0 or epoch == epochs - 1:
+            self.log(record, epochs)
+        if self.on_epoch_end is not None:
+            self.on_epoch_end(epoch, record)
+
+        if self.stopped:
+            print(f"🛑 {self._prefix()}Early stopping after {epoch + 1} epochs "
+                  f"(best {self.monitor}: {self.best_score:.4f})")
+        return record
+
+    def _end_fit(self):
+        if self.manager is not None:
+            if self.manager is self.checkpoint:
+                self.manager.wait()
+            else:
+                self.manager.close()
+
+    def _prefix(self):
+        return f"{self.name} | " if self.name else ''
+
+    def log(self, record, epochs):
+        line = (f"{self._prefix()}Epoch {record['epoch']:3d}/{epochs} | Loss: {record['train_loss']:.4f} | "
+                f"Train Acc: {record['train_acc']:.4f}")
+        if 'val_acc' in record:
+            line += f" | Val Loss: {record['val_loss']:.4f} | Val Acc: {record['val_acc']:.4f} | Val F1: {record['val_f1']:.4f}"
+        line += f" | LR: {record['lr']:.6f} | {record['train_graphs_per_s']:.1f} graphs/s"
+        if record.get('improved'):
+            line += ' ✅'
+        print(line)
+
+    def restore_best(self):
+        """Load the best weights seen by fit()"""
+        if self.best_state is not None:
+            self.model.load_state_dict(self.best_state)
+        return self.model
+
+
+def evaluate_epoch(val_loader, epoch, epochs, eval_every):
+    """Validation every eval_every epochs and after the last one"""
+    return val_loader is not None and ((epoch + 1) % eval_every == 0 or epoch == epochs - 1)
+
+
+class EnsembleTrainer:
+    """Epoch loop of several members trained on the same batches
+
+    Every member is a Trainer with forward_multitask models (MultiTaskBrainGNN / ImprovedBrainGNN) and keeps
+    its own optimizer, scheduler, loss terms, grad clipping, best weights, early stopping and log. Each batch
+    is moved to the device and augmented once (the augment of the member trainers is not used); members
+    of the same architecture are evaluated in one stacked forward, and since they share no parameters, the
+    backward of the summed member losses gives every member its own gradients. Loss terms and correct
+    predictions are accumulated on the device per member.
+
+    Args:
+        trainers: [Trainer], one per member, on the same device
+        augment: augment(data) -> data applied to every training batch
+    """
+
+    def __init__(self, trainers, augment=None):
+        self.trainers = trainers
+        self.augment = augment
+        self.device = trainers[0].device
+        self.precision = trainers[0].precision
+
+    def _outputs(self, trainers, data, groups):
+        """[(output, total, terms)] of the trainers' models on data"""
+        with autocast(self.device, self.precision):
+            outputs = ensemble_forward([trainer.model for trainer in trainers], data, groups)
+        return [trainer._loss_terms(out, data, {'task_type': task_type})
+                for trainer, (out, task_type) in zip(trainers, outputs)]
+
+    def train_epoch(self, trainers, loader):
+        """One pass over loader for trainers; [summary] as Trainer.train_epoch"""
+        groups = group_members([trainer.model for trainer in trainers])
+        stats = [_PassStats(trainer) for trainer in trainers]
+        for trainer in trainers:
+            trainer.model.train()
+        start = time.perf_counter()
+
+        for data in loader:
+            data = data.to(self.device)
+            if self.augment is not None:
+                data = self.augment(data)
+            for trainer in trainers:
+                trainer.optimizer.zero_grad()
+            outputs = self._outputs(trainers, data, groups)
+            sum(total for _, total, _ in outputs).backward()
+            for trainer, member_stats, output in zip(trainers, stats, outputs):
+                trainer._step()
+                member_stats.add(data, *output)
+
+        elapsed = time.perf_counter() - start
+        summaries = [member_stats.summary() for member_stats in stats]
+        for summary, member_stats in zip(summaries, stats):
+            summary['graphs_per_s'] = member_stats.n / elapsed
+        return summaries
+
+    @torch.inference_mode()
+    def evaluate(self, trainers, loader):
+        """[summary] of trainers as Trainer.evaluate, in one pass over loader"""
+        groups = group_members([trainer.model for trainer in trainers])
+        stats = [_PassStats(trainer, keep_outputs=True) for trainer in trainers]
+        for trainer in trainers:
+            trainer.model.eval()
+        for data in loader:
+            data = data.to(self.device)
+            for member_stats, output in zip(stats, self._outputs(trainers, data, groups)):
+                member_stats.add(data, *output)
+        return [member_stats.summary() for member_stats in stats]
+
+    def fit(self, train_loader, val_loader=None, epochs=100, eval_every=1, monitor='val_acc',
+            patience=None, checkpoints=None):
+        """Train all members for epochs; returns their histories
+
+        monitor / patience as Trainer.fit, per member; a member that stops early leaves the following
+        passes. checkpoints: one checkpoint (path or CheckpointManager) per member, or None.
+        """
+        checkpoints = checkpoints or [None] * len(self.trainers)
+        for trainer, checkpoint in zip(self.trainers, checkpoints):
+            trainer._start_fit(monitor, patience, checkpoint, resume=False)
+
+        for epoch in range(epochs):
+            active = [trainer for trainer in self.trainers if not trainer.stopped]
+            if not active:
+                break
+            train = self.train_epoch(active, train_loader)
+            if evaluate_epoch(val_loader, epoch, epochs, eval_every):
+                val = self.evaluate(active, val_loader)
+            else:
+                val = [None] * len(active)
+            for trainer, member_train, member_val in zip(active, train, val):
+                trainer._end_epoch(epoch, epochs, member_train, member_val)
+
+        for trainer in self.trainers:
+            trainer._end_fit()
+        return [trainer.history for trainer in self.trainers]
@@ -0,0 +1,161 @@
+'''
+Rasterization of ROI importance scores into NIfTI volumes.
+
+Atlas mode paints every voxel of ROI i with scores[i] through a
+label -> value lookup table, i.e. one numpy indexing op over the label
+volume of an atlas such as atlas_116.nii.gz. ROI i is the i-th smallest
+non-zero label, which is the AAL order for both 1..116 and AAL code
+(2001, 2002, ...) label images.
+
+Coordinate mode stamps a truncated Gaussian sphere around the MNI
+coordinate of every ROI. The kernel is built once as an outer product
+of 1-D Gaussians (masked to the sphere) and added block-wise.
+
+Results are cached by (atlas, score-vector hash).
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+import nibabel as nib
+from scipy.ndimage import gaussian_filter
+
+from imports.surface_projection import array_key
+
+# MNI152 2mm grid used by the SurfIce / glass-brain exports
+MNI152_2MM_SHAPE = (91, 109, 91)
+MNI152_2MM_AFFINE = np.array([
+    [-2, 0, 0, 90],
+    [0, 2, 0, -126],
+    [0, 0, 2, -72],
+    [0, 0, 0, 1]
+], dtype=float)
+
+
+def _cache_get(cache, key):
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    return None
+
+
+def _cache_put(cache, key, volume, max_size):
+    volume.flags.writeable = False
+    cache[key] = volume
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+    return volume
+
+
+class AtlasRasterizer:
+    def __init__(self, atlas_path='atlas_116.nii.gz', max_cached=32):
+        atlas_img = nib.load(atlas_path)
+        labels = np.asarray(atlas_img.dataobj).astype(np.int64)
+
+        self.atlas_path = atlas_path
+        self.affine = atlas_img.affine
+        self.shape = labels.shape
+        self.labels = np.unique(labels[labels > 0])
+        self.num_rois = len(self.labels)
+
+        # Voxel -> ROI index + 1 (0 = background), computed once per atlas
+        roi_index = np.searchsorted(self.labels, labels)
+        self.roi_index = np.where(labels > 0, roi_index + 1, 0).astype(np.int32)
+
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+
+    def rasterize(self, scores, background=0.0):
+        """Volume with scores[i] on ROI i; scores [R] -> [X, Y, Z] or [S, R] -> [S, X, Y, Z].
+
+        Single score vectors are cached and returned read-only.
+        """
+        scores = np.asarray(scores, dtype=np.float32)
+        if scores.shape[-1] != self.num_rois:
+            raise ValueError(f"Expected {self.num_rois} ROI scores, got {scores.shape[-1]}")
+
+        if scores.ndim == 1:
+            key = (array_key(scores), background)
+            volume = _cache_get(self._cache, key)
+            if volume is not None:
+                return volume
+
+        lut = np.concatenate([np.full(scores.shape[:-1] + (1,), background, dtype=np.float32), scores], axis=-1)
+        volume = lut[..., self.roi_index]
+
+        if scores.ndim == 1:
+            return _cache_put(self._cache, key, volume, self.max_cached)
+        return volume
+
+    def to_nifti(self, scores, background=0.0):
+        return nib.Nifti1Image(np.array(self.rasterize(scores, background)), self.affine)
+
+
+_atlas_rasterizers = {}
+
+
+def get_atlas_rasterizer(atlas_path='atlas_116.nii.gz'):
+    """Cached AtlasRasterizer per atlas file"""
+    if atlas_path not in _atlas_rasterizers:
+        _atlas_rasterizers[atlas_path] = AtlasRasterizer(atlas_path)
+    return _atlas_rasterizers[atlas_path]
+
+
+def rasterize_atlas(scores, atlas_path='atlas_116.nii.gz', background=0.0):
+    return get_atlas_rasterizer(atlas_path).rasterize(scores, background)
+
+
+def sphere_kernel(radius):
+    """(2r+1)^3 Gaussian sphere exp(-0.5 (d / (r/2))^2) for d <= r, as separable 1-D factors"""
+    offsets = np.arange(-radius, radius + 1, dtype=float)
+    gauss = np.exp(-0.5 * (offsets / (radius / 2)) ** 2)
+    kernel = gauss[:, None, None] * gauss[None, :, None] * gauss[None, None, :]
+
+    dist2 = offsets[:, None, None] ** 2 + offsets[None, :, None] ** 2 + offsets[None, None, :] ** 2
+    kernel[dist2 > radius ** 2] = 0
+    return kernel
+
+
+_coordinate_cache = OrderedDict()
+
+
+def rasterize_coordinates(coords, values, shape=MNI152_2MM_SHAPE, affine=MNI152_2MM_AFFINE,
+                          radius=8, smoothing=1.5, max_cached=32):
+    """Volume with a Gaussian sphere of height values[i] at MNI coordinate coords[i].
+
+    Args:
+        coords: [R, 3] MNI coordinates (mm)
+        values: [R] activation / importance per ROI
+        radius: sphere radius in voxels
+        smoothing: sigma (voxels) of a final Gaussian filter, None to skip
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    values = np.asarray(values, dtype=float).ravel()
+    affine = np.asarray(affine, dtype=float)
+
+    key = (tuple(shape), array_key(affine), array_key(coords), array_key(values), radius, smoothing)
+    volume = _cache_get(_coordinate_cache, key)
+    if volume is not None:
+        return volume
+
+    kernel = sphere_kernel(radius)
+    volume = np.zeros(shape)
+    centers = nib.affines.apply_affine(np.linalg.inv(affine), coords).astype(int)
+
+    for center, value in zip(centers, values):
+        # Clip the kernel block to the volume
+        lo = center - radius
+        hi = center + radius + 1
+        v_lo = np.maximum(lo, 0)
+        v_hi = np.minimum(hi, shape)
+        if np.any(v_hi <= v_lo):
+            continue
+        k_lo = v_lo - lo
+        k_hi = k_lo + (v_hi - v_lo)
+        volume[v_lo[0]:v_hi[0], v_lo[1]:v_hi[1], v_lo[2]:v_hi[2]] += \
+            value * kernel[k_lo[0]:k_hi[0], k_lo[1]:k_hi[1], k_lo[2]:k_hi[2]]
+
+    if smoothing:
+        volume = gaussian_filter(volume, sigma=smoothing)
+
+    return _cache_put(_coordinate_cache, key, volume, max_cached)
@@ -0,0 +1,170 @@
+'''
+Windowed functional connectivity for trial and dynamic (sliding-window) graphs.
+
+window_correlations() returns nan_to_num(np.corrcoef(ts[s:e].T)) for many
+(start, end) windows at once, grouped by window length:
+
+  * windows up to STRIDED_MAX_WIDTH volumes: batched matmuls over a strided
+    view of the timeseries (no per-window copy before centring)
+  * longer windows: prefix sums of x and x x^T formed only at the distinct
+    window boundaries (one BLAS product per block between consecutive
+    boundaries), after which every window costs two subtractions:
+
+        n = e - s,  sx = Sx[e] - Sx[s],  sxx = Sxx[e] - Sxx[s]
+        cov = sxx - sx sx^T / n,  corr = cov / sqrt(diag(cov) diag(cov)^T)
+
+The timeseries is centred on its global mean first, which keeps the
+prefix sums well conditioned for raw BOLD signals.
+
+write_fc_windows() stores all windows of a run as one [W, R, R] float32
+.npy (written and read back as a memmap) plus a [W, 2] <name>_windows.npy
+with the (start, end) volumes (and an optional id column).
+'''
+
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from imports.bids_index import volume_window
+
+# Above this window length the prefix-sum path is cheaper than one matmul per window
+STRIDED_MAX_WIDTH = 128
+
+
+def sliding_windows(n_timepoints, width, step=1):
+    """(starts, ends) of fixed-width windows [s, s + width) every step volumes"""
+    starts = np.arange(0, n_timepoints - width + 1, step, dtype=np.int64)
+    return starts, starts + width
+
+
+def event_windows(onsets, durations, tr, n_timepoints=None):
+    """(starts, ends) of event windows (volume_window convention); invalid windows give start == end
+
+    A window is invalid when it is empty or, with n_timepoints given, runs past the end of the run.
+    """
+    starts = np.empty(len(onsets), dtype=np.int64)
+    ends = np.empty(len(onsets), dtype=np.int64)
+    for i, (onset, duration) in enumerate(zip(onsets, durations)):
+        starts[i], ends[i] = volume_window(onset, duration, tr)
+    invalid = ends <= starts
+    if n_timepoints is not None:
+        invalid |= ends > n_timepoints
+    ends[invalid] = starts[invalid]
+    return starts, ends
+
+
+def _boundary_sums(ts, boundaries):
+    """Prefix sums Sx [B, R] and Sxx [B, R, R] of ts at the sorted boundaries"""
+    n_boundaries, n_roi = len(boundaries), ts.shape[1]
+    sx = np.zeros((n_boundaries, n_roi))
+    sxx = np.zeros((n_boundaries, n_roi, n_roi))
+    for i in range(1, n_boundaries):
+        block = ts[boundaries[i - 1]:boundaries[i]]
+        sx[i] = sx[i - 1] + block.sum(axis=0)
+        sxx[i] = sxx[i - 1] + block.T @ block
+    return sx, sxx
+
+
+def _normalize(cov, n, scale):
+    """cov [B, R, R] -> correlations (in place); 0 for constant ROIs and windows below 2 volumes
+
+    scale [B, R] is the raw second moment of each ROI in the window: rounding leaves tiny
+    variances for constant ROIs, where corrcoef gives nan (-> 0).
+    """
+    diagonal = np.arange(cov.shape[-1])
+    var = cov[:, diagonal, diagonal]
+    degenerate = (var <= 1e-12 * scale) | (n[:, None] < 2)
+    inv_std = 1.0 / np.sqrt(np.where(degenerate, 1.0, var))
+    inv_std[degenerate] = 0.0
+    cov *= inv_std[:, :, None]
+    cov *= inv_std[:, None, :]
+    return np.clip(cov, -1, 1, out=cov)
+
+
+def _prefix_sum_correlations(ts, starts, ends, rows, out, batch_size):
+    boundaries = np.unique(np.concatenate([[0], starts[rows], ends[rows]]))
+    sx, sxx = _boundary_sums(ts, boundaries)
+    diagonal = np.arange(ts.shape[1])
+    for b0 in range(0, len(rows), batch_size):
+        batch = rows[b0:b0 + batch_size]
+        s = np.searchsorted(boundaries, starts[batch])
+        e = np.searchsorted(boundaries, ends[batch])
+        n = (ends[batch] - starts[batch]).astype(np.float64)
+        win_sx = sx[e] - sx[s]
+        cov = sxx[e]
+        cov -= sxx[s]
+        scale = np.abs(cov[:, diagonal, diagonal])
+        cov -= win_sx[:, :, None] * (win_sx / np.maximum(n, 1)[:, None])[:, None, :]
+        out[batch] = _normalize(cov, n, scale)
+
+
+def _strided_correlations(ts, starts, width, rows, out, batch_size):
+    view = sliding_window_view(ts, width, axis=0)  # [T - width + 1, R, width], no copy
+    for b0 in range(0, len(rows), batch_size):
+        batch = rows[b0:b0 + batch_size]
+        x = view[starts[batch]]
+        scale = np.einsum('brw,brw->br', x, x)
+        x = x - x.mean(axis=-1, keepdims=True)
+        cov = x @ x.transpose(0, 2, 1)
+        out[batch] = _normalize(cov, np.full(len(batch), float(width)), scale)
+
+
+def window_correlations(ts, starts, ends, out=None, batch_size=128, strided_max_width=STRIDED_MAX_WIDTH):
+    """FC matrices [W, R, R] of ts [T, R] over the windows [starts[i], ends[i])
+
+    Matches np.nan_to_num(np.corrcoef(ts[s:e].T)): constant ROIs and windows
+    shorter than 2 volumes give 0 rows. out may be a preallocated (memmap) array.
+    Windows up to strided_max_width volumes use batched matmuls over a strided
+    view, longer ones the boundary prefix sums.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    ts = ts - ts.mean(axis=0)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if np.any(starts < 0) or np.any(ends > len(ts)) or np.any(ends < starts):
+        raise ValueError(f"Windows must lie within the {len(ts)} volumes of the timeseries")
+
+    n_roi = ts.shape[1]
+    if out is None:
+        out = np.empty((len(starts), n_roi, n_roi), dtype=np.float32)
+
+    widths = ends - starts
+    long_rows = []
+    for width in np.unique(widths):
+        rows = np.flatnonzero(widths == width)
+        if 2 <= width <= strided_max_width:
+            _strided_correlations(ts, starts, int(width), rows, out, batch_size)
+        else:
+            long_rows.append(rows)
+    if long_rows:
+        _prefix_sum_correlations(ts, starts, ends, np.concatenate(long_rows), out, batch_size)
+    return out
+
+
+def windows_path(fc_path):
+    return os.path.splitext(fc_path)[0] + '_windows.npy'
+
+
+def write_fc_windows(fc_path, ts, starts, ends, ids=None, batch_size=128):
+    """All window FCs of one run as a [W, R, R] float32 memmap .npy (+ <name>_windows.npy)
+
+    The windows file holds (start, end) per row, or (start, end, id) with ids (e.g. trial indices).
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    n_roi = np.shape(ts)[1]
+    tmp_path = fc_path + '.tmp.npy'
+    fc = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(len(starts), n_roi, n_roi))
+    window_correlations(ts, starts, ends, out=fc, batch_size=batch_size)
+    fc.flush()
+    del fc
+    columns = [starts, ends] if ids is None else [starts, ends, np.asarray(ids, dtype=np.int64)]
+    np.save(windows_path(fc_path), np.stack(columns, axis=1))
+    os.replace(tmp_path, fc_path)
+    return fc_path
+
+
+def load_fc_windows(fc_path, mmap_mode='r'):
+    """(fc [W, R, R] memmap, windows [W, 2 or 3]) of a run written by write_fc_windows"""
+    return np.load(fc_path, mmap_mode=mmap_mode), np.load(windows_path(fc_path))
@@ -14,10 +14,11 @@ import numpy as np
 import json
 import os
 from datetime import datetime
-import optuna
 import logging
 
 from imports.PainGraphDataset import PainGraphDataset
+from imports.hpo import (DEFAULT_STORAGE, TrialCheckpoint, balanced_indices, load_shared_graphs, make_pruner,
+                         run_parallel_study)
 from net.multitask_braingnn import MultiTaskBrainGNN
 
 # 设置日志
@@ -45,24 +46,12 @@ class EnhancedPainGraphDataset(PainGraphDataset):
             except:
                 continue
         
-        labels = np.array(labels)
-        unique_labels, counts = np.unique(labels, return_counts=True)
-        max_count = max(counts)
-        
         # 为少数类创建重复采样索引
-        balanced_indices = []
-        for label in unique_labels:
-            label_indices = np.where(labels == label)[0]
-            # 重复采样到最大类别数量
-            repeats = max_count // len(label_indices)
-            remainder = max_count % len(label_indices)
-            
-            balanced_indices.extend(label_indices.tolist() * repeats)
-            balanced_indices.extend(label_indices[:remainder].tolist())
+        balanced = balanced_indices(labels)
         
         # 更新文件列表
         original_files = self.pt_files.copy()
-        self.pt_files = [original_files[i] for i in balanced_indices]
+        self.pt_files = [original_files[i] for i in balanced]
         logger.info(f"数据平衡后样本数: {len(self.pt_files)}")
     
     def get(self, idx):
@@ -128,9 +117,7 @@ class ImprovedBrainGNN(MultiTaskBrainGNN):
             )   # stimulus
         ])
     
-    def forward(self, data):
-        x, *_ = self.encoder(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)
-        
+    def head(self, x, task_id):
         # 应用dropout
         x = self.dropout_layer(x)
         
@@ -141,13 +128,29 @@ class ImprovedBrainGNN(MultiTaskBrainGNN):
             x = attn_output.squeeze(0)
         
         # 任务预测
-        if hasattr(data, 'task_type'):
-            task_id = int(data.task_type[0]) if isinstance(data.task_type, torch.Tensor) else int(data.task_type)
-        else:
-            task_id = 0
-        
-        out = self.task_heads[task_id](x)
-        return out, self.task_types[task_id]
+        return self.task_heads[task_id](x)
+
+def augment_batch(data, prob=0.3, x_std=0.01, edge_std=0.005):
+    """按图以概率prob添加轻微噪声 (与EnhancedPainGraphDataset.get相同的增强，每个epoch重新采样)"""
+    selected = (torch.rand(data.num_graphs, device=data.x.device) < prob).float()
+    data.x = data.x + torch.randn_like(data.x) * x_std * selected[data.batch].unsqueeze(-1)
+    if hasattr(data, 'edge_attr') and data.edge_attr is not None:
+        edge_selected = selected[data.batch[data.edge_index[0]]].view(-1, *([1] * (data.edge_attr.dim() - 1)))
+        data.edge_attr = data.edge_attr + torch.randn_like(data.edge_attr) * edge_std * edge_selected
+    return data
+
+def prepare_graph(data):
+    """过滤数据: 只保留 (116, 1) 节点特征"""
+    if data.x.shape != (116, 1):
+        return None
+    data.y = data.y.long()
+    return data
+
+def load_training_graphs(root_dir='./data/pain_data/all_graphs/'):
+    """只加载一次的共享内存数据集 (过滤 + 类别平衡)，所有试验共用"""
+    print("🚀 加载增强数据集...")
+    dataset = EnhancedPainGraphDataset(root_dir, balance_classes=False, augmentation=False)
+    return load_shared_graphs(dataset, prepare=prepare_graph, balance_classes=True)
 
 def weighted_loss_function(output, target, class_weights):
     """加权损失函数"""
@@ -158,8 +161,11 @@ def weighted_loss_function(output, target, class_weights):
     else:
         return F.nll_loss(output, target)
 
-def train_with_optimization(trial=None):
-    """训练函数，支持Optuna超参数优化"""
+def train_with_optimization(trial=None, graphs=None):
+    """训练函数，支持Optuna超参数优化
+
+    graphs: load_training_graphs()的共享数据集；为None时在此加载
+    """
     
     # 超参数定义
     if trial:
@@ -187,25 +193,13 @@ def train_with_optimization(trial=None):
     
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     
-    # 加载增强数据集
-    print("🚀 加载增强数据集...")
-    dataset = EnhancedPainGraphDataset('./data/pain_data/all_graphs/', 
-                                     balance_classes=True, 
-                                     augmentation=True)
-    
-    # 过滤数据
-    filtered_data = []
-    for i in range(len(dataset)):
-        try:
-            data = dataset[i]
-            if data.x.shape == (116, 1):
-                data.y = data.y.long()
-                filtered_data.append(data)
-        except:
-            continue
+    # 加载增强数据集 (超参数搜索时由调用方传入，只加载一次)
+    if graphs is None:
+        graphs = load_training_graphs()
+    filtered_data = graphs
     
     # 计算类别权重
-    labels = [data.y.item() for data in filtered_data]
+    labels = filtered_data.labels()
     class_weights = None
     if params['use_class_weights']:
         class_weights = compute_class_weight('balanced', 
@@ -219,7 +213,8 @@ def train_with_optimization(trial=None):
     test_size = len(filtered_data) - train_size - val_size
     
     train_dataset, val_dataset, test_dataset = torch.utils.data.random_split(
-        filtered_data, [train_size, val_size, test_size]
+        filtered_data, [train_size, val_size, test_size],
+        generator=torch.Generator().manual_seed(42)  # 固定划分，试验之间可比且可从检查点续训
     )
     
     train_loader = DataLoader(train_dataset, batch_size=params['batch_size'], shuffle=True)
@@ -247,7 +242,15 @@ def train_with_optimization(trial=None):
     patience_counter = 0
     max_epochs = 50
     
-    for epoch in range(max_epochs):
+    # 超参数搜索时从该配置上次的rung检查点热启动
+    start_epoch = 0
+    if trial:
+        checkpoint = TrialCheckpoint(trial, max_epochs)
+        start_epoch, state = checkpoint.restore(model, optimizer, scheduler)
+        best_val_f1 = state.get('best_val_f1', best_val_f1)
+        patience_counter = state.get('patience_counter', patience_counter)
+    
+    for epoch in range(start_epoch, max_epochs):
         # 训练
         model.train()
         total_loss = 0
@@ -256,6 +259,8 @@ def train_with_optimization(trial=None):
         
         for data in train_loader:
             data = data.to(device)
+            # 数据增强
+            data = augment_batch(data)
             optimizer.zero_grad()
             
             out, _ = model(data)
@@ -305,9 +310,18 @@ def train_with_optimization(trial=None):
                 torch.save(model.state_dict(), './model/optimized_brain_model.pth')
         else:
             patience_counter += 1
-            if patience_counter >= 15:
-                print("早停触发")
-                break
+        
+        # 多保真剪枝：每个epoch上报验证F1，不佳的配置在rung处被剪枝 (抛出TrialPruned)
+        if trial:
+            checkpoint.report(val_f1, epoch, model, optimizer, scheduler,
+                              best_val_f1=best_val_f1, patience_counter=patience_counter)
+        
+        if patience_counter >= 15:
+            print("早停触发")
+            break
+    
+    if trial:
+        checkpoint.finish()
     
     # 最终测试
     if not trial:
@@ -352,12 +366,16 @@ def train_with_optimization(trial=None):
     
     return best_val_f1
 
-def run_hyperparameter_optimization():
-    """运行超参数优化"""
+def run_hyperparameter_optimization(n_trials=20, n_jobs=None, threads_per_job=None, storage=DEFAULT_STORAGE,
+                                    pruner='hyperband'):
+    """运行超参数优化 (多进程并行试验，数据集只加载一次，Hyperband按epoch剪枝)"""
     print("🔬 开始超参数优化...")
     
-    study = optuna.create_study(direction='maximize')
-    study.optimize(train_with_optimization, n_trials=20)
+    graphs = load_training_graphs()
+    study = run_parallel_study(train_with_optimization, graphs, 'intelligent_optimization',
+                               storage=storage, n_trials=n_trials, n_jobs=n_jobs,
+                               threads_per_job=threads_per_job,
+                               pruner=make_pruner(pruner, max_resource=50))
     
     print("📊 超参数优化完成！")
     print("最佳参数:", study.best_params)
@@ -366,16 +384,22 @@ def run_hyperparameter_optimization():
     # 使用最佳参数重新训练
     print("🚀 使用最佳参数重新训练...")
     best_trial = study.best_trial
-    train_with_optimization()
+    train_with_optimization(graphs=graphs)
 
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser()
     parser.add_argument('--optimize', action='store_true', help='运行超参数优化')
+    parser.add_argument('--n_trials', type=int, default=20, help='试验次数')
+    parser.add_argument('--jobs', type=int, default=None, help='并行试验进程数 (默认: CPU核数)')
+    parser.add_argument('--threads', type=int, default=None, help='每个进程的torch线程数 (默认: CPU核数 / jobs)')
+    parser.add_argument('--storage', type=str, default=DEFAULT_STORAGE, help='Optuna存储 (journal文件或sqlite:///...)')
+    parser.add_argument('--pruner', type=str, default='hyperband', choices=['hyperband', 'sha', 'median', 'none'],
+                        help='按epoch剪枝的调度器')
     args = parser.parse_args()
     
     if args.optimize:
-        run_hyperparameter_optimization()
+        run_hyperparameter_optimization(args.n_trials, args.jobs, args.threads, args.storage, args.pruner)
     else:
-        train_with_optimization()
\ No newline at end of file
+        train_with_optimization()
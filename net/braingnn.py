@@ -1,62 +1,145 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 from net.braingraphconv import MyNNConv
 from net.pool import TopKPool
 import numpy as np
 from torch_geometric.nn import global_max_pool, global_mean_pool
 
+
+def readout(x, batch, size=None):
+    """[max || mean] of the node features of every graph, [B, 2F]
+
+    TopK pooling with a fixed ratio on equal-size graphs (R ROIs) keeps the same
+    number of nodes k per graph, in contiguous batch order: then x is viewed as
+    [B, k, F] and reduced with one amax / mean. Any other layout falls back to
+    the scatter-based global pools.
+    """
+    num_nodes = x.size(0)
+    num_graphs = size if size is not None else (int(batch[-1]) + 1 if num_nodes > 0 else 0)
+    if num_graphs > 0 and num_nodes % num_graphs == 0:
+        k = num_nodes // num_graphs
+        if torch.equal(batch, torch.arange(num_graphs, device=batch.device).repeat_interleave(k)):
+            x = x.view(num_graphs, k, -1)
+            return torch.cat([x.amax(dim=1), x.mean(dim=1)], dim=1)
+    return torch.cat([global_max_pool(x, batch, size), global_mean_pool(x, batch, size)], dim=1)
+
+
+def roi_score_maps(batch, perms, scores, num_rois, num_graphs=None):
+    """Dense TopK scores by ROI id: (scores [B, L, R], keep masks [B, L, R]) for L pooling layers
+
+    ROI r of a graph is its r-th node in the input batch. Each layer's perm indexes the
+    nodes kept by the previous layer, so the (graph, ROI) ids are carried through the perms
+    and every layer's flat scores are scattered back in one index_put. Dropped ROIs get
+    score 0 and mask False.
+    """
+    if num_graphs is None:
+        num_graphs = int(batch.max()) + 1 if batch.numel() > 0 else 0
+    counts = torch.bincount(batch, minlength=num_graphs)
+    roi = torch.arange(batch.numel(), device=batch.device) - (counts.cumsum(0) - counts)[batch]
+    graph = batch
+    dense = scores[0].new_zeros(num_graphs, len(perms), num_rois, dtype=torch.float)
+    masks = torch.zeros(num_graphs, len(perms), num_rois, dtype=torch.bool, device=batch.device)
+    for layer, (perm, score) in enumerate(zip(perms, scores)):
+        roi, graph = roi[perm], graph[perm]
+        dense[graph, layer, roi] = score.float()
+        masks[graph, layer, roi] = True
+    return dense, masks
+
+
 class Network(torch.nn.Module):
-    def __init__(self, indim, ratio, nclass, k=8, R=116):
+    def __init__(self, indim, ratio, nclass, k=8, R=116, compile=False, checkpoint_blocks=False,
+                 fused=True, message_budget_mb=None):
         super(Network, self).__init__()
         self.indim = indim
         self.k = k
         self.R = R 
+        # checkpoint_blocks: keep only the inputs of each conv -> pool -> readout block during
+        # training and recompute the block in backward (memory for ~1 extra forward)
+        self.checkpoint_blocks = checkpoint_blocks
 
         self.dim1 = 32
         self.dim2 = 32
         self.dim3 = 32
 
         self.n1 = nn.Sequential(nn.Linear(self.R, self.k, bias=False), nn.ReLU(), nn.Linear(self.k, self.dim1 * self.indim))
-        self.conv1 = MyNNConv(self.indim, self.dim1, self.n1, aggr='mean')
+        # aggr='add': the sum of softmax-normalised messages is what the convs have always
+        # computed (propagate used to ignore aggr, so 'mean' here was never applied)
+        self.conv1 = MyNNConv(self.indim, self.dim1, self.n1, aggr='add')
         self.pool1 = TopKPool(self.dim1, ratio, R=self.R)
 
         self.n2 = nn.Sequential(nn.Linear(self.R, self.k, bias=False), nn.ReLU(), nn.Linear(self.k, self.dim2 * self.dim1))
-        self.conv2 = MyNNConv(self.dim1, self.dim2, self.n2, aggr='mean')
+        self.conv2 = MyNNConv(self.dim1, self.dim2, self.n2, aggr='add')
         self.pool2 = TopKPool(self.dim2, ratio, R=self.R)
 
         self.n3 = nn.Sequential(nn.Linear(self.R, self.k, bias=False), nn.ReLU(), nn.Linear(self.k, self.dim3 * self.dim2))
-        self.conv3 = MyNNConv(self.dim2, self.dim3, self.n3, aggr='mean')
+        self.conv3 = MyNNConv(self.dim2, self.dim3, self.n3, aggr='add')
         self.pool3 = TopKPool(self.dim3, ratio, R=self.R)
         
         self.fc1 = nn.Linear(self.dim3 * 2, 16)
         self.bn1 = nn.BatchNorm1d(16)
         self.fc2 = nn.Linear(16, nclass)
 
-    def forward(self, x, edge_index, batch, edge_attr=None, pos=None):
+        # fused: CSR softmax-aggregate (net/segment_softmax.py); message_budget_mb: edge-chunked
+        # messages on the generic path (fused=False)
+        for conv in (self.conv1, self.conv2, self.conv3):
+            conv.fused = fused
+            conv.message_budget_mb = message_budget_mb
+        if compile:
+            self.compile_layers()
+
+    def compile_layers(self, **kwargs):
+        """torch.compile the convolutions and the classifier in place
+        (TopK pooling has data-dependent shapes and stays eager).
+        State dict keys are unchanged, so checkpoints load either way."""
+        kwargs.setdefault('dynamic', True)
+        # add_remaining_self_loops filters edges (nonzero); capture it instead of breaking the graph
+        torch._dynamo.config.capture_dynamic_output_shape_ops = True
+        for module in (self.conv1, self.conv2, self.conv3):
+            module.compile(**kwargs)
+        self.classify = torch.compile(self.classify, **kwargs)
+        return self
+
+    def forward(self, x, edge_index, batch, edge_attr=None, pos=None, edge_norm=None):
         if pos is None:
             pos = torch.eye(x.size(0), device=x.device)
+        # edge_norm (imports/edge_precompute.py): loops already in edge_index, layer-1 softmax precomputed
+        self_loops = edge_norm is not None
 
-        x = self.conv1(x, edge_index, edge_attr, pos)
-        x, edge_index, edge_attr, batch, perm1, score1 = self.pool1(x, edge_index, edge_attr, batch)
-        pos = pos[perm1]
-        x1 = torch.cat([global_max_pool(x, batch), global_mean_pool(x, batch)], dim=1)
+        x, edge_index, edge_attr, batch, pos, perm1, score1, x1 = self.run_block(
+            1, x, edge_index, edge_attr, batch, pos, edge_norm, self_loops)
+        x, edge_index, edge_attr, batch, pos, perm2, score2, x2 = self.run_block(
+            2, x, edge_index, edge_attr, batch, pos, None, self_loops)
+        x, edge_index, edge_attr, batch, pos, perm3, score3, x3 = self.run_block(
+            3, x, edge_index, edge_attr, batch, pos, None, self_loops)
+        
+        x = self.classify(x1 + x2 + x3)
 
-        x = self.conv2(x, edge_index, edge_attr, pos)
-        x, edge_index, edge_attr, batch, perm2, score2 = self.pool2(x, edge_index, edge_attr, batch)
-        pos = pos[perm2]
-        x2 = torch.cat([global_max_pool(x, batch), global_mean_pool(x, batch)], dim=1)
+        return x, perm1, score1, perm2, score2, perm3, score3
 
-        x = self.conv3(x, edge_index, edge_attr, pos)
-        x, edge_index, edge_attr, batch, perm3, score3 = self.pool3(x, edge_index, edge_attr, batch)
-        x3 = torch.cat([global_max_pool(x, batch), global_mean_pool(x, batch)], dim=1)
-        
-        x = x1 + x2 + x3
+    def score_maps(self, x, edge_index, batch, edge_attr=None, pos=None, edge_norm=None, num_graphs=None):
+        """(output, scores [B, 3, R], keep masks [B, 3, R]): the TopK scores of the three
+        pooling layers by ROI id (see roi_score_maps)"""
+        out, perm1, score1, perm2, score2, perm3, score3 = self(x, edge_index, batch, edge_attr, pos, edge_norm)
+        scores, masks = roi_score_maps(batch, (perm1, perm2, perm3), (score1, score2, score3), self.R, num_graphs)
+        return out, scores, masks
 
+    def block(self, layer, x, edge_index, edge_attr, batch, pos, edge_norm=None, self_loops=False):
+        """conv -> TopK pool -> readout of one layer; returns the pooled graph, its readout and perm / score"""
+        conv, pool = getattr(self, 'conv%d' % layer), getattr(self, 'pool%d' % layer)
+        x = conv(x, edge_index, edge_attr, pos, edge_norm=edge_norm, self_loops=self_loops)
+        x, edge_index, edge_attr, batch, perm, score = pool(x, edge_index, edge_attr, batch)
+        return x, edge_index, edge_attr, batch, pos[perm], perm, score, readout(x, batch)
+
+    def run_block(self, layer, *args):
+        if self.checkpoint_blocks and self.training and torch.is_grad_enabled():
+            return checkpoint(self.block, layer, *args, use_reentrant=False)
+        return self.block(layer, *args)
+
+    def classify(self, x):
         x = self.bn1(F.relu(self.fc1(x)))
         x = F.dropout(x, p=0.5, training=self.training)
-        x = F.log_softmax(self.fc2(x), dim=-1)
-
-        return x, perm1, score1, perm2, score2, perm3, score3
+        return F.log_softmax(self.fc2(x).float(), dim=-1)
 
 BrainGNN = Network
@@ -1,7 +1,9 @@
 import torch
 import torch.nn.functional as F
 from torch.nn import Parameter
+from torch.utils.checkpoint import checkpoint
 from net.brainmsgpassing import MyMessagePassing
+from net.segment_softmax import segment_softmax_aggregate, segment_aggregate
 from torch_geometric.utils import add_remaining_self_loops,softmax
 
 from torch_geometric.typing import (OptTensor)
@@ -11,13 +13,17 @@ from net.inits import uniform
 
 class MyNNConv(MyMessagePassing):
     def __init__(self, in_channels, out_channels, nn, normalize=False, bias=True,
-                 **kwargs):
+                 fused=True, message_budget_mb=None, **kwargs):
         super(MyNNConv, self).__init__(**kwargs)
 
         self.in_channels = in_channels
         self.out_channels = out_channels
         self.normalize = normalize
         self.nn = nn
+        # softmax + 'add' aggregation as one CSR op (net/segment_softmax.py) in eager mode
+        self.fused = fused
+        # generic path only: build the [E, C] messages in edge slices of at most this many MB
+        self.message_budget_mb = message_budget_mb
         #self.weight = Parameter(torch.Tensor(self.in_channels, out_channels))
 
         if bias:
@@ -31,10 +37,12 @@ class MyNNConv(MyMessagePassing):
 #        uniform(self.in_channels, self.weight)
         uniform(self.in_channels, self.bias)
 
-    def forward(self, x, edge_index, edge_weight=None, pseudo= None, size=None):
-        """"""
+    def forward(self, x, edge_index, edge_weight=None, pseudo= None, size=None, edge_norm=None,
+                self_loops=False):
+        """edge_norm: precomputed softmax of edge_weight (replaces it); self_loops: edge_index
+        already holds the self loops (both set by imports/edge_precompute.PrecomputeEdgeNorm)"""
         edge_weight = edge_weight.squeeze()
-        if size is None and torch.is_tensor(x):
+        if size is None and torch.is_tensor(x) and not self_loops:
             edge_index, edge_weight = add_remaining_self_loops(
                 edge_index, edge_weight, 1, x.size(0))
 
@@ -53,11 +61,72 @@ class MyNNConv(MyMessagePassing):
         #          None if x[1] is None else torch.matmul(x[1].unsqueeze(1), weight).squeeze(1))
 
         return self.propagate(edge_index, size=size, x=x,
-                              edge_weight=edge_weight)
-
-    def message(self, edge_index_i, size_i, x_j, edge_weight, ptr: OptTensor):
-        edge_weight = softmax(edge_weight, edge_index_i, ptr, size_i)
-        return x_j if edge_weight is None else edge_weight.view(-1, 1) * x_j
+                              edge_weight=edge_weight, edge_norm=edge_norm)
+
+    def propagate(self, edge_index, size=None, x=None, edge_weight=None, edge_norm=None):
+        r"""Static :meth:`MyMessagePassing.propagate` for the signature of
+        :meth:`message`: no argument inspection or dynamic lists, so
+        :obj:`torch.compile` traces the layer without graph breaks."""
+        return self.update(self.propagate_messages(edge_index, size, x, edge_weight, edge_norm))
+
+    def propagate_messages(self, edge_index, size=None, x=None, edge_weight=None, edge_norm=None):
+        """Aggregated messages before :meth:`update` (bias / normalize), through the fused,
+        edge-chunked or generic path; net/stacked_ensemble.py adds per-member biases itself"""
+        i, j = (0, 1) if self.flow == 'target_to_source' else (1, 0)
+        if (self.fused and self.aggr == 'add' and (edge_weight is not None or edge_norm is not None)
+                and torch.is_tensor(x) and not torch.compiler.is_compiling()):
+            size_i = size[i] if size is not None else x.size(self.node_dim)
+            if edge_norm is not None:
+                out = segment_aggregate(edge_norm, x, edge_index[i], edge_index[j], size_i)
+            else:
+                out = segment_softmax_aggregate(edge_weight, x, edge_index[i], edge_index[j], size_i)
+            return out
+
+        if isinstance(x, (tuple, list)):
+            x_j = x[j]
+            size_i = size[i] if size is not None else x[i].size(self.node_dim)
+        else:
+            x_j = x
+            size_i = size[i] if size is not None else x.size(self.node_dim)
+        if self.message_budget_mb and self.aggr == 'add' and not torch.compiler.is_compiling():
+            return self.chunked_propagate(x_j, edge_index[i], edge_index[j], size_i, edge_weight, edge_norm)
+        x_j = x_j.index_select(self.node_dim, edge_index[j])
+
+        out = self.message(edge_index[i], size_i, x_j, edge_weight, None, edge_norm)
+        return self.aggregate(out, edge_index[i], size_i)
+
+    def chunked_propagate(self, x, index, src, size_i, edge_weight=None, edge_norm=None):
+        """'add' aggregation over edge slices holding at most message_budget_mb of messages.
+        Each slice is checkpointed, so its messages are recomputed in backward instead of
+        kept: peak message memory is one slice, at the cost of one more gather per slice."""
+        if edge_norm is None and edge_weight is not None:
+            edge_norm = softmax(edge_weight.float(), index, None, size_i)
+        row_bytes = x[0].numel() * x.element_size()
+        chunk = max(1, int(self.message_budget_mb * 2 ** 20) // row_bytes)
+        out = None
+        for start in range(0, index.numel(), chunk):
+            norm = edge_norm[start:start + chunk] if edge_norm is not None else None
+            args = (x, src[start:start + chunk], index[start:start + chunk], norm, size_i)
+            if torch.is_grad_enabled():
+                part = checkpoint(self._aggregate_slice, *args, use_reentrant=False)
+            else:
+                part = self._aggregate_slice(*args)
+            out = part if out is None else out + part
+        if out is None:
+            out = x.new_zeros((size_i,) + tuple(x.shape[1:]))
+        return out
+
+    def _aggregate_slice(self, x, src, index, edge_norm, size_i):
+        x_j = x.index_select(self.node_dim, src)
+        return self.aggregate(self.message(index, size_i, x_j, None, None, edge_norm), index, size_i)
+
+    def message(self, edge_index_i, size_i, x_j, edge_weight, ptr: OptTensor, edge_norm: OptTensor = None):
+        if edge_norm is None:
+            if edge_weight is None:
+                return x_j
+            # softmax in fp32, messages in the dtype of x_j (bf16 under autocast)
+            edge_norm = softmax(edge_weight.float(), edge_index_i, ptr, size_i)
+        return edge_norm.view(-1, 1).to(x_j.dtype) * x_j
 
     def update(self, aggr_out):
         if self.bias is not None:
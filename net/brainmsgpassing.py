@@ -2,8 +2,6 @@ import sys
 import inspect
 
 import torch
-# from torch_geometric.utils import scatter_
-from torch_scatter import scatter,scatter_add
 
 special_args = [
     'edge_index', 'edge_index_i', 'edge_index_j', 'size', 'size_i', 'size_j'
@@ -124,12 +122,29 @@ class MyMessagePassing(torch.nn.Module):
         update_args = [kwargs[arg] for arg in self.__update_args__]
 
         out = self.message(*message_args)
-        # out = scatter_(self.aggr, out, edge_index[i], dim, dim_size=size[i])
-        out = scatter_add(out, edge_index[i], dim, dim_size=size[i])
+        out = self.aggregate(out, edge_index[i], size[i])
         out = self.update(out, *update_args)
 
         return out
 
+    def aggregate(self, inputs, index, dim_size):
+        r"""Reduces the messages :obj:`inputs` onto their target nodes
+        :obj:`index` with :obj:`self.aggr` (nodes without messages get 0).
+        Native scatter ops only, so the reduction traces under
+        :obj:`torch.compile`."""
+
+        dim = self.node_dim
+        shape = list(inputs.shape)
+        shape[dim] = dim_size
+        out = inputs.new_zeros(shape)
+        if self.aggr == 'add':
+            return out.index_add_(dim, index, inputs)
+        view = [1] * inputs.dim()
+        view[dim] = -1
+        index = index.view(view).expand_as(inputs)
+        reduce = 'mean' if self.aggr == 'mean' else 'amax'
+        return out.scatter_reduce_(dim, index, inputs, reduce, include_self=False)
+
     def message(self, x_j):  # pragma: no cover
         r"""Constructs messages to node :math:`i` in analogy to
         :math:`\phi_{\mathbf{\Theta}}` for each edge in
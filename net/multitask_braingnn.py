@@ -20,12 +20,19 @@ class MultiTaskBrainGNN(nn.Module):
         ])
         self.task_types = ['cls', 'cls', 'reg', 'cls']
 
-    def forward(self, data):
-        x, *_ = self.encoder(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)
+    @staticmethod
+    def task_id(data):
         # 支持batch_size=1或同一batch同一task_type
         if hasattr(data, 'task_type'):
-            task_id = int(data.task_type[0]) if isinstance(data.task_type, torch.Tensor) else int(data.task_type)
-        else:
-            task_id = 0
-        out = self.task_heads[task_id](x)
-        return out, self.task_types[task_id] 
\ No newline at end of file
+            return int(data.task_type[0]) if isinstance(data.task_type, torch.Tensor) else int(data.task_type)
+        return 0
+
+    def head(self, x, task_id):
+        """图嵌入 [B, hidden_dim] -> 任务输出"""
+        return self.task_heads[task_id](x)
+
+    def forward(self, data):
+        x, *_ = self.encoder(data.x, data.edge_index, data.batch, data.edge_attr, data.pos,
+                             edge_norm=getattr(data, 'edge_norm', None))
+        task_id = self.task_id(data)
+        return self.head(x, task_id), self.task_types[task_id] 
\ No newline at end of file
@@ -0,0 +1,138 @@
+'''
+Fused segment softmax + aggregation for MyNNConv.
+
+MyNNConv computes, for every target node i,
+
+    out_i = sum_{j -> i} softmax_i(w)_ji * x_j
+
+The generic message passing path does this in four passes over the E edges
+(scatter-max and scatter-sum of the softmax, an [E, C] gather of x_j, an
+[E, C] scatter-add). With the edges sorted by target (CSR), the softmax only
+needs per-edge scalars (segment_reduce) and the aggregation is one sparse
+CSR x dense product, so no [E, C] tensor is ever materialised:
+
+    forward    alpha = segment softmax of w        (segment max / sum, [E] scalars)
+               out   = A(alpha) @ x                (CSR SpMM)
+    backward   dx     = A(alpha)^T @ dout          (CSR SpMM on the transposed pattern)
+               dalpha = <dout_i, x_j> on the edges (sampled dense-dense product, SDDMM)
+               dw     = alpha * (dalpha - segment_sum(alpha * dalpha))
+
+The product runs in fp32 (no bf16 sparse kernels on CPU); the result is cast
+back to the dtype of x.
+
+SegmentAggregate is the same product for weights that are already
+normalised (edge_norm precomputed by imports/edge_precompute.py): no
+softmax, and no gradient for the weights.
+'''
+
+import warnings
+
+import torch
+
+warnings.filterwarnings('ignore', message='Sparse CSR tensor support is in beta')
+
+
+def index_dtype(*sizes):
+    """int32 indices when they fit (faster sorts, smaller CSR), else int64"""
+    return torch.int32 if max(sizes) < 2 ** 31 - 1 else torch.long
+
+
+def csr_ptr(index, num_nodes):
+    """Row pointer [num_nodes + 1] of an index sorted in ascending order"""
+    counts = torch.bincount(index, minlength=num_nodes)
+    return torch.cat([counts.new_zeros(1), counts.cumsum(0)]).to(index.dtype)
+
+
+def _csr(ptr, col, values, shape):
+    # indices are valid by construction; skip the O(E) invariant checks
+    return torch.sparse_csr_tensor(ptr, col, values, shape, check_invariants=False)
+
+
+def segment_softmax(src, ptr, index):
+    """softmax of src over the segments ptr (index: segment of every entry); as PyG's softmax"""
+    src_max = torch.segment_reduce(src, 'max', offsets=ptr)
+    out = (src - src_max[index]).exp()
+    out_sum = torch.segment_reduce(out, 'sum', offsets=ptr)
+    return out / (out_sum[index] + 1e-16)
+
+
+def _transposed_mm(alpha, ptr, index, col, grad_out, num_src):
+    """A(alpha)^T @ grad_out through the CSR of A^T (edges sorted by source)"""
+    col_sorted, perm = torch.sort(col, stable=True)
+    return _csr(csr_ptr(col_sorted, num_src), index[perm], alpha[perm],
+                (num_src, ptr.numel() - 1)) @ grad_out
+
+
+class SegmentSoftmaxAggregate(torch.autograd.Function):
+    """out = A(softmax(edge_weight)) @ x for edges sorted by target (ptr, index) with sources col"""
+
+    @staticmethod
+    def forward(ctx, edge_weight, x, ptr, index, col):
+        with torch.autocast(x.device.type, enabled=False):
+            x_float = x.float()
+            alpha = segment_softmax(edge_weight.float(), ptr, index)
+            out = _csr(ptr, col, alpha, (ptr.numel() - 1, x.size(0))) @ x_float
+        ctx.save_for_backward(alpha, x_float, ptr, index, col)
+        ctx.x_dtype = x.dtype
+        return out.to(x.dtype)
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        alpha, x, ptr, index, col = ctx.saved_tensors
+        shape = (ptr.numel() - 1, x.size(0))
+        grad_weight = grad_x = None
+        with torch.autocast(x.device.type, enabled=False):
+            grad_out = grad_out.float().contiguous()
+            if ctx.needs_input_grad[1]:
+                grad_x = _transposed_mm(alpha, ptr, index, col, grad_out, shape[1]).to(ctx.x_dtype)
+            if ctx.needs_input_grad[0]:
+                pattern = _csr(ptr, col, torch.zeros_like(alpha), shape)
+                grad_alpha = torch.sparse.sampled_addmm(pattern, grad_out, x.t(), beta=0.).values()
+                dot = torch.segment_reduce(alpha * grad_alpha, 'sum', offsets=ptr)
+                grad_weight = alpha * (grad_alpha - dot[index])
+        return grad_weight, grad_x, None, None, None
+
+
+class SegmentAggregate(torch.autograd.Function):
+    """out = A(edge_norm) @ x for fixed (already normalised) edge weights"""
+
+    @staticmethod
+    def forward(ctx, edge_norm, x, ptr, index, col):
+        with torch.autocast(x.device.type, enabled=False):
+            alpha = edge_norm.float()
+            out = _csr(ptr, col, alpha, (ptr.numel() - 1, x.size(0))) @ x.float()
+        ctx.save_for_backward(alpha, ptr, index, col)
+        ctx.x_dtype, ctx.num_src = x.dtype, x.size(0)
+        return out.to(x.dtype)
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        alpha, ptr, index, col = ctx.saved_tensors
+        grad_x = None
+        if ctx.needs_input_grad[1]:
+            with torch.autocast(grad_out.device.type, enabled=False):
+                grad_x = _transposed_mm(alpha, ptr, index, col, grad_out.float().contiguous(), ctx.num_src)
+            grad_x = grad_x.to(ctx.x_dtype)
+        return None, grad_x, None, None, None
+
+
+def _target_sorted(edge_values, x, index, col, num_nodes):
+    """(edge_values, ptr, index, col) with the edges sorted by target, unless they already are"""
+    dtype = index_dtype(num_nodes, x.size(0), index.numel())
+    index, col = index.to(dtype), col.to(dtype)
+    if index.numel() > 1 and not bool((index[1:] >= index[:-1]).all()):
+        index, perm = torch.sort(index, stable=True)
+        col, edge_values = col[perm], edge_values[perm]
+    return edge_values, csr_ptr(index, num_nodes), index, col
+
+
+def segment_softmax_aggregate(edge_weight, x, index, col, num_nodes):
+    """sum over the edges (col -> index) of softmax_index(edge_weight) * x[col], as [num_nodes, C]"""
+    edge_weight, ptr, index, col = _target_sorted(edge_weight, x, index, col, num_nodes)
+    return SegmentSoftmaxAggregate.apply(edge_weight, x, ptr, index, col)
+
+
+def segment_aggregate(edge_norm, x, index, col, num_nodes):
+    """sum over the edges (col -> index) of edge_norm * x[col] (weights already normalised)"""
+    edge_norm, ptr, index, col = _target_sorted(edge_norm, x, index, col, num_nodes)
+    return SegmentAggregate.apply(edge_norm, x, ptr, index, col)
@@ -0,0 +1,269 @@
+'''
+Member-batched forward of BrainGNN ensembles.
+
+Members that share an architecture (architecture_key: module tree,
+parameter shapes and dropout rates) are evaluated together. Their
+parameters are stacked along a leading member dimension [M, ...] on every
+call with torch.stack, so gradients flow back into each member's own
+parameters and per-member optimizers, schedulers and early stopping keep
+working unchanged.
+
+  * dense per-member layers (the edge-weight generators of MyNNConv, the
+    TopK scores, Network.classify and the model head) run once through
+    torch.func.vmap over functional_call with the stacked parameters
+  * graph operations (message passing, top-k selection, edge filtering,
+    global pooling) run once on the disjoint union of the M copies of the
+    batch: node n of member m is row m * N + n, graph b of member m is
+    graph m * B + b. Every member keeps ceil(ratio * n) nodes of every
+    graph, so node tensors stay [M, N_l, C] through the pooling layers.
+
+BatchNorm running statistics are updated on the stacked buffers and
+copied back to the members. Groups of a single member and models without
+a BrainGNN encoder run member by member (grouped execution).
+
+predict_ensemble() evaluates all members in one pass over the test batches
+and returns the mean and per-member class probabilities.
+'''
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.func import functional_call, vmap
+from torch_geometric.nn.pool.select import SelectOutput
+from torch_geometric.nn.pool.select.topk import topk
+from torch_geometric.utils import add_remaining_self_loops
+
+from net.braingnn import Network, readout
+from net.multitask_braingnn import MultiTaskBrainGNN
+
+
+def architecture_key(model):
+    """Members with equal keys can be stacked"""
+    dropouts = []
+    for module in model.modules():
+        if isinstance(module, nn.Dropout):
+            dropouts.append(module.p)
+        elif isinstance(module, nn.MultiheadAttention):
+            dropouts.append(module.dropout)
+    return (type(model).__name__,
+            tuple((name, tuple(p.shape)) for name, p in model.named_parameters()),
+            tuple((name, tuple(b.shape)) for name, b in model.named_buffers()),
+            tuple(dropouts),
+            getattr(model, 'use_attention', None))
+
+
+def group_members(models):
+    """{architecture_key: [member indices]} in order of first appearance"""
+    groups = {}
+    for i, model in enumerate(models):
+        groups.setdefault(architecture_key(model), []).append(i)
+    return list(groups.values())
+
+
+def can_stack(model):
+    return isinstance(model, MultiTaskBrainGNN) and isinstance(model.encoder, Network)
+
+
+class _Method(nn.Module):
+    """functional_call target running module.<method>(*args)"""
+
+    def __init__(self, module, method):
+        super().__init__()
+        self.module = module
+        self.method = method
+
+    def forward(self, *args):
+        return getattr(self.module, self.method)(*args)
+
+
+class _StackedState:
+    """Stacked parameters / buffers of the members under one submodule prefix"""
+
+    def __init__(self, models, prefix=''):
+        self.models = models
+        self.prefix = prefix
+        params = [dict(m.named_parameters()) for m in models]
+        self.member_buffers = [dict(m.named_buffers()) for m in models]
+        self.params = {name: torch.stack([p[prefix + name] for p in params])
+                       for name in self._names(params[0])}
+        self.buffers = {name: torch.stack([b[prefix + name] for b in self.member_buffers])
+                        for name in self._names(self.member_buffers[0])}
+
+    def _names(self, named):
+        return [name[len(self.prefix):] for name in named if name.startswith(self.prefix)]
+
+    def sub(self, prefix, skip=()):
+        """(params, buffers) of a child module, keys relative to it, without the keys starting with skip
+
+        Only the state a call uses should be passed: Network shares n1..n3 with conv1..conv3
+        (tied weights), which functional_call must not swap.
+        """
+        def select(state):
+            items = ((k[len(prefix):], v) for k, v in state.items() if k.startswith(prefix))
+            return {k: v for k, v in items if not k.startswith(tuple(skip))}
+        return select(self.params), select(self.buffers)
+
+    def write_back(self):
+        """Copy the (in-place updated) stacked buffers back into the members"""
+        with torch.no_grad():
+            for name, stacked in self.buffers.items():
+                for buffers, value in zip(self.member_buffers, stacked):
+                    buffers[self.prefix + name].copy_(value)
+
+
+def _call(module, params, buffers, *args, method=None, in_dims=None):
+    """vmap over members of module(*args) (or module.<method>(*args)) with stacked state"""
+    target, prefix = (module, '') if method is None else (_Method(module, method), 'module.')
+    state = {prefix + k: v for k, v in {**params, **buffers}.items()}
+
+    def run(state, *args):
+        return functional_call(target, state, args)
+
+    in_dims = (0,) + (tuple(in_dims) if in_dims is not None else (0,) * len(args))
+    return vmap(run, in_dims=in_dims, randomness='different')(state, *args)
+
+
+def _node_transform(conv, params, x, pos, node_ids):
+    """x_i W(pos_i) of MyNNConv for every member: x [M, N, in] -> [M * N, out]
+
+    pos [N0, R] is that of the input batch, node_ids [M, N] the input nodes kept by
+    each member (None before the first pooling).
+
+    One member at a time: the generated weights [N, in * out] are the largest tensors of the
+    forward, and batching them over members (vmap / bmm with a broadcast bias) costs an extra
+    pass over M times that memory on CPU.
+    """
+    out = []
+    for m in range(x.size(0)):
+        member_pos = pos if node_ids is None else pos[node_ids[m]]
+        weight = functional_call(conv.nn, {k: v[m] for k, v in params.items()}, (member_pos,))
+        weight = weight.view(-1, conv.in_channels, conv.out_channels)
+        out.append(torch.matmul(x[m].unsqueeze(1), weight).squeeze(1))
+    return torch.cat(out)
+
+
+def _conv(conv, params, x, edge_index, edge_weight, pos, node_ids, bias, edge_norm=None, self_loops=False):
+    """MyNNConv on the member union: x [M, N, in] -> [M, N, out]; params are those of conv.nn
+
+    The union graph goes through the conv's own aggregation (fused CSR op, precomputed
+    edge_norm, edge chunking); only update() is redone here with the per-member biases.
+    """
+    members, num_nodes = x.shape[:2]
+    edge_weight = edge_weight.squeeze()
+    if not self_loops:
+        edge_index, edge_weight = add_remaining_self_loops(edge_index, edge_weight, 1, members * num_nodes)
+    x = _node_transform(conv, params, x, pos, node_ids)
+
+    out = conv.propagate_messages(edge_index, x=x, edge_weight=edge_weight, edge_norm=edge_norm)
+    out = out.view(members, num_nodes, -1)
+    if bias is not None:
+        out = out + bias[:, None, :]
+    return F.normalize(out, p=2, dim=-1) if conv.normalize else out
+
+
+def _pool(pool, state, prefix, x, edge_index, edge_attr, batch):
+    """TopKPool on the member union; returns x [M, N_l, C] and the flat graph"""
+    members, num_nodes = x.shape[:2]
+    select = pool.pool.select
+    weight = state.params[prefix + 'pool.select.weight']  # [M, 1, C]
+    score = (x * weight).sum(dim=-1) / weight.norm(p=2, dim=-1)
+    score = select.act(score).reshape(-1)
+
+    perm = topk(score, select.ratio, batch, select.min_score)
+    x = x.reshape(members * num_nodes, -1)[perm] * score[perm].view(-1, 1)
+    select_out = SelectOutput(node_index=perm, num_nodes=members * num_nodes,
+                              cluster_index=torch.arange(perm.numel(), device=perm.device),
+                              num_clusters=perm.numel(), weight=score[perm])
+    connect_out = pool.pool.connect(select_out, edge_index, edge_attr, batch)
+    return x.view(members, -1, x.size(-1)), connect_out.edge_index, connect_out.edge_attr, connect_out.batch, perm
+
+
+def _readout(x, batch, members, num_graphs):
+    x = x.reshape(-1, x.size(-1))
+    return readout(x, batch, members * num_graphs).view(members, num_graphs, -1)
+
+
+def stacked_forward(models, data):
+    """Outputs [M, B, out] of members sharing one MultiTaskBrainGNN architecture, and the task type"""
+    base = models[0]
+    encoder = base.encoder
+    members = len(models)
+    state = _StackedState(models)
+
+    num_nodes, num_graphs = data.x.size(0), data.num_graphs
+    node_offsets = torch.arange(members, device=data.x.device) * num_nodes
+    edge_index = (data.edge_index.unsqueeze(0) + node_offsets.view(-1, 1, 1)).permute(1, 0, 2).reshape(2, -1)
+    edge_attr = data.edge_attr.repeat(members, *([1] * (data.edge_attr.dim() - 1)))
+    batch = (data.batch.unsqueeze(0) + num_graphs * torch.arange(members, device=data.x.device).view(-1, 1)).reshape(-1)
+    pos = data.pos if data.pos is not None else torch.eye(num_nodes, device=data.x.device)
+    x = data.x.unsqueeze(0).expand(members, -1, -1)
+    node_ids = None
+    # imports/edge_precompute.py: loops already in edge_index, layer-1 softmax precomputed
+    edge_norm = getattr(data, 'edge_norm', None)
+    self_loops = edge_norm is not None
+    if edge_norm is not None:
+        edge_norm = edge_norm.repeat(members)
+
+    # conv.nn is registered twice (n1 / conv1.nn); parameters are named after the first
+    module_names = {id(module): name for name, module in base.named_modules()}
+
+    readouts = []
+    for layer in (1, 2, 3):
+        conv, pool = getattr(encoder, f'conv{layer}'), getattr(encoder, f'pool{layer}')
+        x = _conv(conv, state.sub(module_names[id(conv.nn)] + '.')[0], x, edge_index, edge_attr, pos, node_ids,
+                  state.params.get(f'encoder.conv{layer}.bias'), edge_norm if layer == 1 else None, self_loops)
+        x, edge_index, edge_attr, batch, perm = _pool(pool, state, f'encoder.pool{layer}.',
+                                                      x, edge_index, edge_attr, batch)
+        node_ids = torch.arange(num_nodes, device=perm.device).repeat(members) if node_ids is None else node_ids
+        node_ids = node_ids.reshape(-1)[perm].view(members, -1)
+        readouts.append(_readout(x, batch, members, num_graphs))
+
+    x = _call(encoder, *state.sub('encoder.', skip=('n1.', 'n2.', 'n3.', 'conv', 'pool')),
+              sum(readouts), method='classify')
+    task_id = base.task_id(data)
+    out = _call(base, *state.sub('', skip=('encoder.',)), x, task_id, method='head', in_dims=(0, None))
+    state.write_back()
+    return out, base.task_types[task_id]
+
+
+def ensemble_forward(models, data, groups=None):
+    """[(out, task_type)] of every member; same-architecture BrainGNN groups run stacked
+
+    groups: member index groups (group_members(models) by default)
+    """
+    outputs = [None] * len(models)
+    for group in groups if groups is not None else group_members(models):
+        members = [models[i] for i in group]
+        if len(members) > 1 and can_stack(members[0]):
+            out, task_type = stacked_forward(members, data)
+            for i, member_out in zip(group, out):
+                outputs[i] = (member_out, task_type)
+        else:
+            for i, model in zip(group, members):
+                outputs[i] = model(data)
+    return outputs
+
+
+def cache_batches(loader, device):
+    """Collated batches of a loader, moved to device once, for repeated evaluation"""
+    return [data.to(device) for data in loader]
+
+
+@torch.no_grad()
+def predict_ensemble(models, batches, groups=None):
+    """One pass of all members over batches (a DataLoader or cache_batches())
+
+    Every batch is collated once and evaluated by every member; probabilities stay on the
+    device until the end. Returns numpy arrays (mean_probs [N, C], member_probs [M, N, C], labels [N]).
+    """
+    for model in models:
+        model.eval()
+    groups = groups if groups is not None else group_members(models)
+    probs, labels = [], []
+    for data in batches:
+        outputs = ensemble_forward(models, data, groups)
+        probs.append(torch.stack([torch.softmax(out, dim=1) for out, _ in outputs]))
+        labels.append(data.y)
+    member_probs = torch.cat(probs, dim=1)
+    return (member_probs.mean(dim=0).cpu().numpy(), member_probs.cpu().numpy(),
+            torch.cat(labels).cpu().numpy())
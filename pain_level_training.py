@@ -5,13 +5,14 @@ Extended Multi-Level Pain Classification Training
 """
 
 import torch
-import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
 from imports.PainGraphDataset import PainGraphDataset
+from imports.checkpoints import CheckpointManager
+from imports.trainer import Trainer, LossTerm, forward_logits, cross_entropy_loss
 from net.braingnn import BrainGNN
 import os
 
@@ -127,67 +128,22 @@ class PainLevelTrainer:
         num_features = 116  # Number of ROIs
         model = BrainGNN(num_features=num_features, num_classes=self.num_levels).to(self.device)
         
-        # Loss and optimizer
-        criterion = nn.CrossEntropyLoss()
+        # Optimizer
         optimizer = optim.Adam(model.parameters(), lr=0.001, weight_decay=1e-5)
         scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=20, gamma=0.8)
         
+        # Best weights + the best full checkpoint (metrics, optimizer, pain levels), written in the background
+        checkpoints = CheckpointManager('./models/pain_level', top_k=1, save_last_every=0,
+                                        weights_path='./models/best_pain_level_model.pth',
+                                        metadata={'pain_levels': self.level_names})
+        
         # Training loop
-        train_losses = []
-        val_accuracies = []
-        best_val_acc = 0.0
-        
-        for epoch in range(epochs):
-            # Training phase
-            model.train()
-            train_loss = 0.0
-            
-            for batch in train_loader:
-                batch = batch.to(self.device)
-                optimizer.zero_grad()
-                
-                outputs = model(batch)
-                loss = criterion(outputs, batch.y)
-                loss.backward()
-                optimizer.step()
-                
-                train_loss += loss.item()
-            
-            # Validation phase
-            model.eval()
-            val_predictions = []
-            val_labels = []
-            
-            with torch.no_grad():
-                for batch in val_loader:
-                    batch = batch.to(self.device)
-                    outputs = model(batch)
-                    predictions = torch.argmax(outputs, dim=1)
-                    
-                    val_predictions.extend(predictions.cpu().numpy())
-                    val_labels.extend(batch.y.cpu().numpy())
-            
-            # Calculate metrics
-            val_acc = accuracy_score(val_labels, val_predictions)
-            avg_train_loss = train_loss / len(train_loader)
-            
-            train_losses.append(avg_train_loss)
-            val_accuracies.append(val_acc)
-            
-            # Save best model
-            if val_acc > best_val_acc:
-                best_val_acc = val_acc
-                torch.save({
-                    'model_state_dict': model.state_dict(),
-                    'val_accuracy': val_acc,
-                    'epoch': epoch,
-                    'pain_levels': self.level_names
-                }, './models/best_pain_level_model.pth')
-            
-            scheduler.step()
-            
-            if (epoch + 1) % 10 == 0:
-                print(f"Epoch {epoch+1}/{epochs} - Loss: {avg_train_loss:.4f}, Val Acc: {val_acc:.4f}")
+        trainer = Trainer(model, optimizer, scheduler, device=self.device, forward=forward_logits,
+                          loss_terms=[LossTerm('ce', cross_entropy_loss)], log_every=10)
+        history = trainer.fit(train_loader, val_loader, epochs=epochs, monitor='val_acc', checkpoint=checkpoints)
+        train_losses = [record['train_loss'] for record in history]
+        val_accuracies = [record['val_acc'] for record in history]
+        best_val_acc = trainer.best_score
         
         print(f"🎉 Training completed! Best validation accuracy: {best_val_acc:.4f}")
         
@@ -322,6 +278,7 @@ def main():
         
         print("\\n📁 Generated Files:")
         print("  • ./models/best_pain_level_model.pth")
+        print("  • ./models/pain_level/ (best checkpoint with optimizer state and pain levels)")
         print("  • ./figures/pain_level_confusion_matrix.png/pdf") 
         print("  • ./figures/pain_level_training_curves.png/pdf")
         print("  • ./figures/pain_level_prediction.png/pdf")
@@ -11,6 +11,8 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import pandas as pd
 
+from imports.surface_projection import project_activation, region_arrays
+
 class Plotly3DBrainViewer:
     """Plotly 3D脑图查看器"""
     
@@ -132,29 +134,11 @@ class Plotly3DBrainViewer:
     def calculate_surface_activation(self, x, y, z):
         """计算表面激活值"""
         
-        activation_surface = np.zeros_like(x)
-        
-        for i in range(x.shape[0]):
-            for j in range(x.shape[1]):
-                point = [x[i,j], y[i,j], z[i,j]]
-                
-                # 找最近的脑区并计算激活
-                min_distance = float('inf')
-                activation = 0.0
-                
-                for region_name, region_data in self.brain_regions.items():
-                    region_coords = region_data['coords']
-                    distance = np.sqrt(sum((point[k] - region_coords[k])**2 for k in range(3)))
-                    
-                    if distance < min_distance:
-                        min_distance = distance
-                        # 距离衰减
-                        decay = np.exp(-distance / 25.0)
-                        activation = region_data['activation'] * decay
-                
-                activation_surface[i,j] = activation
+        # 找最近的脑区并计算激活 (距离衰减), 所有顶点一次KD树查询
+        centroids, activations = region_arrays(self.brain_regions)
+        vertices = np.stack([x, y, z], axis=-1)
         
-        return activation_surface
+        return project_activation(vertices, centroids, activations, mode='nearest', decay=25.0)
     
     def create_interactive_3d_plot(self):
         """创建交互式3D图"""
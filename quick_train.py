@@ -4,12 +4,9 @@
 """
 
 import torch
-import torch.nn.functional as F
 from torch_geometric.loader import DataLoader
-from sklearn.metrics import accuracy_score, f1_score
-from sklearn.utils.class_weight import compute_class_weight
-import numpy as np
 from imports.PainGraphDataset import PainGraphDataset
+from imports.trainer import Trainer, forward_multitask
 from intelligent_optimization import ImprovedBrainGNN
 
 def main():
@@ -68,70 +65,15 @@ def main():
     scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=20, gamma=0.5)
     
     # 训练
-    best_val_acc = 0
-    for epoch in range(60):
-        model.train()
-        total_loss = 0
-        train_preds = []
-        train_labels = []
-        
-        for data in train_loader:
-            data = data.to(device)
-            optimizer.zero_grad()
-            
-            out, _ = model(data)
-            loss = F.nll_loss(out, data.y)
-            
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-            optimizer.step()
-            
-            total_loss += loss.item()
-            pred = out.argmax(dim=1)
-            train_preds.extend(pred.cpu().numpy())
-            train_labels.extend(data.y.cpu().numpy())
-        
-        train_acc = accuracy_score(train_labels, train_preds)
-        
-        # 验证
-        model.eval()
-        val_preds = []
-        val_labels = []
-        
-        with torch.no_grad():
-            for data in val_loader:
-                data = data.to(device)
-                out, _ = model(data)
-                pred = out.argmax(dim=1)
-                val_preds.extend(pred.cpu().numpy())
-                val_labels.extend(data.y.cpu().numpy())
-        
-        val_acc = accuracy_score(val_labels, val_preds)
-        scheduler.step()
-        
-        if val_acc > best_val_acc:
-            best_val_acc = val_acc
-            torch.save(model.state_dict(), './model/quick_optimized_model.pth')
-        
-        if epoch % 10 == 0:
-            print(f'Epoch {epoch:3d}: Train Acc: {train_acc:.4f}, Val Acc: {val_acc:.4f}')
+    trainer = Trainer(model, optimizer, scheduler, device=device, forward=forward_multitask,
+                      grad_clip=1.0, log_every=10)
+    trainer.fit(train_loader, val_loader, epochs=60, monitor='val_acc',
+                checkpoint='./model/quick_optimized_model.pth')
     
     # 测试
-    model.load_state_dict(torch.load('./model/quick_optimized_model.pth'))
-    model.eval()
-    test_preds = []
-    test_labels = []
-    
-    with torch.no_grad():
-        for data in test_loader:
-            data = data.to(device)
-            out, _ = model(data)
-            pred = out.argmax(dim=1)
-            test_preds.extend(pred.cpu().numpy())
-            test_labels.extend(data.y.cpu().numpy())
-    
-    test_acc = accuracy_score(test_labels, test_preds)
-    test_f1 = f1_score(test_labels, test_preds, average='weighted')
+    trainer.restore_best()
+    test_metrics = trainer.evaluate(test_loader)
+    test_acc, test_f1 = test_metrics['acc'], test_metrics['f1']
     
     print(f'\n' + '='*50)
     print(f'🎯 快速优化结果:')
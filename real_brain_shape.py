@@ -9,6 +9,8 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from imports.surface_projection import project_activation, region_arrays
+
 class RealBrainShapeVisualization:
     """真实大脑形状可视化器"""
     
@@ -148,27 +150,11 @@ class RealBrainShapeVisualization:
     def calculate_surface_activation(self, x, y, z):
         """计算表面激活强度"""
         
-        activation_surface = np.zeros_like(x)
-        
-        for i in range(x.shape[0]):
-            for j in range(x.shape[1]):
-                point = np.array([x[i,j], y[i,j], z[i,j]])
-                
-                # 计算激活值 (基于最近脑区的距离衰减)
-                total_activation = 0.0
-                
-                for region_name, region_data in self.brain_regions.items():
-                    region_coords = np.array(region_data['coords'])
-                    distance = np.linalg.norm(point - region_coords)
-                    
-                    # 高斯衰减函数
-                    sigma = 25.0  # 影响半径
-                    weight = np.exp(-(distance**2) / (2 * sigma**2))
-                    total_activation += region_data['activation'] * weight
-                
-                activation_surface[i,j] = total_activation
-        
-        return activation_surface
+        # 计算激活值 (所有脑区的高斯衰减加权和, sigma = 25mm 影响半径)
+        centroids, activations = region_arrays(self.brain_regions)
+        vertices = np.stack([x, y, z], axis=-1)
+        
+        return project_activation(vertices, centroids, activations, mode='gaussian', sigma=25.0)
 
     def create_realistic_brain_visualization(self):
         """创建真实大脑可视化"""
@@ -1,23 +1,37 @@
 import os
-import torch
-from tqdm import tqdm
+import sys
+import argparse
 
-def infer_task_type(data, fname):
-    # 优先用dataset字段，否则用文件名判断
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imports.graph_attributes import GraphAttributeStore, Migration
+
+DATASETS = ['ds000140', 'ds003836', 'ds005413']
+
+
+def index_graph_labels(fname, row, data):
+    # 只读一次图文件：记录dataset字段和标量标签，之后的重新标注都只改sidecar表
     dataset = getattr(data, 'dataset', None)
+    label = None
+    if hasattr(data, 'y') and data.y.numel() == 1:
+        label = data.y.item()
+    return {
+        'source_dataset': dataset if isinstance(dataset, str) else None,
+        'label': label,
+    }
+
+
+def infer_task_type(row, fname):
+    # 优先用dataset字段，否则用文件名判断
+    dataset = row.get('source_dataset')
     if dataset is None or dataset == 'unknown':
-        if 'ds000140' in fname:
-            dataset = 'ds000140'
-        elif 'ds003836' in fname:
-            dataset = 'ds003836'
-        elif 'ds005413' in fname:
-            dataset = 'ds005413'
-        else:
+        dataset = next((name for name in DATASETS if name in fname), None)
+        if dataset is None:
             return -1
     # 规则分配
     if dataset == 'ds000140':
         # 性别分类优先（假设y为0/1），否则年龄回归
-        if hasattr(data, 'y') and data.y.numel() == 1 and int(data.y.item()) in [0, 1]:
+        label = row.get('label')
+        if label is not None and int(label) in [0, 1]:
             return 0
         else:
             return 2
@@ -28,18 +42,28 @@ def infer_task_type(data, fname):
     else:
         return -1
 
+
+def assign_task_type(fname, row):
+    return {'task_type': infer_task_type(row, fname)}
+
+
+MIGRATIONS = [
+    Migration('index_graph_labels', index_graph_labels, reads_data=True, attach=False),
+    Migration('task_type_by_dataset', assign_task_type),
+]
+
+
 def main():
-    root = 'data/pain_data/all_graphs'
-    files = [f for f in os.listdir(root) if f.endswith('.pt')]
-    for fname in tqdm(files):
-        fpath = os.path.join(root, fname)
-        try:
-            data = torch.load(fpath)
-            ttype = infer_task_type(data, fname)
-            data.task_type = torch.tensor([ttype])
-            torch.save(data, fpath)
-        except Exception as e:
-            print(f"Failed to process {fname}: {e}")
+    parser = argparse.ArgumentParser(description='Assign task_type to every graph through the sidecar attribute table')
+    parser.add_argument('--root', type=str, default='data/pain_data/all_graphs')
+    parser.add_argument('--workers', type=int, default=None, help='Processes for migrations that read graph files')
+    args = parser.parse_args()
+
+    store = GraphAttributeStore(args.root)
+    failed = store.migrate(MIGRATIONS, num_workers=args.workers)
+    print(f"✅ schema_version={store.schema_version}, {len(store.column('task_type'))} files labelled, "
+          f"{len(failed)} failed")
+
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -13,6 +13,9 @@ import os
 import pickle
 import argparse
 
+from imports.volume_raster import get_atlas_rasterizer
+from imports.score_maps import load_score_maps, roi_importance as masked_roi_importance
+
 def load_importance_scores(score_path='./importance_scores/roi_importance.npy'):
     """加载ROI重要性分数"""
     if os.path.exists(score_path):
@@ -23,6 +26,17 @@ def load_importance_scores(score_path='./importance_scores/roi_importance.npy'):
         print(f"❌ 重要性分数文件不存在: {score_path}")
         return None
 
+def load_importance_from_score_maps(score_dir, layer=0, method='mean'):
+    """由每个被试的分数图 (export_importance_scores 写出的memmap) 计算ROI重要性, 只用正确预测的被试"""
+    if not os.path.exists(os.path.join(score_dir, 'score_maps.npy')):
+        print(f"❌ 分数图不存在: {score_dir}/score_maps.npy")
+        return None
+    maps = load_score_maps(score_dir)
+    correct = np.asarray(maps['predictions']) == np.asarray(maps['labels'])
+    roi_importance = masked_roi_importance(maps['scores'], maps['masks'], correct, layer=layer, method=method)
+    print(f"✅ 由分数图计算ROI重要性: {maps['scores'].shape} -> {roi_importance.shape} (第{layer + 1}层, {method})")
+    return roi_importance
+
 def load_stats(stats_path='./importance_scores/stats.pkl'):
     """加载统计信息"""
     if os.path.exists(stats_path):
@@ -177,28 +191,12 @@ def create_paper_style_visualization(importance_mask, fsaverage, stats=None):
     plt.tight_layout()
     return fig
 
-def create_glass_brain_visualization(roi_importance, fsaverage):
+def create_glass_brain_visualization(roi_importance, fsaverage, atlas_path='atlas_116.nii.gz'):
     """创建玻璃脑可视化"""
     print("🔍 创建玻璃脑可视化...")
-    import nibabel as nib
-    from nilearn import image
     
-    # 创建一个3D体积（64x64x64）
-    volume_size = 64
-    importance_volume = np.zeros((volume_size, volume_size, volume_size))
-    n_rois = len(roi_importance)
-    center_start = volume_size // 4
-    center_end = 3 * volume_size // 4
-    # 将ROI重要性分数填入中心区域
-    for i in range(min(n_rois, (center_end - center_start) ** 3)):
-        x = center_start + (i % (center_end - center_start))
-        y = center_start + ((i // (center_end - center_start)) % (center_end - center_start))
-        z = center_start + (i // (center_end - center_start) ** 2)
-        if x < center_end and y < center_end and z < center_end:
-            importance_volume[x, y, z] = roi_importance[i]
-    # 创建Nifti1Image
-    affine = np.eye(4)
-    importance_img = nib.Nifti1Image(importance_volume, affine)
+    # 用AAL116 label图把每个ROI的重要性分数填入对应体素（一次查表）
+    importance_img = get_atlas_rasterizer(atlas_path).to_nifti(roi_importance)
     
     fig, axes = plt.subplots(2, 2, figsize=(15, 12))
     fig.suptitle('BrainGNN ROI Importance - Glass Brain View', fontsize=16, fontweight='bold')
@@ -309,15 +307,21 @@ def main():
     # ==== 支持命令行参数 ====
     parser = argparse.ArgumentParser(description='脑区重要性可视化')
     parser.add_argument('--score_path', type=str, default='./importance_scores/roi_importance.npy', help='重要性分数文件路径')
+    parser.add_argument('--score_maps', type=str, default=None, help='每个被试分数图所在目录 (代替--score_path)')
+    parser.add_argument('--layer', type=int, default=0, help='--score_maps 使用的pooling层 (0-2)')
+    parser.add_argument('--method', type=str, default='mean', choices=['mean', 'weighted', 'max'])
     parser.add_argument('--roi_csv', type=str, default=None, help='带脑区名称的csv（自动高亮TOP-10）')
-    parser.add_argument('--atlas_path', type=str, default='atlas_116.nii.gz', help='AAL116 label图（每voxel=ROI编号+1）')
+    parser.add_argument('--atlas_path', type=str, default='atlas_116.nii.gz', help='AAL116 label图（第i小的非零label = ROI i）')
     args = parser.parse_args()
     score_path = args.score_path
     roi_csv = args.roi_csv or score_path.replace('ensemble_importance.npy', 'roi_importance_with_name.csv')
     atlas_path = args.atlas_path
 
     # 1. 加载重要性分数
-    roi_importance = load_importance_scores(score_path)
+    if args.score_maps:
+        roi_importance = load_importance_from_score_maps(args.score_maps, args.layer, args.method)
+    else:
+        roi_importance = load_importance_scores(score_path)
     if roi_importance is None:
         return
     
@@ -338,7 +342,7 @@ def main():
     print("💾 保存大脑表面图: brain_importance_surface.png")
     
     # 玻璃脑可视化
-    fig2 = create_glass_brain_visualization(roi_importance, fsaverage)
+    fig2 = create_glass_brain_visualization(roi_importance, fsaverage, atlas_path)
     fig2.savefig('brain_importance_glass.png', dpi=300, bbox_inches='tight')
     print("💾 保存玻璃脑图: brain_importance_glass.png")
     
@@ -359,14 +363,11 @@ def main():
         print("\nTOP-10 ROI:")
         print(top10[['BrainRegion', 'Importance']])
         # 生成stat_map
-        atlas_img = nib.load(atlas_path)
-        atlas_data = atlas_img.get_fdata()
-        stat_map = np.zeros_like(atlas_data)
-        for idx, row in top10.iterrows():
-            roi_id = int(row['ROI'])
-            stat_map[atlas_data == roi_id + 1] = row['Importance']
+        rasterizer = get_atlas_rasterizer(atlas_path)
+        top10_scores = np.zeros(rasterizer.num_rois)
+        top10_scores[top10['ROI'].astype(int).values] = top10['Importance'].values
         out_path = 'top10_importance_map.nii.gz'
-        nib.save(nib.Nifti1Image(stat_map, affine=atlas_img.affine), out_path)
+        nib.save(rasterizer.to_nifti(top10_scores), out_path)
         print(f"已保存TOP-10高亮stat_map: {out_path}")
         plotting.plot_glass_brain(out_path, threshold=np.percentile(top10['Importance'], 90), colorbar=True, title='Top-10 ROI')
         plotting.show()
@@ -1,38 +1,28 @@
 import os
-import pandas as pd
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imports.bids_index import load_layout_index
 
 DATASET_DIR = 'data/pain_data/ds005413'
-min_durations = []
-all_durations = []
-short_trial_count = 0
 short_trial_threshold = 2  # 你可以调整这个阈值
 
-total_trials = 0
-for sub in sorted(os.listdir(DATASET_DIR)):
-    if not sub.startswith('sub-'):
-        continue
-    sub_dir = os.path.join(DATASET_DIR, sub, 'func')
-    if not os.path.isdir(sub_dir):
-        continue
-    for fname in os.listdir(sub_dir):
-        if fname.endswith('_events.tsv'):
-            events_path = os.path.join(sub_dir, fname)
-            try:
-                events = pd.read_csv(events_path, sep='\t')
-                durations = events['duration'].astype(float).values
-                all_durations.extend(durations)
-                min_durations.append(durations.min())
-                short_count = (durations < short_trial_threshold).sum()
-                short_trial_count += short_count
-                total_trials += len(durations)
-                print(f"{events_path}: min={durations.min()}, max={durations.max()}, mean={durations.mean():.2f}, short(<{short_trial_threshold})={short_count}/{len(durations)}")
-            except Exception as e:
-                print(f"Failed to read {events_path}: {e}")
+# events.tsv 已在布局索引中解析，这里只做查询
+events = load_layout_index(DATASET_DIR).events()
+events = events[events['duration'].notna()]
+
+if len(events):
+    for events_path, run_events in events.groupby('events_path', sort=True):
+        durations = run_events['duration'].values
+        short_count = (durations < short_trial_threshold).sum()
+        print(f"{events_path}: min={durations.min()}, max={durations.max()}, mean={durations.mean():.2f}, short(<{short_trial_threshold})={short_count}/{len(durations)}")
 
-if all_durations:
+    all_durations = events['duration'].values
+    total_trials = len(all_durations)
+    short_trial_count = (all_durations < short_trial_threshold).sum()
     print("\n=== 全部 trial duration 统计 ===")
     print(f"总trial数: {total_trials}")
-    print(f"最小: {min(all_durations)}，最大: {max(all_durations)}，均值: {sum(all_durations)/len(all_durations):.2f}")
+    print(f"最小: {all_durations.min()}，最大: {all_durations.max()}，均值: {all_durations.mean():.2f}")
     print(f"短trial(<{short_trial_threshold})数量: {short_trial_count}，占比: {short_trial_count/total_trials:.2%}")
 else:
-    print("未找到任何有效的events.tsv文件或duration列！") 
\ No newline at end of file
+    print("未找到任何有效的events.tsv文件或duration列！")
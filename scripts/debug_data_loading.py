@@ -3,6 +3,7 @@ import numpy as np
 import torch
 import deepdish as dd
 from imports.read_abide_stats_parall import read_sigle_data
+from imports.data_qc import scan_file, run_qc
 
 raw_dir = './data/ABIDE_pcp/cpac/filt_noglobal/raw'
 all_files = sorted([f for f in os.listdir(raw_dir) if f.endswith('.h5')])
@@ -17,33 +18,12 @@ print("H5文件内容:")
 for key in temp.keys():
     print(f"  {key}: {type(temp[key])}")
 
-# 检查pcorr矩阵
-pcorr = np.abs(temp['pcorr'][()])
-print(f"\npcorr矩阵:")
-print(f"  形状: {pcorr.shape}")
-print(f"  数据类型: {pcorr.dtype}")
-print(f"  最小值: {np.min(pcorr)}")
-print(f"  最大值: {np.max(pcorr)}")
-print(f"  均值: {np.mean(pcorr)}")
-print(f"  是否有inf: {np.any(np.isinf(pcorr))}")
-print(f"  是否有nan: {np.any(np.isnan(pcorr))}")
-if np.any(np.isinf(pcorr)) or np.any(np.isnan(pcorr)):
-    print(f"  inf位置: {np.where(np.isinf(pcorr))}")
-    print(f"  nan位置: {np.where(np.isnan(pcorr))}")
-
-# 检查corr特征
-corr = temp['corr'][()]
-print(f"\ncorr特征:")
-print(f"  形状: {corr.shape}")
-print(f"  数据类型: {corr.dtype}")
-print(f"  最小值: {np.min(corr)}")
-print(f"  最大值: {np.max(corr)}")
-print(f"  均值: {np.mean(corr)}")
-print(f"  是否有inf: {np.any(np.isinf(corr))}")
-print(f"  是否有nan: {np.any(np.isnan(corr))}")
-if np.any(np.isinf(corr)) or np.any(np.isnan(corr)):
-    print(f"  inf位置: {np.where(np.isinf(corr))}")
-    print(f"  nan位置: {np.where(np.isnan(corr))}")
+# 检查pcorr / corr矩阵 (与 scripts/qc.py 相同的检查)
+qc_row = scan_file(os.path.join(raw_dir, test_file))
+print(f"\nQC状态: {qc_row['status']} {qc_row['error']}")
+for key, value in qc_row.items():
+    if key.startswith(('pcorr_', 'corr_')):
+        print(f"  {key}: {value}")
 
 # 检查label
 label = temp['label'][()]
@@ -62,13 +42,8 @@ print(f"  返回的att方差: {np.var(att)}")
 
 # 检查多个文件
 print(f"\n检查前5个文件:")
-for i in range(min(5, len(all_files))):
-    fname = all_files[i]
-    temp = dd.io.load(os.path.join(raw_dir, fname))
-    pcorr = np.abs(temp['pcorr'][()])
-    corr = temp['corr'][()]
-    
-    print(f"  文件{i+1}: {fname}")
-    print(f"    pcorr有inf: {np.any(np.isinf(pcorr))}, 有nan: {np.any(np.isnan(pcorr))}")
-    print(f"    corr有inf: {np.any(np.isinf(corr))}, 有nan: {np.any(np.isnan(corr))}")
-    print(f"    corr均值: {np.mean(corr):.6f}, 方差: {np.var(corr):.6f}") 
\ No newline at end of file
+for i, qc_row in enumerate(run_qc([os.path.join(raw_dir, f) for f in all_files[:5]])):
+    print(f"  文件{i+1}: {qc_row['file']} [{qc_row['status']}]")
+    print(f"    pcorr nan/inf: {qc_row.get('pcorr_nan')}/{qc_row.get('pcorr_posinf')}, "
+          f"corr nan/inf: {qc_row.get('corr_nan')}/{qc_row.get('corr_posinf')}, "
+          f"退化ROI: {qc_row.get('corr_degenerate')}")
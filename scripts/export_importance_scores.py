@@ -13,10 +13,11 @@ import argparse
 from net.braingnn import Network
 from imports.ABIDEDataset import ABIDEDataset
 from imports.utils import train_val_test_split
+from imports.score_maps import ScoreMapWriter, roi_importance as masked_roi_importance
 
 def load_trained_model(model_path, args):
     """加载训练好的模型"""
-    model = Network(args.indim, args.ratio, args.nclass)
+    model = Network(args.indim, args.ratio, args.nclass, R=args.nroi)
     
     if os.path.exists(model_path):
         checkpoint = torch.load(model_path, map_location='cpu')
@@ -30,13 +31,10 @@ def load_trained_model(model_path, args):
         print(f"❌ 模型文件不存在: {model_path}")
         return None
 
-def extract_importance_scores(model, dataloader, device='cpu'):
-    """提取重要性分数"""
+def extract_importance_scores(model, dataloader, save_dir, n_subjects, device='cpu'):
+    """提取重要性分数: 每个被试每层pooling的 [R] 分数图 (按ROI编号还原), 流式写入memmap"""
     model.eval()
-    all_scores1 = []
-    all_scores2 = []
-    all_predictions = []
-    all_labels = []
+    writer = ScoreMapWriter(save_dir, n_subjects, n_layers=3, n_rois=model.R)
     
     print("🔍 正在提取重要性分数...")
     
@@ -44,59 +42,34 @@ def extract_importance_scores(model, dataloader, device='cpu'):
         for batch in dataloader:
             batch = batch.to(device)
             
-            # 前向传播，获取分数
-            output, _, _, score1, score2 = model(batch.x, batch.edge_index, 
-                                                batch.batch, batch.edge_attr, batch.pos)
-            
-            # 收集分数
-            all_scores1.append(score1.cpu().numpy())
-            all_scores2.append(score2.cpu().numpy())
-            
-            # 收集预测和标签
-            pred = output.argmax(dim=1)
-            all_predictions.append(pred.cpu().numpy())
-            all_labels.append(batch.y.cpu().numpy())
-    
-    # 转换为numpy数组
-    scores1 = np.concatenate(all_scores1, axis=0)  # shape: (n_samples, n_rois)
-    scores2 = np.concatenate(all_scores2, axis=0)  # shape: (n_samples, n_rois)
-    predictions = np.concatenate(all_predictions, axis=0)
-    labels = np.concatenate(all_labels, axis=0)
-    
-    return scores1, scores2, predictions, labels
+            # 前向传播，获取按ROI编号还原的分数 [B, 3, R] 和保留mask
+            output, scores, masks = model.score_maps(batch.x, batch.edge_index, batch.batch,
+                                                     batch.edge_attr, batch.pos, num_graphs=batch.num_graphs)
+            writer.write(scores, masks, output.argmax(dim=1), batch.y)
+    
+    # score_maps / keep_masks / predictions / labels (memmap)
+    return writer.close()
 
-def calculate_roi_importance(scores1, scores2, predictions, labels, method='mean'):
-    """只用第一层分数计算每个ROI的重要性分数"""
-    print(f"📊 计算ROI重要性分数 (方法: {method}, 只用第一层)...")
-    correct_mask = (predictions == labels)
-    print(f"   正确预测样本数: {np.sum(correct_mask)}/{len(predictions)}")
-    if method == 'mean':
-        roi_importance1 = np.mean(scores1[correct_mask], axis=0)
-    elif method == 'weighted':
-        confidence = np.max(scores1[correct_mask], axis=1)
-        weights = confidence / np.sum(confidence)
-        roi_importance1 = np.average(scores1[correct_mask], axis=0, weights=weights)
-    elif method == 'max':
-        roi_importance1 = np.max(scores1[correct_mask], axis=0)
+def calculate_roi_importance(maps, method='mean'):
+    """用正确预测被试的分数图计算每个ROI的重要性 (只统计保留了该ROI的被试)"""
+    print(f"📊 计算ROI重要性分数 (方法: {method}, 第一层为主)...")
+    correct_mask = (np.asarray(maps['predictions']) == np.asarray(maps['labels']))
+    print(f"   正确预测样本数: {np.sum(correct_mask)}/{len(correct_mask)}")
+    roi_importance1 = masked_roi_importance(maps['scores'], maps['masks'], correct_mask, layer=0, method=method)
+    roi_importance2 = masked_roi_importance(maps['scores'], maps['masks'], correct_mask, layer=1, method=method)
     roi_importance = roi_importance1
-    roi_importance2 = None
     return roi_importance, roi_importance1, roi_importance2
 
-def save_importance_scores(roi_importance, roi_importance1, roi_importance2, 
-                          scores1, scores2, predictions, labels, save_dir='./importance_scores'):
-    """保存重要性分数"""
+def save_importance_scores(roi_importance, roi_importance1, roi_importance2, maps, save_dir='./importance_scores'):
+    """保存重要性分数 (每个被试的分数图已由extract_importance_scores写入save_dir)"""
     os.makedirs(save_dir, exist_ok=True)
     
     # 保存主要的重要性分数
     np.save(os.path.join(save_dir, 'roi_importance.npy'), roi_importance)
     np.save(os.path.join(save_dir, 'roi_importance_layer1.npy'), roi_importance1)
+    np.save(os.path.join(save_dir, 'roi_importance_layer2.npy'), roi_importance2)
     
-    # 保存原始分数数据
-    np.save(os.path.join(save_dir, 'all_scores_layer1.npy'), scores1)
-    
-    # 收集预测和标签
-    all_predictions = predictions
-    all_labels = labels
+    predictions, labels = np.asarray(maps['predictions']), np.asarray(maps['labels'])
     
     # 保存统计信息
     stats = {
@@ -104,7 +77,8 @@ def save_importance_scores(roi_importance, roi_importance1, roi_importance2,
         'n_correct': np.sum(predictions == labels),
         'accuracy': np.mean(predictions == labels),
         'roi_importance_shape': roi_importance.shape,
-        'score1_shape': scores1.shape
+        'score_maps_shape': maps['scores'].shape,
+        'keep_rate_layer1': np.asarray(maps['masks'][:, 0]).mean(axis=0),
     }
     
     with open(os.path.join(save_dir, 'stats.pkl'), 'wb') as f:
@@ -133,6 +107,7 @@ def main():
     
     # 模型参数
     parser.add_argument('--indim', type=int, default=200, help='输入维度')
+    parser.add_argument('--nroi', type=int, default=200, help='ROI数量')
     parser.add_argument('--ratio', type=float, default=0.5, help='pooling比例')
     parser.add_argument('--nclass', type=int, default=2, help='类别数')
     
@@ -144,7 +119,6 @@ def main():
     print("📂 加载数据...")
     dataset = ABIDEDataset(args.data_path, 'ABIDE')
     dataset.data.y = dataset.data.y.squeeze()
-    dataset.data.x[dataset.data.x == float('inf')] = 0
     
     # 获取数据分割
     tr_index, val_index, te_index = train_val_test_split(fold=0)
@@ -162,16 +136,14 @@ def main():
     
     model = model.to(args.device)
     
-    # 4. 提取重要性分数
-    scores1, scores2, predictions, labels = extract_importance_scores(model, test_loader, args.device)
+    # 4. 提取重要性分数 (流式写入 save_dir/score_maps.npy 等memmap)
+    maps = extract_importance_scores(model, test_loader, args.save_dir, len(test_dataset), args.device)
     
     # 5. 计算ROI重要性
-    roi_importance, roi_importance1, roi_importance2 = calculate_roi_importance(
-        scores1, scores2, predictions, labels, args.method)
+    roi_importance, roi_importance1, roi_importance2 = calculate_roi_importance(maps, args.method)
     
     # 6. 保存结果
-    save_importance_scores(roi_importance, roi_importance1, roi_importance2,
-                          scores1, scores2, predictions, labels, args.save_dir)
+    save_importance_scores(roi_importance, roi_importance1, roi_importance2, maps, args.save_dir)
     
     print("✅ 重要性分数导出完成！")
     print(f"📊 前10个ROI的重要性分数:")
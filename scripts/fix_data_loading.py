@@ -9,19 +9,7 @@ from torch_geometric.utils import remove_self_loops
 from torch_sparse import coalesce
 from imports.gdc import GDC
 from torch_geometric.data import Data
-
-def fix_inf_nan_matrix(matrix, diagonal_value=1.0):
-    """修复矩阵中的inf/nan值"""
-    # 复制矩阵避免修改原始数据
-    fixed_matrix = matrix.copy()
-    
-    # 替换inf为有限值
-    fixed_matrix = np.nan_to_num(fixed_matrix, nan=0.0, posinf=1.0, neginf=-1.0)
-    
-    # 将对角线设为指定值（通常是1.0，表示自相关）
-    np.fill_diagonal(fixed_matrix, diagonal_value)
-    
-    return fixed_matrix
+from imports.data_qc import fix_inf_nan_matrix
 
 def read_sigle_data_fixed(data_dir, filename, use_gdc=False):
     """修复版本的read_sigle_data函数"""
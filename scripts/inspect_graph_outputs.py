@@ -31,7 +31,8 @@ for ds in sorted(os.listdir(DATA_ROOT)):
     graph_dir = os.path.join(ds_dir, 'graphs')
     fc_dir = os.path.join(ds_dir, 'fc')
     pt_files = [f for f in os.listdir(graph_dir)] if os.path.exists(graph_dir) else []
-    npy_files = [f for f in os.listdir(fc_dir)] if os.path.exists(fc_dir) else []
+    # 每个run的FC为 [n_windows, n_roi, n_roi]，_windows.npy是窗口表
+    npy_files = [f for f in os.listdir(fc_dir) if not f.endswith('_windows.npy')] if os.path.exists(fc_dir) else []
     report_lines.append(f"=== {ds} ===\n.pt files: {len(pt_files)}\n.npy files: {len(npy_files)}")
     # 随机抽样一个.pt和一个.npy做详细可视化
     if pt_files:
@@ -49,6 +50,8 @@ for ds in sorted(os.listdir(DATA_ROOT)):
         npy_path = os.path.join(fc_dir, npy_files[0])
         info, arr = inspect_npy(npy_path)
         report_lines.append('Sample .npy: ' + info)
+        if arr.ndim == 3:
+            arr = arr[0]
         # 可视化FC
         plt.figure(figsize=(5,4))
         plt.title(f"{ds} FC matrix")
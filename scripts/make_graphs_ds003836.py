@@ -1,90 +1,108 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
 import nibabel as nib
-from nilearn.maskers import NiftiLabelsMasker
 from torch_geometric.data import Data
 import torch
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imports.roi_extraction import RoiExtractor
+from imports.graph_attributes import GraphAttributeStore
+from imports.node_features import record_timeseries_source
+from imports.bids_index import load_layout_index, volume_window
+from imports.windowed_fc import write_fc_windows, load_fc_windows
+
 AAL_PATH = 'imports/BrainNetViewer_20191031/Data/ExampleFiles/AAL90/aal.nii'
 DATASET_DIR = 'data/pain_data/ds003836'
 GRAPH_DIR = os.path.join(DATASET_DIR, 'graphs')
 FC_DIR = os.path.join(DATASET_DIR, 'fc')
+TS_DIR = os.path.join(DATASET_DIR, 'timeseries')
+DEFAULT_TR = 2.0  # 头文件没有TR时的默认值
 os.makedirs(GRAPH_DIR, exist_ok=True)
 os.makedirs(FC_DIR, exist_ok=True)
+os.makedirs(TS_DIR, exist_ok=True)
+
+# AAL平均矩阵按BOLD网格缓存，所有run共用
+extractor = RoiExtractor(AAL_PATH, standardize=True)
+# 每个图的ROI时序来源 (ts_file/ts_start/ts_end/ts_tr) 记录在graph_attributes.json，供节点特征库使用
+attributes = GraphAttributeStore(GRAPH_DIR)
 
-# 遍历所有被试
-for sub in sorted(os.listdir(DATASET_DIR)):
-    print(f"Checking subject: {sub}")
-    if not sub.startswith('sub-'):
+# 布局索引: run、TR (NIfTI头文件) 和events窗口都从缓存的索引查询
+layout = load_layout_index(DATASET_DIR)
+events = layout.events()
+
+# 遍历所有被试的run
+for run in layout.runs().itertuples():
+    sub = run.subject
+    base = run.base
+    fmri_path = run.path
+    print(f"    Processing fMRI: {fmri_path}")
+    if run.events_path is None:
+        print(f'    No events file for {fmri_path}')
+        continue
+    # 只处理high/low trial
+    run_events = events[(events['run_id'] == run.run_id) & events['trial_type'].isin(['high', 'low'])]
+    if len(run_events) == 0:
         continue
-    sub_dir = os.path.join(DATASET_DIR, sub, 'func')
-    if not os.path.isdir(sub_dir):
-        print(f"  No func dir for {sub}")
+    # 跳过空文件
+    if run.file_size == 0:
+        print(f"⚠️ Skip empty file: {fmri_path}")
         continue
-    for fname in os.listdir(sub_dir):
-        print(f"  Found file: {fname}")
-        if fname.endswith('_bold.nii') or fname.endswith('_bold.nii.gz'):
-            fmri_path = os.path.join(sub_dir, fname)
-            base = fname.replace('_bold.nii', '').replace('_bold.nii.gz', '')
-            events_path = os.path.join(sub_dir, base + '_events.tsv')
-            print(f"    Processing fMRI: {fmri_path}")
-            if not os.path.exists(events_path):
-                print(f'    No events file for {fmri_path}')
-                continue
-            events = pd.read_csv(events_path, sep='\t')
-            # 只处理high/low trial
-            for idx, row in events.iterrows():
-                trial_type = row['trial_type']
-                if trial_type not in ['high', 'low']:
-                    continue
-                onset = float(row['onset'])
-                duration = float(row['duration'])
-                if duration == 0:
-                    duration = 6.0  # 默认窗口长度6秒
-                # 1. 提取该trial的fMRI片段
-                masker = NiftiLabelsMasker(labels_img=AAL_PATH, standardize=True)
-                # 跳过空文件
-                if os.path.getsize(fmri_path) == 0:
-                    print(f"⚠️ Skip empty file: {fmri_path}")
-                    continue
-                try:
-                    time_series = masker.fit_transform(fmri_path)
-                except Exception as e:
-                    print(f"❌ Error processing {fmri_path}: {e}")
-                    continue
-                tr = 2.0  # 默认TR=2s，如需自动读取可扩展
-                start_vol = int(onset // tr)
-                end_vol = int((onset + duration) // tr)
-                if end_vol <= start_vol or end_vol > time_series.shape[0]:
-                    print(f'Skip trial {idx} in {fmri_path} due to invalid time window')
-                    continue
-                trial_ts = time_series[start_vol:end_vol]
-                if trial_ts.shape[0] < 2:
-                    print(f'Skip trial {idx} in {fmri_path} due to too short segment')
-                    continue
-                # 2. 计算FC
-                fc = np.corrcoef(trial_ts.T)
-                fc = np.nan_to_num(fc)
-                # 3. 保存FC
-                fc_save_path = os.path.join(FC_DIR, f'{sub}_{base}_trial{idx}_fc.npy')
-                np.save(fc_save_path, fc)
-                # 4. 构建图结构
-                n_roi = fc.shape[0]
-                edge_index = np.array(np.nonzero(np.ones((n_roi, n_roi))))
-                edge_attr = fc[edge_index[0], edge_index[1]]
-                x = trial_ts.mean(axis=0, keepdims=True).T  # [n_roi, 1]
-                y = torch.tensor([1 if trial_type == 'high' else 0], dtype=torch.long)
-                data = Data(x=torch.tensor(x, dtype=torch.float),
-                            edge_index=torch.tensor(edge_index, dtype=torch.long),
-                            edge_attr=torch.tensor(edge_attr, dtype=torch.float),
-                            y=y)
-                # 自动补全task_type字段
-                data.task_type = torch.tensor([1])  # ds003836: pain_level任务
-                # 5. 保存图结构
-                graph_save_path = os.path.join(GRAPH_DIR, f'{sub}_{base}_trial{idx}_graph.pt')
-                if os.path.exists(graph_save_path):
-                    print(f"Skip existing: {graph_save_path}")
-                    continue
-                torch.save(data, graph_save_path)
-                print(f'Saved: {graph_save_path} and {fc_save_path}') 
\ No newline at end of file
+    # 1. 提取ROI时序 (每个run只提取一次)
+    try:
+        time_series = extractor.fit_transform(fmri_path)
+    except Exception as e:
+        print(f"❌ Error processing {fmri_path}: {e}")
+        continue
+    ts_save_path = os.path.join(TS_DIR, f'{sub}_{base}_ts.npy')
+    np.save(ts_save_path, time_series)
+    tr = run.tr if not pd.isna(run.tr) else DEFAULT_TR
+    trials = []
+    for trial in run_events.itertuples():
+        idx = trial.trial_index
+        if trial.duration == 0 or pd.isna(trial.start_vol):
+            # 默认窗口长度6秒
+            duration = 6.0 if trial.duration == 0 else trial.duration
+            start_vol, end_vol = volume_window(trial.onset, duration, tr)
+        else:
+            start_vol, end_vol = int(trial.start_vol), int(trial.end_vol)
+        if end_vol <= start_vol or end_vol > time_series.shape[0]:
+            print(f'Skip trial {idx} in {fmri_path} due to invalid time window')
+            continue
+        if end_vol - start_vol < 2:
+            print(f'Skip trial {idx} in {fmri_path} due to too short segment')
+            continue
+        trials.append((idx, trial.trial_type, start_vol, end_vol))
+    if not trials:
+        continue
+    # 2. 一次计算该run所有trial窗口的FC
+    # 3. 保存FC: 每个run一个 [n_trials, n_roi, n_roi] 数组 (+ _windows.npy: start, end, trial)
+    idxs, trial_types, starts, ends = zip(*trials)
+    fc_save_path = os.path.join(FC_DIR, f'{sub}_{base}_fc.npy')
+    write_fc_windows(fc_save_path, time_series, starts, ends, ids=idxs)
+    fc_windows, _ = load_fc_windows(fc_save_path)
+    n_roi = fc_windows.shape[1]
+    edge_index = np.array(np.nonzero(np.ones((n_roi, n_roi))))
+    for i, (idx, trial_type, start_vol, end_vol) in enumerate(trials):
+        # 5. 保存图结构
+        graph_save_path = os.path.join(GRAPH_DIR, f'{sub}_{base}_trial{idx}_graph.pt')
+        record_timeseries_source(attributes, graph_save_path, ts_save_path, start_vol, end_vol, tr)
+        if os.path.exists(graph_save_path):
+            print(f"Skip existing: {graph_save_path}")
+            continue
+        # 4. 构建图结构
+        fc = fc_windows[i]
+        edge_attr = fc[edge_index[0], edge_index[1]]
+        x = time_series[start_vol:end_vol].mean(axis=0, keepdims=True).T  # [n_roi, 1]
+        y = torch.tensor([1 if trial_type == 'high' else 0], dtype=torch.long)
+        data = Data(x=torch.tensor(x, dtype=torch.float),
+                    edge_index=torch.tensor(edge_index, dtype=torch.long),
+                    edge_attr=torch.tensor(edge_attr, dtype=torch.float),
+                    y=y)
+        # 自动补全task_type字段
+        data.task_type = torch.tensor([1])  # ds003836: pain_level任务
+        torch.save(data, graph_save_path)
+        print(f'Saved: {graph_save_path} (FC row {i} of {fc_save_path})')
+
+attributes.save()
@@ -1,98 +1,122 @@
 import os
+import sys
+import json
 import numpy as np
 import pandas as pd
-import nibabel as nib
-from nilearn.maskers import NiftiLabelsMasker
 from torch_geometric.data import Data
 import torch
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imports.roi_extraction import RoiExtractor
+from imports.graph_attributes import GraphAttributeStore
+from imports.node_features import record_timeseries_source
+from imports.bids_index import load_layout_index
+from imports.windowed_fc import write_fc_windows, load_fc_windows
+
 AAL_PATH = 'imports/BrainNetViewer_20191031/Data/ExampleFiles/AAL90/aal.nii'
 DATASET_DIR = 'data/pain_data/ds005413'
 GRAPH_DIR = os.path.join(DATASET_DIR, 'graphs')
 FC_DIR = os.path.join(DATASET_DIR, 'fc')
+TS_DIR = os.path.join(DATASET_DIR, 'timeseries')
 os.makedirs(GRAPH_DIR, exist_ok=True)
 os.makedirs(FC_DIR, exist_ok=True)
+os.makedirs(TS_DIR, exist_ok=True)
+
+# AAL平均矩阵按BOLD网格缓存，所有run共用
+extractor = RoiExtractor(AAL_PATH, standardize=True)
+# 每个图的ROI时序来源 (ts_file/ts_start/ts_end/ts_tr) 记录在graph_attributes.json，供节点特征库使用
+attributes = GraphAttributeStore(GRAPH_DIR)
 
 min_required_length = 3  # 最小帧数门槛，可根据需要调整
 
-# 遍历所有被试
-for sub in sorted(os.listdir(DATASET_DIR)):
-    if not sub.startswith('sub-'):
+# 布局索引: run、TR (NIfTI头文件) 和events窗口都从缓存的索引查询
+layout = load_layout_index(DATASET_DIR)
+events = layout.events()
+
+# 以每个trial为单位，标签为pain_rating（如有）或trial_type
+total_trials = 0
+kept_trials = 0
+
+# 遍历所有被试的run
+for run in layout.runs(suffix='_bold.nii.gz').itertuples():
+    sub = run.subject
+    base = run.base
+    fmri_path = run.path
+    if run.events_path is None:
+        print(f'No events file for {fmri_path}')
         continue
-    sub_dir = os.path.join(DATASET_DIR, sub, 'func')
-    if not os.path.isdir(sub_dir):
+    run_events = events[events['run_id'] == run.run_id]
+    total_trials += len(run_events)
+    # 跳过空文件
+    if run.file_size == 0:
+        print(f"⚠️ Skip empty file: {fmri_path}")
         continue
-    for fname in os.listdir(sub_dir):
-        if fname.endswith('_bold.nii.gz'):
-            fmri_path = os.path.join(sub_dir, fname)
-            base = fname.replace('_bold.nii.gz', '')
-            events_path = os.path.join(sub_dir, base + '_events.tsv')
-            if not os.path.exists(events_path):
-                print(f'No events file for {fmri_path}')
+    # 1. 提取ROI时序 (每个run只提取一次)
+    try:
+        time_series = extractor.fit_transform(fmri_path)
+    except Exception as e:
+        print(f"❌ Error processing {fmri_path}: {e}")
+        continue
+    ts_save_path = os.path.join(TS_DIR, f'{sub}_{base}_ts.npy')
+    np.save(ts_save_path, time_series)
+    trials = []
+    for trial in run_events.itertuples():
+        idx = trial.trial_index
+        row = json.loads(trial.attributes)
+        # 优先用pain_rating，否则用trial_type
+        if 'pain_rating' in row:
+            try:
+                label = float(row['pain_rating'])
+            except:
                 continue
-            events = pd.read_csv(events_path, sep='\t')
-            # 以每个trial为单位，标签为pain_rating（如有）或trial_type
-            total_trials = 0
-            kept_trials = 0
-            for idx, row in events.iterrows():
-                total_trials += 1
-                # 优先用pain_rating，否则用trial_type
-                if 'pain_rating' in row:
-                    try:
-                        label = float(row['pain_rating'])
-                    except:
-                        continue
-                elif 'trial_type' in row:
-                    label = 1 if row['trial_type'] == 'high' else 0
-                else:
-                    print(f'No valid label for trial {idx} in {events_path}')
-                    continue
-                onset = float(row['onset'])
-                duration = float(row['duration'])
-                masker = NiftiLabelsMasker(labels_img=AAL_PATH, standardize=True)
-                # 跳过空文件
-                if os.path.getsize(fmri_path) == 0:
-                    print(f"⚠️ Skip empty file: {fmri_path}")
-                    continue
-                try:
-                    time_series = masker.fit_transform(fmri_path)
-                except Exception as e:
-                    print(f"❌ Error processing {fmri_path}: {e}")
-                    continue
-                # 自动读取TR
-                img = nib.load(fmri_path)
-                TR = img.header.get_zooms()[-1]
-                start_vol = int(onset // TR)
-                end_vol = int((onset + duration) // TR)
-                if end_vol <= start_vol or end_vol > time_series.shape[0]:
-                    print(f'Skip trial {idx} in {fmri_path} due to invalid time window')
-                    continue
-                trial_ts = time_series[start_vol:end_vol]
-                if trial_ts.shape[0] < min_required_length:
-                    print(f'Skip trial {idx} in {fmri_path} due to too short segment (length={trial_ts.shape[0]}, min_required_length={min_required_length})')
-                    continue
-                kept_trials += 1
-                fc = np.corrcoef(trial_ts.T)
-                fc = np.nan_to_num(fc)
-                fc_save_path = os.path.join(FC_DIR, f'{sub}_{base}_trial{idx}_fc.npy')
-                np.save(fc_save_path, fc)
-                n_roi = fc.shape[0]
-                edge_index = np.array(np.nonzero(np.ones((n_roi, n_roi))))
-                edge_attr = fc[edge_index[0], edge_index[1]]
-                x = trial_ts.mean(axis=0, keepdims=True).T  # [n_roi, 1]
-                y = torch.tensor([label], dtype=torch.float)
-                data = Data(x=torch.tensor(x, dtype=torch.float),
-                            edge_index=torch.tensor(edge_index, dtype=torch.long),
-                            edge_attr=torch.tensor(edge_attr, dtype=torch.float),
-                            y=y)
-                # 自动补全task_type字段
-                data.task_type = torch.tensor([3])  # ds005413: stimulus_class任务
-                graph_save_path = os.path.join(GRAPH_DIR, f'{sub}_{base}_trial{idx}_graph.pt')
-                torch.save(data, graph_save_path)
-                print(f'Saved: {graph_save_path} and {fc_save_path}') 
+        elif 'trial_type' in row:
+            label = 1 if row['trial_type'] == 'high' else 0
+        else:
+            print(f'No valid label for trial {idx} in {run.events_path}')
+            continue
+        # 窗口由头文件TR预先计算
+        if pd.isna(trial.start_vol):
+            print(f'Skip trial {idx} in {fmri_path} due to missing TR / onset')
+            continue
+        start_vol, end_vol = int(trial.start_vol), int(trial.end_vol)
+        if end_vol <= start_vol or end_vol > time_series.shape[0]:
+            print(f'Skip trial {idx} in {fmri_path} due to invalid time window')
+            continue
+        if end_vol - start_vol < min_required_length:
+            print(f'Skip trial {idx} in {fmri_path} due to too short segment (length={end_vol - start_vol}, min_required_length={min_required_length})')
+            continue
+        trials.append((idx, label, start_vol, end_vol))
+    if not trials:
+        continue
+    kept_trials += len(trials)
+    # 该run所有trial窗口的FC一次计算，保存为一个 [n_trials, n_roi, n_roi] 数组 (+ _windows.npy: start, end, trial)
+    idxs, labels, starts, ends = zip(*trials)
+    fc_save_path = os.path.join(FC_DIR, f'{sub}_{base}_fc.npy')
+    write_fc_windows(fc_save_path, time_series, starts, ends, ids=idxs)
+    fc_windows, _ = load_fc_windows(fc_save_path)
+    n_roi = fc_windows.shape[1]
+    edge_index = np.array(np.nonzero(np.ones((n_roi, n_roi))))
+    for i, (idx, label, start_vol, end_vol) in enumerate(trials):
+        fc = fc_windows[i]
+        edge_attr = fc[edge_index[0], edge_index[1]]
+        x = time_series[start_vol:end_vol].mean(axis=0, keepdims=True).T  # [n_roi, 1]
+        y = torch.tensor([label], dtype=torch.float)
+        data = Data(x=torch.tensor(x, dtype=torch.float),
+                    edge_index=torch.tensor(edge_index, dtype=torch.long),
+                    edge_attr=torch.tensor(edge_attr, dtype=torch.float),
+                    y=y)
+        # 自动补全task_type字段
+        data.task_type = torch.tensor([3])  # ds005413: stimulus_class任务
+        graph_save_path = os.path.join(GRAPH_DIR, f'{sub}_{base}_trial{idx}_graph.pt')
+        torch.save(data, graph_save_path)
+        record_timeseries_source(attributes, graph_save_path, ts_save_path, start_vol, end_vol,
+                                 None if pd.isna(run.tr) else run.tr)
+        print(f'Saved: {graph_save_path} (FC row {i} of {fc_save_path})')
+
+attributes.save()
 
 # 统计trial保留率
 print("\n=== Trial 保留统计 ===")
 print(f"总trial数: {total_trials}")
 print(f"保留trial数: {kept_trials}")
-print(f"保留率: {kept_trials/total_trials:.2%}" if total_trials > 0 else "无有效trial") 
\ No newline at end of file
+print(f"保留率: {kept_trials/total_trials:.2%}" if total_trials > 0 else "无有效trial")
@@ -1,6 +1,10 @@
 import os
+import sys
 import shutil
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imports.graph_attributes import GraphAttributeStore
+
 # 源目录列表
 source_dirs = [
     'data/pain_data/ds000140/graphs',
@@ -10,12 +14,15 @@ source_dirs = [
 # 目标目录
 target_dir = 'data/pain_data/all_graphs'
 os.makedirs(target_dir, exist_ok=True)
+# 合并各数据集graph_attributes.json中的行 (如ts_file等节点特征来源)
+target_attributes = GraphAttributeStore(target_dir)
 
 count = 0
 for src in source_dirs:
     if not os.path.exists(src):
         print(f"Source dir not found: {src}")
         continue
+    src_attributes = GraphAttributeStore.open_if_exists(src)
     for fname in os.listdir(src):
         if fname.endswith('.pt'):
             src_path = os.path.join(src, fname)
@@ -24,7 +31,13 @@ for src in source_dirs:
                 print(f"Skip existing: {dst_path}")
                 continue
             shutil.copy2(src_path, dst_path)
+            # 属性行只随实际复制的文件写入，重名跳过时保留原文件自己的时序来源等字段
+            if src_attributes is not None and fname in src_attributes.rows:
+                for name, value in src_attributes.rows[fname].items():
+                    if name != '_migrations':
+                        target_attributes.set_column(name, {fname: value}, attach=name in src_attributes.attached)
             count += 1
             if count % 1000 == 0:
                 print(f"Copied {count} files...")
+target_attributes.save()
 print(f"合并完成，共复制 {count} 个 .pt 文件到 {target_dir}") 
\ No newline at end of file
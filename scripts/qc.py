@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+数据质量检查 (QC) 工具
+Scan ABIDE .h5 raws, .npy FC files and .pt graphs with a process pool and
+write a QC table (qc_table.csv) that the datasets use to exclude / repair samples
+
+Usage:
+    python scripts/qc.py ./data/ABIDE_pcp/cpac/filt_noglobal/raw
+    python scripts/qc.py ./data/pain_data/all_graphs --workers 8
+    python scripts/qc.py a.npy b.npy --out ./results/qc_table.csv
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imports.data_qc import QC_TABLE_NAME, list_qc_files, run_qc, write_qc_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming data-quality scan of connectivity matrices and graph files')
+    parser.add_argument('paths', nargs='+', help='Files or directories (.h5 / .npy / .pt)')
+    parser.add_argument('--out', type=str, default=None,
+                        help=f'QC table path (default: <dir>/{QC_TABLE_NAME} of the first directory)')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    files = list_qc_files(args.paths)
+    if not files:
+        print("❌ No .h5 / .npy / .pt files found")
+        return
+
+    out = args.out
+    if out is None:
+        directory = next((p for p in args.paths if os.path.isdir(p)), os.path.dirname(files[0]))
+        out = os.path.join(directory, QC_TABLE_NAME)
+
+    print(f"🔍 Scanning {len(files)} files...")
+    start = time.time()
+    rows = run_qc(files, num_workers=args.workers)
+    write_qc_table(rows, out)
+
+    counts = Counter(row['status'] for row in rows)
+    print(f"✅ QC finished in {time.time() - start:.1f}s: "
+          f"{counts['ok']} ok, {counts['repair']} repair, {counts['exclude']} exclude")
+    for row in rows:
+        if row['status'] == 'exclude':
+            print(f"   ⚠️ exclude {row['file']} {row['error']}")
+    print(f"📁 QC table: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -191,7 +191,6 @@ def main():
     print("📂 加载数据...")
     dataset = ABIDEDataset(args.data_path, 'ABIDE')
     dataset.data.y = dataset.data.y.squeeze()
-    dataset.data.x[dataset.data.x == float('inf')] = 0
     
     # 获取数据分割
     tr_index, val_index, te_index = train_val_test_split(fold=0)
@@ -1,15 +1,17 @@
 import os
 import numpy as np
 import torch
-import torch.nn.functional as F
 from torch.optim import lr_scheduler
 from tensorboardX import SummaryWriter
 from imports.ABIDEDataset import ABIDEDataset
 from torch_geometric.data import DataLoader
 from net.braingnn import Network
+from imports.trainer import Trainer, forward_network
+from imports.checkpoints import CheckpointManager
+from imports.precision import PRECISIONS, describe
+from imports.edge_precompute import PrecomputeEdgeNorm
 import random
 import argparse
-import copy
 
 def set_seed(seed=42):
     random.seed(seed)
@@ -40,14 +42,20 @@ parser.add_argument('--dim2', type=int, default=16)
 parser.add_argument('--nclass', type=int, default=2)
 parser.add_argument('--ratio', type=float, default=0.5)
 parser.add_argument('--save_model', type=bool, default=True)
+parser.add_argument('--eval_every', type=int, default=1)
+parser.add_argument('--resume', action='store_true')
+parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS)
+parser.add_argument('--precompute_edges', action='store_true')
+parser.add_argument('--checkpoint_blocks', action='store_true', help='recompute conv/pool blocks in backward')
+parser.add_argument('--message_budget_mb', type=float, default=None, help='edge-chunked messages (with --no_fused)')
+parser.add_argument('--no_fused', action='store_true', help='generic message passing instead of the fused CSR op')
 opt = parser.parse_args()
 
 if not os.path.exists(opt.save_path):
     os.makedirs(opt.save_path)
 
-dataset = ABIDEDataset(opt.dataroot, 'ABIDE')
+dataset = ABIDEDataset(opt.dataroot, 'ABIDE', pre_transform=PrecomputeEdgeNorm() if opt.precompute_edges else None)
 dataset.data.y = dataset.data.y.squeeze()
-dataset.data.x[dataset.data.x == float('inf')] = 0
 
 subjects = np.unique(dataset.subject_list)
 np.random.shuffle(subjects)
@@ -74,48 +82,19 @@ train_loader = DataLoader(train_dataset, batch_size=opt.batchSize, shuffle=True)
 val_loader = DataLoader(val_dataset, batch_size=opt.batchSize, shuffle=False)
 test_loader = DataLoader(test_dataset, batch_size=opt.batchSize, shuffle=False)
 
-model = Network(opt.indim, opt.ratio, opt.nclass, k=opt.k, R=opt.nroi).to(device)
+model = Network(opt.indim, opt.ratio, opt.nclass, k=opt.k, R=opt.nroi, checkpoint_blocks=opt.checkpoint_blocks,
+                fused=not opt.no_fused, message_budget_mb=opt.message_budget_mb).to(device)
 optimizer = torch.optim.Adam(model.parameters(), lr=opt.lr, weight_decay=opt.weightdecay)
 scheduler = lr_scheduler.StepLR(optimizer, step_size=opt.stepsize, gamma=opt.gamma)
 writer = SummaryWriter(os.path.join('./log_paper_aligned'))
 
-def train(epoch):
-    model.train()
-    scheduler.step()
-    loss_all = 0
-    for data in train_loader:
-        data = data.to(device)
-        optimizer.zero_grad()
-        output, w1, w2, s1, s2 = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)
-        loss = F.nll_loss(output, data.y)
-        loss.backward()
-        optimizer.step()
-        loss_all += loss.item() * data.num_graphs
-    return loss_all / len(train_dataset)
+print(f"Precision: {describe(device, opt.precision)}")
+trainer = Trainer(model, optimizer, scheduler, device=device, forward=forward_network, precision=opt.precision)
+checkpoints = CheckpointManager(os.path.join(opt.save_path, 'checkpoints'), metadata=vars(opt),
+                                weights_path=os.path.join(opt.save_path, 'best_model.pth') if opt.save_model else None)
+trainer.fit(train_loader, val_loader, epochs=opt.n_epochs, eval_every=opt.eval_every, monitor='val_acc',
+            checkpoint=checkpoints, resume=opt.resume)
 
-def test_acc(loader):
-    model.eval()
-    correct = 0
-    for data in loader:
-        data = data.to(device)
-        outputs = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)
-        pred = outputs[0].max(dim=1)[1]
-        correct += pred.eq(data.y).sum().item()
-    return correct / len(loader.dataset)
-
-best_model_wts = copy.deepcopy(model.state_dict())
-best_acc = 0
-for epoch in range(opt.n_epochs):
-    tr_loss = train(epoch)
-    tr_acc = test_acc(train_loader)
-    val_acc = test_acc(val_loader)
-    print(f"Epoch {epoch:03d} | Train Loss: {tr_loss:.4f} | Train Acc: {tr_acc:.4f} | Val Acc: {val_acc:.4f}")
-    if val_acc > best_acc:
-        best_acc = val_acc
-        best_model_wts = copy.deepcopy(model.state_dict())
-        if opt.save_model:
-            torch.save(best_model_wts, os.path.join(opt.save_path, 'best_model.pth'))
-
-model.load_state_dict(best_model_wts)
-test_accu = test_acc(test_loader)
-print(f"Test Accuracy: {test_accu:.4f}") 
\ No newline at end of file
+trainer.restore_best()
+test_accu = trainer.evaluate(test_loader)['acc']
+print(f"Test Accuracy: {test_accu:.4f}")
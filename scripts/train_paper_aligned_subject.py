@@ -1,14 +1,14 @@
 import os
 import numpy as np
 import torch
-import torch.nn.functional as F
 from torch.optim import lr_scheduler
 from torch_geometric.data import DataLoader, Data
 from net.braingnn import Network
+from imports.trainer import Trainer, forward_network
+from imports.checkpoints import CheckpointManager
 from imports.read_abide_stats_parall import read_sigle_data
 import random
 import argparse
-import copy
 
 def set_seed(seed=42):
     random.seed(seed)
@@ -39,6 +39,8 @@ parser.add_argument('--dim2', type=int, default=16)
 parser.add_argument('--nclass', type=int, default=2)
 parser.add_argument('--ratio', type=float, default=0.5)
 parser.add_argument('--save_model', type=bool, default=True)
+parser.add_argument('--eval_every', type=int, default=1)
+parser.add_argument('--resume', action='store_true')
 opt = parser.parse_args()
 
 if not os.path.exists(opt.save_path):
@@ -87,46 +89,15 @@ model = Network(indim, opt.ratio, opt.nclass, k=opt.k, R=nroi).to(device)
 optimizer = torch.optim.Adam(model.parameters(), lr=opt.lr, weight_decay=opt.weightdecay)
 scheduler = lr_scheduler.StepLR(optimizer, step_size=opt.stepsize, gamma=opt.gamma)
 
-def train(epoch):
-    model.train()
-    scheduler.step()
-    loss_all = 0
-    for data in train_loader:
-        data = data.to(device)
-        optimizer.zero_grad()
-        output, w1, w2, s1, s2 = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)
-        loss = F.nll_loss(output, data.y)
-        loss.backward()
-        optimizer.step()
-        loss_all += loss.item() * data.num_graphs
-    return loss_all / len(train_data)
-
-def test_acc(loader):
-    model.eval()
-    correct = 0
-    for data in loader:
-        data = data.to(device)
-        outputs = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)
-        pred = outputs[0].max(dim=1)[1]
-        correct += pred.eq(data.y).sum().item()
-    return correct / len(loader.dataset)
-
-best_model_wts = copy.deepcopy(model.state_dict())
-best_acc = 0
-for epoch in range(opt.n_epochs):
-    tr_loss = train(epoch)
-    tr_acc = test_acc(train_loader)
-    val_acc = test_acc(val_loader)
-    print(f"Epoch {epoch:03d} | Train Loss: {tr_loss:.4f} | Train Acc: {tr_acc:.4f} | Val Acc: {val_acc:.4f}")
-    if val_acc > best_acc:
-        best_acc = val_acc
-        best_model_wts = copy.deepcopy(model.state_dict())
-        if opt.save_model:
-            torch.save(best_model_wts, os.path.join(opt.save_path, 'best_model.pth'))
-
-model.load_state_dict(best_model_wts)
-test_accu = test_acc(test_loader)
-print(f"Test Accuracy: {test_accu:.4f}") 
+trainer = Trainer(model, optimizer, scheduler, device=device, forward=forward_network)
+checkpoints = CheckpointManager(os.path.join(opt.save_path, 'checkpoints'), metadata=vars(opt),
+                                weights_path=os.path.join(opt.save_path, 'best_model.pth') if opt.save_model else None)
+trainer.fit(train_loader, val_loader, epochs=opt.n_epochs, eval_every=opt.eval_every, monitor='val_acc',
+            checkpoint=checkpoints, resume=opt.resume)
+
+trainer.restore_best()
+test_accu = trainer.evaluate(test_loader)['acc']
+print(f"Test Accuracy: {test_accu:.4f}")
 
 # === 自动化后处理：提取重要性分数与可视化 ===
 import os
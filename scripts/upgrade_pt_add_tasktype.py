@@ -1,5 +1,8 @@
 import os
-import torch
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imports.graph_attributes import GraphAttributeStore, Migration
 
 # 任务定义（可根据需要修改）
 TASK_MAP = {
@@ -28,23 +31,19 @@ def infer_task_type_and_dataset(filename):
     return -1, 'unknown'
 
 
+def add_task_type_and_dataset(fname, row):
+    # 已有task_type则跳过
+    if 'task_type' in row and 'dataset' in row:
+        return {}
+    task_type, dataset = infer_task_type_and_dataset(fname)
+    return {'task_type': task_type, 'dataset': dataset}
+
+
 def upgrade_all_pt_files(root_dir):
-    for fname in os.listdir(root_dir):
-        if not fname.endswith('.pt'):
-            continue
-        fpath = os.path.join(root_dir, fname)
-        try:
-            data = torch.load(fpath)
-            # 已有task_type则跳过
-            if hasattr(data, 'task_type') and hasattr(data, 'dataset'):
-                continue
-            task_type, dataset = infer_task_type_and_dataset(fname)
-            data.task_type = torch.tensor([task_type])
-            data.dataset = dataset
-            torch.save(data, fpath)
-            print(f'Upgraded {fname}: task_type={task_type}, dataset={dataset}')
-        except Exception as e:
-            print(f'Error processing {fname}: {e}')
+    # 只更新sidecar属性表，不重写.pt文件；加载时由PainGraphDataset合并到Data
+    store = GraphAttributeStore(root_dir)
+    store.migrate([Migration('task_type_and_dataset_from_filename', add_task_type_and_dataset)])
+    print(f'Upgraded {len(store.column("task_type"))} files (schema_version={store.schema_version})')
 
 if __name__ == '__main__':
-    upgrade_all_pt_files('/workspace/data/pain_data/all_graphs') 
\ No newline at end of file
+    upgrade_all_pt_files('/workspace/data/pain_data/all_graphs') 
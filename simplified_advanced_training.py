@@ -20,13 +20,17 @@ import warnings
 warnings.filterwarnings('ignore')
 
 from imports.PainGraphDataset import PainGraphDataset
+from imports.trainer import Trainer, EnsembleTrainer, LossTerm, forward_multitask, weighted_nll_loss
 from intelligent_optimization import ImprovedBrainGNN
+from net.stacked_ensemble import cache_batches, predict_ensemble
 
 class OptimizedTrainer:
     """优化训练器"""
     
     def __init__(self):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        # 每次运行的成员检查点单独存放，不会覆盖之前的集成
+        self.run_dir = os.path.join('./model/ensemble_runs', datetime.now().strftime('%Y%m%d_%H%M%S'))
         print(f"🔧 使用设备: {self.device}")
     
     def load_and_preprocess_data(self):
@@ -83,11 +87,11 @@ class OptimizedTrainer:
         
         return processed_data, class_weights
     
-    def create_ensemble_models(self, n_models=5):
-        """创建集成模型"""
+    def create_ensemble_models(self, n_models=5, configs=None):
+        """创建集成模型 (configs中相同配置的成员可以批量训练，见train_ensemble)"""
         models = []
         
-        configs = [
+        configs = configs or [
             {'hidden_dim': 128, 'dropout': 0.4},
             {'hidden_dim': 96, 'dropout': 0.35},
             {'hidden_dim': 160, 'dropout': 0.45},
@@ -109,10 +113,11 @@ class OptimizedTrainer:
         print(f"🤖 创建 {n_models} 个集成模型")
         return models
     
-    def train_single_model(self, model, train_loader, val_loader, class_weights, model_id=0):
-        """训练单个模型"""
-        print(f"🚀 开始训练模型 {model_id+1}...")
-        
+    def member_path(self, model_id):
+        return os.path.join(self.run_dir, f'ensemble_model_{model_id}.pth')
+    
+    def member_trainer(self, model, class_weights, model_id=0):
+        """单个成员的训练器：优化器、调度器、损失和早停各自独立"""
         # 优化器配置
         optimizer = torch.optim.AdamW(
             model.parameters(),
@@ -126,121 +131,49 @@ class OptimizedTrainer:
             optimizer, T_0=15, T_mult=2, eta_min=1e-6
         )
         
-        best_val_f1 = 0
-        patience_counter = 0
-        max_epochs = 150
+        # 加权损失 + 标签平滑
+        loss_terms = [LossTerm('nll', weighted_nll_loss(class_weights), 0.9),
+                      LossTerm('smooth', lambda out, data, extras, model: -out.mean(), 0.1)]
         
-        for epoch in range(max_epochs):
-            # 训练阶段
-            model.train()
-            total_loss = 0
-            all_preds = []
-            all_labels = []
-            
-            for data in train_loader:
-                data = data.to(self.device)
-                optimizer.zero_grad()
-                
-                # 数据增强
-                if torch.rand(1) < 0.2:
-                    noise = torch.randn_like(data.x) * 0.01
-                    data.x = data.x + noise
-                
-                out, _ = model(data)
-                
-                # 加权损失
-                if class_weights is not None:
-                    weights = class_weights[data.y]
-                    loss = F.nll_loss(out, data.y, reduction='none')
-                    loss = (loss * weights).mean()
-                else:
-                    loss = F.nll_loss(out, data.y)
-                
-                # 标签平滑
-                smoothed_loss = loss * 0.9 + 0.1 * (-out.mean())
-                
-                smoothed_loss.backward()
-                torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-                optimizer.step()
-                
-                total_loss += smoothed_loss.item()
-                pred = out.argmax(dim=1)
-                all_preds.extend(pred.cpu().numpy())
-                all_labels.extend(data.y.cpu().numpy())
-            
-            train_f1 = f1_score(all_labels, all_preds, average='weighted')
-            train_acc = accuracy_score(all_labels, all_preds)
-            
-            # 验证阶段
-            model.eval()
-            val_preds = []
-            val_labels = []
-            val_probs = []
-            
-            with torch.no_grad():
-                for data in val_loader:
-                    data = data.to(self.device)
-                    out, _ = model(data)
-                    pred = out.argmax(dim=1)
-                    prob = F.softmax(out, dim=1)
-                    
-                    val_preds.extend(pred.cpu().numpy())
-                    val_labels.extend(data.y.cpu().numpy())
-                    val_probs.extend(prob.cpu().numpy())
-            
-            val_f1 = f1_score(val_labels, val_preds, average='weighted')
-            val_acc = accuracy_score(val_labels, val_preds)
-            
-            scheduler.step()
-            
-            if epoch % 10 == 0:
-                print(f'  Epoch {epoch:3d}: Train F1: {train_f1:.4f}, Val F1: {val_f1:.4f}, Val Acc: {val_acc:.4f}')
-            
-            # 早停
-            if val_f1 > best_val_f1:
-                best_val_f1 = val_f1
-                patience_counter = 0
-                torch.save(model.state_dict(), f'./model/ensemble_model_{model_id}.pth')
-            else:
-                patience_counter += 1
-                if patience_counter >= 30:
-                    print(f"  ⏹️ 模型 {model_id+1} 早停，最佳验证F1: {best_val_f1:.4f}")
-                    break
-        
-        return best_val_f1
+        return Trainer(model, optimizer, scheduler, device=self.device, forward=forward_multitask,
+                       loss_terms=loss_terms, grad_clip=1.0, log_every=10, name=f'模型 {model_id+1}')
+    
+    def train_ensemble(self, models, train_loader, val_loader, class_weights):
+        """同时训练全部集成成员 (imports.trainer.EnsembleTrainer)，每个batch只加载和增强一次
+
+        相同架构的成员在一次前向/反向中批量计算 (net.stacked_ensemble)；每个成员有自己的
+        优化器、调度器和早停，最佳权重在后台线程写入member_path。
+        """
+        print(f"🚀 同时训练 {len(models)} 个模型...")
+        
+        # 数据增强
+        def augment(data):
+            if torch.rand(1) < 0.2:
+                data.x = data.x + torch.randn_like(data.x) * 0.01
+            return data
+        
+        trainers = [self.member_trainer(model, class_weights, i) for i, model in enumerate(models)]
+        # 早停
+        EnsembleTrainer(trainers, augment=augment).fit(
+            train_loader, val_loader, epochs=150, monitor='val_f1', patience=30,
+            checkpoints=[self.member_path(i) for i in range(len(models))])
+        
+        for i, trainer in enumerate(trainers):
+            print(f"  ⏹️ 模型 {i+1} 训练结束，最佳验证F1: {trainer.best_score:.4f}")
+        return [trainer.best_score for trainer in trainers]
     
     def ensemble_predict(self, models, test_loader):
-        """集成预测"""
+        """集成预测：一次加载全部成员，每个batch只整理一次并由所有成员评估
+
+        返回 (准确率, F1, AUC, 标签, 集成预测, 平均概率 [N, C], 各成员概率 [M, N, C])
+        """
         print("🔮 执行集成预测...")
         
-        all_predictions = []
-        test_labels = []
-        
-        # 收集所有模型的预测
         for model_id, model in enumerate(models):
-            model.load_state_dict(torch.load(f'./model/ensemble_model_{model_id}.pth'))
-            model.eval()
-            
-            model_preds = []
-            model_probs = []
-            
-            with torch.no_grad():
-                for data in test_loader:
-                    data = data.to(self.device)
-                    out, _ = model(data)
-                    pred = out.argmax(dim=1)
-                    prob = F.softmax(out, dim=1)
-                    
-                    model_preds.extend(pred.cpu().numpy())
-                    model_probs.extend(prob.cpu().numpy())
-                    
-                    if model_id == 0:  # 只需要收集一次标签
-                        test_labels.extend(data.y.cpu().numpy())
-            
-            all_predictions.append(np.array(model_probs))
+            model.load_state_dict(torch.load(self.member_path(model_id)))
         
         # 平均概率预测
-        avg_probs = np.mean(all_predictions, axis=0)
+        avg_probs, member_probs, test_labels = predict_ensemble(models, cache_batches(test_loader, self.device))
         ensemble_preds = np.argmax(avg_probs, axis=1)
         
         # 计算性能指标
@@ -252,9 +185,9 @@ class OptimizedTrainer:
         except:
             ensemble_auc = 0.5
         
-        return ensemble_acc, ensemble_f1, ensemble_auc, test_labels, ensemble_preds
+        return ensemble_acc, ensemble_f1, ensemble_auc, test_labels, ensemble_preds, avg_probs, member_probs
     
-    def run_advanced_training(self):
+    def run_advanced_training(self, configs=None):
         """运行高级训练流程"""
         print("🎯 开始高级训练流程，目标: 80%准确率")
         
@@ -280,18 +213,17 @@ class OptimizedTrainer:
         print(f"📊 数据划分 - 训练: {len(train_dataset)}, 验证: {len(val_dataset)}, 测试: {len(test_dataset)}")
         
         # 3. 创建和训练集成模型
-        models = self.create_ensemble_models(n_models=5)
-        
-        val_f1_scores = []
-        for i, model in enumerate(models):
-            val_f1 = self.train_single_model(model, train_loader, val_loader, class_weights, i)
-            val_f1_scores.append(val_f1)
+        models = self.create_ensemble_models(n_models=5, configs=configs)
+        val_f1_scores = self.train_ensemble(models, train_loader, val_loader, class_weights)
         
         print(f"✅ 所有模型训练完成，验证F1分数: {val_f1_scores}")
         print(f"✅ 平均验证F1: {np.mean(val_f1_scores):.4f}")
         
         # 4. 集成预测
-        ensemble_acc, ensemble_f1, ensemble_auc, test_labels, ensemble_preds = self.ensemble_predict(models, test_loader)
+        ensemble_acc, ensemble_f1, ensemble_auc, test_labels, ensemble_preds, avg_probs, member_probs = \
+            self.ensemble_predict(models, test_loader)
+        np.savez('./model/ensemble_test_probs.npz', labels=test_labels, avg_probs=avg_probs,
+                 member_probs=member_probs)
         
         # 5. 结果报告
         print("\n" + "="*60)
@@ -322,6 +254,8 @@ class OptimizedTrainer:
             json.dump(results, f, indent=2)
         
         print(f"\\n📁 结果已保存: ./model/advanced_training_results.json")
+        print(f"📁 测试集概率 (平均 / 各成员) 已保存: ./model/ensemble_test_probs.npz")
+        print(f"📁 成员模型: {self.run_dir}")
         
         if ensemble_acc < 0.8:
             print("\\n💡 改进建议:")
@@ -333,15 +267,23 @@ class OptimizedTrainer:
         
         return ensemble_acc
 
-def main():
+def main(same_architecture=False):
     """主函数"""
     print("🚀 启动BrainGNN高级训练系统")
     print("🎯 目标: 达到80%以上准确率")
     
+    # 相同架构的成员 (仅初始化不同) 可以批量训练
+    configs = [{'hidden_dim': 128, 'dropout': 0.4}] if same_architecture else None
     trainer = OptimizedTrainer()
-    accuracy = trainer.run_advanced_training()
+    accuracy = trainer.run_advanced_training(configs)
     
     print(f"\\n✨ 最终准确率: {accuracy:.1%}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='BrainGNN集成训练')
+    parser.add_argument('--same_architecture', action='store_true',
+                        help='全部成员使用相同架构 (hidden_dim=128, dropout=0.4)，批量训练')
+    args = parser.parse_args()
+    
+    main(args.same_architecture)
\ No newline at end of file
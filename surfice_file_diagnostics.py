@@ -12,6 +12,8 @@ from pathlib import Path
 import struct
 import gzip
 
+from imports.mesh_io import grid_faces, read_mz3, write_ply, write_obj, write_stl
+
 def check_mz3_file():
     """检查和修复MZ3文件"""
     
@@ -26,16 +28,16 @@ def check_mz3_file():
     file_size = os.path.getsize(mz3_path)
     print(f"📁 MZ3文件大小: {file_size / 1024 / 1024:.2f} MB")
     
-    # 检查文件头
+    # 解析文件头和网格数据
     try:
-        with open(mz3_path, 'rb') as f:
-            header = f.read(16)
-            print(f"📋 文件头: {header[:8]}")
-            
-            # MZ3文件应该以特定格式开头
-            if len(header) < 8:
-                print("❌ MZ3文件头太短")
-                return False
+        mesh = read_mz3(mz3_path)
+        n_vertices = 0 if mesh.vertices is None else len(mesh.vertices)
+        n_faces = 0 if mesh.faces is None else len(mesh.faces)
+        print(f"📋 顶点数量: {n_vertices}, 面数量: {n_faces}")
+        
+        if n_vertices == 0:
+            print("❌ MZ3文件没有顶点数据")
+            return False
                 
         print("✅ MZ3文件基本结构正常")
         return True
@@ -67,67 +69,44 @@ def create_alternative_brain_formats():
     
     print("✅ 多种格式大脑模板创建完成")
 
+def brain_ellipsoid_vertices(n_phi, n_theta):
+    """椭球大脑网格顶点 [n_phi * n_theta, 3] (phi 行优先)"""
+    
+    phi = np.linspace(0, np.pi, n_phi)
+    theta = np.linspace(0, 2*np.pi, n_theta)
+    p, t = np.meshgrid(phi, theta, indexing='ij')
+    
+    # 大脑椭球参数
+    a, b, c = 75, 90, 65
+    
+    x = (a * np.sin(p) * np.cos(t)).ravel()
+    y = (b * np.sin(p) * np.sin(t)).ravel()
+    z = (c * np.cos(p)).ravel()
+    
+    # 大脑形状修正
+    frontal = y > 50  # 前额叶
+    y[frontal] *= 1.2
+    z[frontal] *= 0.85
+    temporal = (np.abs(x) > 55) & (z < 25)  # 颞叶
+    z[temporal] -= 25
+    x[temporal] *= 1.15
+    occipital = y < -70  # 枕叶
+    y[occipital] *= 1.1
+    
+    return np.stack([x, y, z], axis=1)
+
 def create_simple_ply_brain():
-    """创建简化的PLY格式大脑"""
+    """创建简化的PLY格式大脑 (二进制PLY)"""
     
     print("📐 创建PLY格式大脑...")
     
-    # 生成大脑形状的顶点
-    phi = np.linspace(0, np.pi, 30)
-    theta = np.linspace(0, 2*np.pi, 60)
-    
-    vertices = []
-    faces = []
-    
-    for i, p in enumerate(phi):
-        for j, t in enumerate(theta):
-            # 大脑椭球参数
-            a, b, c = 75, 90, 65
-            
-            x = a * np.sin(p) * np.cos(t)
-            y = b * np.sin(p) * np.sin(t)  
-            z = c * np.cos(p)
-            
-            # 大脑形状修正
-            if y > 50:  # 前额叶
-                y *= 1.2
-                z *= 0.85
-            if abs(x) > 55 and z < 25:  # 颞叶
-                z -= 25
-                x *= 1.15
-            if y < -70:  # 枕叶
-                y *= 1.1
-            
-            vertices.append([x, y, z])
-            
-            # 创建面
-            if i < len(phi)-1 and j < len(theta)-1:
-                v1 = i * len(theta) + j
-                v2 = i * len(theta) + (j + 1) % len(theta)
-                v3 = (i + 1) * len(theta) + j
-                v4 = (i + 1) * len(theta) + (j + 1) % len(theta)
-                
-                faces.append([3, v1, v2, v3])
-                faces.append([3, v2, v4, v3])
+    # 生成大脑形状的顶点和面
+    vertices = brain_ellipsoid_vertices(30, 60)
+    faces = grid_faces(30, 60)
     
     # 写入PLY文件
     ply_path = "./figures/surfice_templates/brain_fixed.ply"
-    with open(ply_path, 'w') as f:
-        f.write("ply\n")
-        f.write("format ascii 1.0\n")
-        f.write(f"element vertex {len(vertices)}\n")
-        f.write("property float x\n")
-        f.write("property float y\n") 
-        f.write("property float z\n")
-        f.write(f"element face {len(faces)}\n")
-        f.write("property list uchar int vertex_indices\n")
-        f.write("end_header\n")
-        
-        for v in vertices:
-            f.write(f"{v[0]:.6f} {v[1]:.6f} {v[2]:.6f}\n")
-            
-        for face in faces:
-            f.write(f"{face[0]} {face[1]} {face[2]} {face[3]}\n")
+    write_ply(ply_path, vertices, faces)
     
     print(f"✅ PLY大脑创建: {ply_path}")
 
@@ -137,117 +116,28 @@ def create_obj_brain():
     print("📐 创建OBJ格式大脑...")
     
     # 使用相同的大脑几何
-    phi = np.linspace(0, np.pi, 25)
-    theta = np.linspace(0, 2*np.pi, 50)
+    vertices = brain_ellipsoid_vertices(25, 50)
+    faces = grid_faces(25, 50)
     
     obj_path = "./figures/surfice_templates/brain.obj"
-    with open(obj_path, 'w') as f:
-        f.write("# Brain mesh for SurfIce\n")
-        f.write("# Generated by BrainGNN\n\n")
-        
-        # 写入顶点
-        for p in phi:
-            for t in theta:
-                a, b, c = 75, 90, 65
-                x = a * np.sin(p) * np.cos(t)
-                y = b * np.sin(p) * np.sin(t)
-                z = c * np.cos(p)
-                
-                # 形状修正
-                if y > 50:
-                    y *= 1.2
-                    z *= 0.85
-                if abs(x) > 55 and z < 25:
-                    z -= 25
-                    x *= 1.15
-                if y < -70:
-                    y *= 1.1
-                
-                f.write(f"v {x:.6f} {y:.6f} {z:.6f}\n")
-        
-        # 写入面
-        for i in range(len(phi)-1):
-            for j in range(len(theta)-1):
-                v1 = i * len(theta) + j + 1
-                v2 = i * len(theta) + (j + 1) % len(theta) + 1
-                v3 = (i + 1) * len(theta) + j + 1
-                v4 = (i + 1) * len(theta) + (j + 1) % len(theta) + 1
-                
-                f.write(f"f {v1} {v2} {v3}\n")
-                f.write(f"f {v2} {v4} {v3}\n")
+    write_obj(obj_path, vertices, faces,
+              comments=["Brain mesh for SurfIce", "Generated by BrainGNN"])
     
     print(f"✅ OBJ大脑创建: {obj_path}")
 
 def create_stl_brain():
-    """创建STL格式大脑"""
+    """创建STL格式大脑 (二进制STL)"""
     
     print("📐 创建STL格式大脑...")
     
     stl_path = "./figures/surfice_templates/brain.stl"
     
-    # 生成简化的大脑三角网格
-    phi = np.linspace(0, np.pi, 20)
-    theta = np.linspace(0, 2*np.pi, 40)
-    
-    triangles = []
-    
-    for i in range(len(phi)-1):
-        for j in range(len(theta)):
-            # 计算四个角点
-            p1, t1 = phi[i], theta[j]
-            p2, t2 = phi[i], theta[(j+1)%len(theta)]
-            p3, t3 = phi[i+1], theta[j]
-            p4, t4 = phi[i+1], theta[(j+1)%len(theta)]
-            
-            # 转换为笛卡尔坐标
-            def sphere_to_cart(p, t):
-                a, b, c = 75, 90, 65
-                x = a * np.sin(p) * np.cos(t)
-                y = b * np.sin(p) * np.sin(t)
-                z = c * np.cos(p)
-                
-                # 大脑形状修正
-                if y > 50:
-                    y *= 1.2
-                    z *= 0.85
-                if abs(x) > 55 and z < 25:
-                    z -= 25
-                    x *= 1.15
-                if y < -70:
-                    y *= 1.1
-                    
-                return [x, y, z]
-            
-            v1 = sphere_to_cart(p1, t1)
-            v2 = sphere_to_cart(p2, t2) 
-            v3 = sphere_to_cart(p3, t3)
-            v4 = sphere_to_cart(p4, t4)
-            
-            # 创建两个三角形
-            triangles.append([v1, v2, v3])
-            triangles.append([v2, v4, v3])
+    # 生成简化的大脑三角网格 (theta方向闭合)
+    vertices = brain_ellipsoid_vertices(20, 40)
+    faces = grid_faces(20, 40, wrap=True)
     
-    # 写入STL文件
-    with open(stl_path, 'w') as f:
-        f.write("solid brain\n")
-        
-        for tri in triangles:
-            # 计算法向量
-            v1, v2, v3 = tri
-            edge1 = np.array(v2) - np.array(v1)
-            edge2 = np.array(v3) - np.array(v1)
-            normal = np.cross(edge1, edge2)
-            normal = normal / np.linalg.norm(normal)
-            
-            f.write(f"  facet normal {normal[0]:.6f} {normal[1]:.6f} {normal[2]:.6f}\n")
-            f.write("    outer loop\n")
-            f.write(f"      vertex {v1[0]:.6f} {v1[1]:.6f} {v1[2]:.6f}\n")
-            f.write(f"      vertex {v2[0]:.6f} {v2[1]:.6f} {v2[2]:.6f}\n")
-            f.write(f"      vertex {v3[0]:.6f} {v3[1]:.6f} {v3[2]:.6f}\n")
-            f.write("    endloop\n")
-            f.write("  endfacet\n")
-        
-        f.write("endsolid brain\n")
+    # 写入STL文件 (法向量在write_stl中批量计算)
+    write_stl(stl_path, vertices, faces, header=b"brain")
     
     print(f"✅ STL大脑创建: {stl_path}")
 
@@ -0,0 +1,70 @@
+"""
+QC scanner (imports.data_qc) on real PyG .pt graphs and the QC-table driven PainGraphDataset
+Run with pytest, or directly: python test_data_qc.py
+"""
+
+import os
+import tempfile
+
+import torch
+from torch_geometric.data import Data
+
+from imports.data_qc import scan_file, run_qc, write_qc_table, list_qc_files, QC_TABLE_NAME
+from imports.PainGraphDataset import PainGraphDataset
+
+
+def make_graph(num_regions=6, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    edge_index = torch.combinations(torch.arange(num_regions)).t()
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+    return Data(x=torch.randn(num_regions, num_regions, generator=g), edge_index=edge_index,
+                edge_attr=torch.rand(edge_index.size(1), 1, generator=g), y=torch.tensor([seed % 2]))
+
+
+def write_graphs(root, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(root, f'sub-{i:02d}_graph.pt')
+        torch.save(make_graph(seed=i), path)
+        paths.append(path)
+    return paths
+
+
+def test_scan_valid_graph():
+    with tempfile.TemporaryDirectory() as root:
+        path = write_graphs(root, 1)[0]
+        row = scan_file(path)
+        assert row['status'] == 'ok', row['error']
+        assert row['num_nodes'] == 6 and row['has_y'] and not row['edge_index_out_of_range']
+
+
+def test_scan_flags_repair_and_exclude():
+    with tempfile.TemporaryDirectory() as root:
+        data = make_graph()
+        data.x[0, 1] = float('nan')
+        torch.save(data, os.path.join(root, 'repair.pt'))
+        data = make_graph()
+        data.edge_index[0, 0] = 99
+        torch.save(data, os.path.join(root, 'out_of_range.pt'))
+        rows = {row['file']: row for row in run_qc(list_qc_files([root]), num_workers=1)}
+        assert rows['repair.pt']['status'] == 'repair'
+        assert rows['out_of_range.pt']['status'] == 'exclude'
+
+
+def test_dataset_with_qc_table_keeps_valid_and_new_graphs():
+    """Scanned valid graphs load, and graphs added after the scan are not dropped"""
+    with tempfile.TemporaryDirectory() as root:
+        paths = write_graphs(root, 4)
+        write_qc_table(run_qc(paths, num_workers=1), os.path.join(root, QC_TABLE_NAME))
+        write_graphs(root, 5)
+        dataset = PainGraphDataset(root)
+        assert len(dataset) == 5
+        assert dataset[0].x.shape == (6, 6)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("All data QC tests passed!")
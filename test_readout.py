@@ -0,0 +1,94 @@
+"""
+Equivalence of the shape-aware readout (net.braingnn.readout) with the scatter global pools
+Run with pytest, or directly: python test_readout.py
+"""
+
+import torch
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
+from torch_geometric.nn import global_max_pool, global_mean_pool
+
+from net.braingnn import Network, readout
+
+
+def scatter_readout(x, batch, size=None):
+    return torch.cat([global_max_pool(x, batch, size), global_mean_pool(x, batch, size)], dim=1)
+
+
+def make_batch(num_graphs=6, num_regions=20, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    edge_index = torch.combinations(torch.arange(num_regions)).t()
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+    graphs = []
+    for i in range(num_graphs):
+        x = torch.randn(num_regions, num_regions, generator=g)
+        graphs.append(Data(x=x, edge_index=edge_index, edge_attr=torch.rand(edge_index.size(1), 1, generator=g),
+                           pos=torch.eye(num_regions), y=torch.tensor(i % 2)))
+    return next(iter(DataLoader(graphs, batch_size=num_graphs)))
+
+
+def test_uniform_counts():
+    """Equal node counts in contiguous order take the reshape path"""
+    x = torch.randn(5 * 7, 4)
+    batch = torch.arange(5).repeat_interleave(7)
+    assert torch.allclose(readout(x, batch), scatter_readout(x, batch))
+
+
+def test_ragged_counts_fall_back():
+    x = torch.randn(12, 3)
+    batch = torch.tensor([0, 0, 0, 0, 0, 1, 1, 2, 2, 2, 2, 2])
+    assert torch.allclose(readout(x, batch), scatter_readout(x, batch))
+
+
+def test_divisible_but_unsorted_falls_back():
+    """N divisible by B, but the nodes are not grouped by graph"""
+    x = torch.randn(8, 3)
+    batch = torch.tensor([0, 1, 0, 1, 0, 1, 0, 1])
+    assert torch.allclose(readout(x, batch), scatter_readout(x, batch))
+
+
+def test_explicit_size_with_empty_graph():
+    x = torch.randn(6, 3)
+    batch = torch.tensor([0, 0, 0, 1, 1, 1])
+    assert torch.allclose(readout(x, batch, size=3), scatter_readout(x, batch, size=3))
+
+
+def test_gradients_match():
+    x = torch.randn(4 * 6, 5, requires_grad=True)
+    batch = torch.arange(4).repeat_interleave(6)
+    (readout(x, batch) ** 2).sum().backward()
+    grad, x.grad = x.grad.clone(), None
+    (scatter_readout(x, batch) ** 2).sum().backward()
+    assert torch.allclose(grad, x.grad, atol=1e-6)
+
+
+def test_network_pooled_readout():
+    """After TopKPool every graph keeps ceil(ratio * R) nodes: the Network output matches the scatter readout"""
+    data = make_batch()
+    torch.manual_seed(0)
+    model = Network(20, 0.5, 2, R=20).eval()
+    with torch.no_grad():
+        out = model(data.x, data.edge_index, data.batch, data.edge_attr, data.pos)[0]
+
+        x = model.conv1(data.x, data.edge_index, data.edge_attr, data.pos)
+        x, edge_index, edge_attr, batch, perm, _ = model.pool1(x, data.edge_index, data.edge_attr, data.batch)
+        assert x.size(0) == 6 * 10 and torch.equal(batch, torch.arange(6).repeat_interleave(10))
+        pos = data.pos[perm]
+        readouts = [scatter_readout(x, batch)]
+        x = model.conv2(x, edge_index, edge_attr, pos)
+        x, edge_index, edge_attr, batch, perm, _ = model.pool2(x, edge_index, edge_attr, batch)
+        pos = pos[perm]
+        readouts.append(scatter_readout(x, batch))
+        x = model.conv3(x, edge_index, edge_attr, pos)
+        x, edge_index, edge_attr, batch, perm, _ = model.pool3(x, edge_index, edge_attr, batch)
+        readouts.append(scatter_readout(x, batch))
+        expected = model.classify(sum(readouts))
+    assert torch.allclose(out, expected, atol=1e-6)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("All readout tests passed!")
@@ -0,0 +1,79 @@
+"""
+Training engine (imports.trainer): EnsembleTrainer against Trainer.fit of every member on its own
+Run with pytest, or directly: python test_trainer.py
+"""
+
+import torch
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
+
+from imports.trainer import Trainer, EnsembleTrainer, forward_multitask
+from net.multitask_braingnn import MultiTaskBrainGNN
+
+NUM_REGIONS = 20
+
+
+def make_graphs(count=24, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    edge_index = torch.combinations(torch.arange(NUM_REGIONS)).t()
+    edge_index = torch.cat([edge_index, edge_index.flip(0)], dim=1)
+    return [Data(x=torch.randn(NUM_REGIONS, NUM_REGIONS, generator=g), edge_index=edge_index,
+                 edge_attr=torch.rand(edge_index.size(1), 1, generator=g), pos=torch.eye(NUM_REGIONS),
+                 y=torch.tensor(i % 2)) for i in range(count)]
+
+
+def make_trainer(seed, name=None):
+    torch.manual_seed(seed)
+    model = MultiTaskBrainGNN(NUM_REGIONS, 16, NUM_REGIONS).eval()
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.01)
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=2)
+    return Trainer(model, optimizer, scheduler, forward=forward_multitask, grad_clip=1.0,
+                   log_every=100, name=name)
+
+
+def make_loaders():
+    graphs = make_graphs()
+    return DataLoader(graphs[:16], batch_size=8), DataLoader(graphs[16:], batch_size=8)
+
+
+def strip(history):
+    return [{k: v for k, v in record.items() if k != 'train_graphs_per_s'} for record in history]
+
+
+def test_single_member_matches_trainer():
+    """A one-member ensemble runs the plain member forward and records the same history as Trainer.fit"""
+    train_loader, val_loader = make_loaders()
+    kwargs = dict(epochs=4, eval_every=2, monitor='val_loss', patience=5)
+
+    torch.manual_seed(1)
+    expected = make_trainer(0).fit(train_loader, val_loader, **kwargs)
+    torch.manual_seed(1)
+    (history,) = EnsembleTrainer([make_trainer(0)]).fit(train_loader, val_loader, **kwargs)
+
+    assert [r['epoch'] for r in history] == [1, 2, 3, 4]
+    assert ['val_loss' in r for r in history] == [False, True, False, True]
+    for got, want in zip(strip(history), strip(expected)):
+        assert got.keys() == want.keys()
+        for key, value in want.items():
+            assert abs(got[key] - value) < 1e-5 if isinstance(value, float) else got[key] == value, key
+    assert history[0]['train_graphs_per_s'] > 0
+
+
+def test_stacked_members_stop_independently():
+    """Stacked members keep their own early stopping; a stopped member leaves the later passes"""
+    train_loader, val_loader = make_loaders()
+    trainers = [make_trainer(seed, f'member {seed}') for seed in range(2)]
+    trainers[0].best_score = float('-inf')  # member 0 never improves on val_loss (minimised)
+    histories = EnsembleTrainer(trainers).fit(train_loader, val_loader, epochs=5, monitor='val_loss', patience=2)
+
+    assert len(histories[0]) == 2 and trainers[0].stopped
+    assert len(histories[1]) == 5
+    assert trainers[1].best_state is not None
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("All trainer tests passed!")
@@ -9,46 +9,13 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import json
 
+from imports.mesh_io import read_vtk
+
 def read_vtk_points(vtk_file):
-    """Read points and scalars from VTK file"""
-    
-    points = []
-    scalars = {}
-    current_scalar = None
+    """Read points and scalars from VTK file (BINARY or ASCII legacy format)"""
     
-    with open(vtk_file, 'r') as f:
-        lines = f.readlines()
-        
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Find POINTS section
-            if line.startswith('POINTS'):
-                num_points = int(line.split()[1])
-                i += 1
-                for j in range(num_points):
-                    coords = lines[i + j].strip().split()
-                    points.append([float(x) for x in coords])
-                i += num_points
-                
-            # Find SCALARS sections
-            elif line.startswith('SCALARS'):
-                scalar_name = line.split()[1]
-                scalars[scalar_name] = []
-                current_scalar = scalar_name
-                i += 2  # Skip LOOKUP_TABLE line
-                
-            elif current_scalar and line and not line.startswith('SCALARS') and not line.startswith('LOOKUP_TABLE'):
-                try:
-                    if line.strip():  # Skip empty lines
-                        scalars[current_scalar].append(float(line.strip()))
-                except:
-                    pass
-                    
-            i += 1
-    
-    return np.array(points), scalars
+    mesh = read_vtk(vtk_file)
+    return np.asarray(mesh.vertices), mesh.scalars
 
 def create_3d_brain_visualization():
     """Create 3D brain visualization from VTK data"""